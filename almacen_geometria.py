@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import glob
+import shutil
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from partes import explotar, solo_lineas
+
+# Almacén binario de geometrías de calles para corridas repetidas.
+# Un directorio con arreglos planos que se abren con numpy.memmap, sin parsear nada:
+#   link_id.i8  -> link_id ordenado (int64, n)
+#   partes.i8   -> primera parte de cada link en offsets (int64, n + 1); un LineString es
+#                  una parte, un MultiLineString varias
+#   offsets.i8  -> inicio de cada parte en coords (int64, n_partes + 1)
+#   coords.f8   -> coordenadas planas (float64, n_coords x dims)
+#   bbox.f8     -> límites precalculados (float64, n x 4: minx, miny, maxx, maxy); con ellos
+#                  se eligen los links de una zona sin construir sus geometrías
+#   meta.json   -> tamaños, dimensiones y CRS
+# Como las páginas del memmap vienen del caché del sistema operativo, varios validadores
+# en la misma máquina comparten la misma memoria física.
+
+VERSION = 2
+ARCHIVOS = {
+    "link_id": ("link_id.i8", np.int64),
+    "partes": ("partes.i8", np.int64),
+    "offsets": ("offsets.i8", np.int64),
+    "coords": ("coords.f8", np.float64),
+    "bbox": ("bbox.f8", np.float64),
+}
+
+
+def construir_almacen(gdf, directorio):
+    """
+    Escribe el almacén a partir de un GeoDataFrame de calles (LineString y MultiLineString).
+    Todo se escribe en una carpeta hermana nueva que reemplaza a la anterior al final: un
+    lector nunca combina arreglos nuevos con el meta.json viejo (AlmacenGeometria abre todos
+    sus archivos desde la misma carpeta aunque la cambien mientras tanto). Durante el cambio
+    de nombre la carpeta puede faltar un instante: el lector falla al abrir, no lee datos
+    mezclados. Quien ya tenía el almacén abierto sigue leyendo los archivos anteriores.
+    """
+    gdf = solo_lineas(gdf)
+    gdf = gdf[~gdf.geometry.is_empty]
+    link_ids = pd.to_numeric(gdf["link_id"], errors="coerce")
+    gdf = gdf[link_ids.notna()]
+    link_ids = link_ids[link_ids.notna()].astype(np.int64).to_numpy()
+
+    orden = np.argsort(link_ids, kind="stable")
+    geoms = np.asarray(gdf.geometry.values, dtype=object)[orden]
+    partes, link_de_parte = explotar(geoms)
+    _, coords, (offsets,) = shapely.to_ragged_array(partes)
+    inicios_partes = np.concatenate([[0], np.cumsum(np.bincount(link_de_parte, minlength=len(geoms)))])
+
+    arreglos = {
+        "link_id": link_ids[orden],
+        "partes": inicios_partes.astype(np.int64),
+        "offsets": offsets.astype(np.int64),
+        "coords": np.ascontiguousarray(coords, dtype=np.float64),
+        "bbox": shapely.bounds(geoms).astype(np.float64),
+    }
+
+    directorio = os.path.normpath(directorio)
+    nuevo = f"{directorio}.{os.getpid()}.nuevo"
+    viejo = f"{directorio}.{os.getpid()}.viejo"
+    shutil.rmtree(nuevo, ignore_errors=True)
+    os.makedirs(nuevo)
+    for clave, arreglo in arreglos.items():
+        nombre, _ = ARCHIVOS[clave]
+        arreglo.tofile(os.path.join(nuevo, nombre))
+
+    meta = {
+        "version": VERSION,
+        "n_links": int(len(orden)),
+        "n_partes": int(len(partes)),
+        "n_coords": int(coords.shape[0]),
+        "dims": int(coords.shape[1]),
+        "crs": gdf.crs.to_string() if gdf.crs is not None else None,
+    }
+    with open(os.path.join(nuevo, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Cambio de carpeta: la anterior se aparta, la nueva toma su nombre y la anterior se borra
+    if os.path.exists(directorio):
+        os.replace(directorio, viejo)
+    os.replace(nuevo, directorio)
+    shutil.rmtree(viejo, ignore_errors=True)
+    return meta
+
+
+def _rangos(inicios, largos):
+    """
+    Concatenación de arange(inicio, inicio + largo) para cada par, sin ciclos.
+    """
+    desplazamiento = np.repeat(np.cumsum(largos) - largos, largos)
+    return np.arange(largos.sum()) - desplazamiento + np.repeat(inicios, largos)
+
+
+class AlmacenGeometria:
+    """
+    Lector del almacén: búsquedas de link_id con searchsorted y geometrías construidas
+    solo para los links pedidos, directamente desde los arreglos mapeados en memoria.
+    """
+
+    def __init__(self, directorio):
+        self._arbol_bbox = None
+        # Con un descriptor de la carpeta, meta.json y los arreglos salen de la misma
+        # versión del almacén aunque construir_almacen la reemplace a mitad de la apertura
+        fd_carpeta = os.open(directorio, os.O_RDONLY) if os.open in os.supports_dir_fd else None
+        try:
+            self._abrir_archivos(directorio, fd_carpeta)
+        finally:
+            if fd_carpeta is not None:
+                os.close(fd_carpeta)
+
+    @staticmethod
+    def _abrir(directorio, fd_carpeta, nombre, modo):
+        if fd_carpeta is None:
+            return open(os.path.join(directorio, nombre), modo)
+        return open(os.open(nombre, os.O_RDONLY, dir_fd=fd_carpeta), modo)
+
+    def _abrir_archivos(self, directorio, fd_carpeta):
+        with self._abrir(directorio, fd_carpeta, "meta.json", "r") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != VERSION:
+            raise ValueError(f"Versión de almacén no soportada: {self.meta['version']}")
+
+        n, n_coords, dims = self.meta["n_links"], self.meta["n_coords"], self.meta["dims"]
+        formas = {
+            "link_id": (n,),
+            "partes": (n + 1,),
+            "offsets": (self.meta["n_partes"] + 1,),
+            "coords": (n_coords, dims),
+            "bbox": (n, 4),
+        }
+        for clave, (nombre, dtype) in ARCHIVOS.items():
+            if formas[clave][0] == 0:
+                arreglo = np.empty(formas[clave], dtype=dtype)
+            else:
+                with self._abrir(directorio, fd_carpeta, nombre, "rb") as f:
+                    arreglo = np.memmap(f, dtype=dtype, mode="r", shape=formas[clave])
+            setattr(self, clave, arreglo)
+        self.crs = self.meta["crs"]
+
+    def __len__(self):
+        return self.meta["n_links"]
+
+    def posiciones(self, link_ids):
+        """
+        Posición de cada link_id en el almacén, o -1 si no existe (o no es numérico).
+        """
+        valores = pd.to_numeric(pd.Series(link_ids), errors="coerce")
+        validos = valores.notna().to_numpy()
+        buscados = np.where(validos, valores.fillna(0), 0).astype(np.int64)
+
+        n = len(self)
+        if n == 0:
+            return np.full(len(buscados), -1, dtype=np.int64)
+        pos = np.searchsorted(self.link_id, buscados)
+        pos_acotada = np.minimum(pos, n - 1)
+        encontrado = validos & (pos < n) & (self.link_id[pos_acotada] == buscados)
+        return np.where(encontrado, pos, -1).astype(np.int64)
+
+    def geometrias(self, posiciones):
+        """
+        LineStrings (MultiLineString si el link tiene varias partes) para las posiciones
+        dadas (None donde la posición es -1). Solo se copian las coordenadas de esos links.
+        """
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        resultado = np.full(len(posiciones), None, dtype=object)
+        validas = posiciones >= 0
+        if not validas.any():
+            return resultado
+
+        p = posiciones[validas]
+        n_partes = self.partes[p + 1] - self.partes[p]
+        partes = _rangos(self.partes[p], n_partes)
+        inicios = self.offsets[partes]
+        largos = self.offsets[partes + 1] - inicios
+        # Índices de coords de cada parte, concatenados
+        indices = _rangos(inicios, largos)
+        nuevos_offsets = np.concatenate([[0], np.cumsum(largos)])
+        nuevas_partes = np.concatenate([[0], np.cumsum(n_partes)])
+        geoms = shapely.from_ragged_array(
+            shapely.GeometryType.MULTILINESTRING, np.asarray(self.coords[indices]), (nuevos_offsets, nuevas_partes)
+        )
+        # Los links de una sola parte vuelven a ser LineString, como en el GeoJSON
+        una = n_partes == 1
+        geoms[una] = shapely.get_geometry(geoms[una], 0)
+        resultado[validas] = geoms
+        return resultado
+
+    def posiciones_en_ventanas(self, ventanas):
+        """
+        Posiciones (ordenadas, sin repetir) de los links cuyo bbox toca alguna de las
+        ventanas (geometrías en el CRS del almacén). Se consultan las cajas de bbox.f8; las
+        geometrías de los links no se construyen.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+        if self._arbol_bbox is None:
+            self._arbol_bbox = shapely.STRtree(shapely.box(*np.asarray(self.bbox).T))
+        _, posiciones = self._arbol_bbox.query(np.asarray(ventanas, dtype=object), predicate="intersects")
+        return np.unique(posiciones).astype(np.int64)
+
+    def a_geodataframe(self, link_ids):
+        """
+        GeoDataFrame [link_id, geometry] con los links pedidos que existen en el almacén,
+        listo para reemplazar la lectura completa de STREETS_NAMING_ADDRESSING.
+        """
+        posiciones = np.unique(self.posiciones(pd.Series(link_ids).drop_duplicates()))
+        return self._geodataframe(posiciones[posiciones >= 0])
+
+    def a_geodataframe_en_ventanas(self, ventanas):
+        """
+        GeoDataFrame [link_id, geometry] con los links cuyo bbox toca alguna de las ventanas.
+        """
+        return self._geodataframe(self.posiciones_en_ventanas(ventanas))
+
+    def _geodataframe(self, posiciones):
+        return gpd.GeoDataFrame(
+            {"link_id": np.asarray(self.link_id[posiciones])},
+            geometry=self.geometrias(posiciones),
+            crs=self.crs,
+        )
+
+
+# Uso:
+#   python almacen_geometria.py [carpeta_geojson] [carpeta_almacen]
+if __name__ == "__main__":
+    carpeta = sys.argv[1] if len(sys.argv) > 1 else "STREETS_NAMING_ADDRESSING"
+    destino = sys.argv[2] if len(sys.argv) > 2 else "ALMACEN_CALLES"
+
+    archivos = sorted(glob.glob(os.path.join(carpeta, "*.geojson")))
+    if not archivos:
+        raise FileNotFoundError(f"No se encontró ningún archivo GeoJSON en {carpeta}/")
+    gdf_calles = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in archivos], ignore_index=True))
+    meta = construir_almacen(gdf_calles, destino)
+    print(f"Almacén guardado en: {destino}")
+    print(f"Links: {meta['n_links']} | Coordenadas: {meta['n_coords']}")
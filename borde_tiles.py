@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from vecinos import DISTANCIA_BUFFER
+from partes import solo_lineas
+
+# Carga de un archivo de STREETS_NAV con su franja de borde.
+# Cuando cada archivo (tile) se procesa por separado, una calzada paralela que cae en el
+# archivo vecino no se ve y el segmento no se detecta como multidigitalizado. Aquí se
+# agregan solo los segmentos de los otros archivos que están a menos de DISTANCIA_BUFFER
+# del rectángulo del archivo, sin parsearlos completos:
+#   1. extensión de cada archivo con pyogrio.read_info (GDAL, sin construir geometrías)
+#   2. descarte de los archivos cuya extensión no toca la ventana ampliada
+#   3. pyogrio.read_bounds con bbox para saber qué features tocan la ventana
+#   4. lectura solo de esos features (fids)
+# Los segmentos de borde entran a la búsqueda como vecinos posibles pero no se consultan
+# ni se escriben, así que cada archivo da el mismo resultado que una corrida global.
+
+
+def extension(ruta):
+    """
+    (minx, miny, maxx, maxy) y CRS de un archivo, leídos de la cabecera / del driver de GDAL.
+    """
+    import pyogrio
+
+    info = pyogrio.read_info(ruta, force_total_bounds=True)
+    return tuple(info["total_bounds"]), info["crs"]
+
+
+def _transformar_caja(caja, crs_origen, crs_destino):
+    if crs_origen == crs_destino:
+        return tuple(caja)
+    return tuple(gpd.GeoSeries([shapely.box(*caja)], crs=crs_origen).to_crs(crs_destino).total_bounds)
+
+
+def ventana_borde(ruta, distancia=DISTANCIA_BUFFER):
+    """
+    Rectángulo del archivo en EPSG:3857 ampliado en `distancia` unidades, las mismas del buffer
+    de la búsqueda de vecinos. Todo segmento que pueda ser vecino de uno del archivo lo toca.
+    """
+    caja, crs = extension(ruta)
+    minx, miny, maxx, maxy = _transformar_caja(caja, crs, "EPSG:3857")
+    return (minx - distancia, miny - distancia, maxx + distancia, maxy + distancia)
+
+
+def _leer_borde(ruta_vecino, ventana):
+    """
+    Features de un archivo vecino cuyo rectángulo toca la ventana (en EPSG:3857).
+    Devuelve None si el archivo no aporta nada.
+    """
+    import pyogrio
+
+    caja, crs = extension(ruta_vecino)
+    ventana_local = _transformar_caja(ventana, "EPSG:3857", crs)
+    if not shapely.intersects(shapely.box(*caja), shapely.box(*ventana_local)):
+        return None
+
+    fids, _ = pyogrio.read_bounds(ruta_vecino, bbox=ventana_local)
+    if len(fids) == 0:
+        return None
+    return pyogrio.read_dataframe(ruta_vecino, fids=fids)
+
+
+def segmentos_de_borde(ruta, rutas, distancia=DISTANCIA_BUFFER):
+    """
+    Segmentos LineString / MultiLineString (en EPSG:3857) de los demás archivos de `rutas` que tocan el
+    rectángulo de `ruta` ampliado en `distancia`. Devuelve (gdf, archivos que aportaron).
+    """
+    ventana = ventana_borde(ruta, distancia)
+    partes, aportaron = [], []
+    for otro in rutas:
+        if os.path.abspath(otro) == os.path.abspath(ruta):
+            continue
+        borde = _leer_borde(otro, ventana)
+        if borde is None:
+            continue
+        borde = solo_lineas(borde).to_crs(epsg=3857)
+        # La ventana filtró por rectángulo; aquí se deja solo lo que de verdad la toca
+        borde = borde[borde.intersects(shapely.box(*ventana))]
+        if len(borde):
+            partes.append(borde)
+            aportaron.append(otro)
+
+    if not partes:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:3857"), aportaron
+    return gpd.GeoDataFrame(pd.concat(partes, ignore_index=True), crs="EPSG:3857"), aportaron
+
+
+def cargar_con_borde(ruta, rutas, distancia=DISTANCIA_BUFFER):
+    """
+    Lee `ruta` completo más los segmentos de borde de los demás archivos de `rutas`.
+    Devuelve (gdf en EPSG:3857 solo con LineString / MultiLineString, máscara de filas de borde, archivos que aportaron).
+    """
+    propio = gpd.read_file(ruta)
+    propio = solo_lineas(propio).to_crs(epsg=3857)
+    borde, aportaron = segmentos_de_borde(ruta, rutas, distancia)
+
+    es_borde = np.concatenate([np.zeros(len(propio), dtype=bool), np.ones(len(borde), dtype=bool)])
+    gdf = gpd.GeoDataFrame(pd.concat([propio, borde], ignore_index=True), crs="EPSG:3857")
+    return gdf, es_borde, aportaron
@@ -0,0 +1,256 @@
+import os
+import sys
+import glob
+import numpy as np
+import pandas as pd
+import shapely
+
+from exportar import escribir_csv
+
+# Perfil de calidad de una entrega (POIs + STREETS) en una sola pasada por lotes, antes de
+# correr las validaciones:
+#   calles  -> geometrías nulas, ilegibles, inválidas o vacías, LineString degeneradas,
+#              MultiLineString (links de varias partes), otros tipos, link_id nulos,
+#              MULTIDIGIT nulo o desconocido
+#   POIs    -> PERCFRREF nulo, no numérico o fuera de 0-1000, LINK_ID nulo o sin calle,
+#              POI_ID repetidos
+#   global  -> link_id repetidos dentro de un archivo y entre archivos
+# Las calles se leen con pyogrio (lotes Arrow, geometría en WKB) o, si no está, registro a
+# registro con Fiona; los CSV por bloques con pandas. En memoria solo queda un lote y los
+# identificadores (8 bytes por link y por POI) para contar repetidos al final.
+# Uso: python calidad_datos.py  (o python poi_validate.py quality). Sale con código 1 si
+# la entrega supera algún umbral de RECHAZO.
+
+TAM_LOTE = 65_536
+CARPETAS_CALLES = ["STREETS_NAV", "STREETS_NAMING_ADDRESSING"]
+RUTA_RESUMEN = "calidad_datos.csv"
+
+# Porcentaje máximo aceptable antes de rechazar la entrega
+RECHAZO = {
+    "percfrref_nulo_pct": 5.0,
+    "geometria_malformada_pct": 1.0,
+    "pois_sin_calle_pct": 5.0,
+}
+
+
+# === LECTURA POR LOTES ===
+def _lotes_pyogrio(ruta, columnas, tam_lote):
+    import pyogrio
+    from pyogrio.raw import open_arrow
+
+    campos = set(pyogrio.read_info(ruta)["fields"])
+    columnas = [c for c in columnas if c in campos]
+    # use_pyarrow=True: desde pyogrio 0.8 el lector por defecto es un stream Arrow genérico
+    # (PyCapsule) que no se puede recorrer como lotes de pyarrow
+    with open_arrow(ruta, columns=columnas, batch_size=tam_lote, use_pyarrow=True) as (meta, lector):
+        nombre_geom = meta["geometry_name"] or "wkb_geometry"
+        for lote in lector:
+            wkb = lote.column(lote.schema.get_field_index(nombre_geom)).to_numpy(zero_copy_only=False)
+            atributos = {c: lote.column(lote.schema.get_field_index(c)).to_pandas() for c in columnas}
+            nulas = pd.isna(pd.Series(wkb)).to_numpy()
+            yield pd.DataFrame(atributos), shapely.from_wkb(wkb, on_invalid="ignore"), nulas
+
+
+def _lotes_fiona(ruta, columnas, tam_lote):
+    import fiona
+    from shapely.geometry import shape
+
+    def convertir(geometria):
+        try:
+            return shape(geometria)
+        except Exception:
+            return None
+
+    with fiona.open(ruta) as capa:
+        filas, geoms, nulas = [], [], []
+        for registro in capa:
+            propiedades = dict(registro["properties"] or {})
+            filas.append({c: propiedades.get(c) for c in columnas})
+            nulas.append(registro["geometry"] is None)
+            geoms.append(None if registro["geometry"] is None else convertir(registro["geometry"]))
+            if len(filas) == tam_lote:
+                yield pd.DataFrame(filas, columns=columnas), np.array(geoms, dtype=object), np.array(nulas)
+                filas, geoms, nulas = [], [], []
+        if filas:
+            yield pd.DataFrame(filas, columns=columnas), np.array(geoms, dtype=object), np.array(nulas)
+
+
+def lotes_capa(ruta, columnas, tam_lote=TAM_LOTE):
+    """
+    Lotes (atributos, geometrías shapely, máscara de geometría nula) de un archivo vectorial.
+    Las geometrías que no se pueden leer quedan en None sin que la máscara de nulas las marque.
+    """
+    try:
+        import pyogrio  # noqa: F401
+        import pyarrow  # noqa: F401
+        lector = _lotes_pyogrio
+    except ImportError:
+        lector = _lotes_fiona
+    return lector(ruta, columnas, tam_lote)
+
+
+# === CALLES ===
+def perfil_calles(ruta, ids):
+    """
+    Estadísticas de un archivo de calles. Agrega los link_id leídos a la lista `ids`.
+    """
+    stats = dict.fromkeys([
+        "features", "geometria_nula", "geometria_ilegible", "geometria_invalida", "geometria_vacia",
+        "linestring", "multilinestring", "otro_tipo", "linea_degenerada", "link_id_nulo",
+        "multidigit_nulo", "multidigit_desconocido",
+    ], 0)
+    for atributos, geoms, nulas in lotes_capa(ruta, ["link_id", "MULTIDIGIT"]):
+        stats["features"] += len(geoms)
+        ilegibles = ~nulas & shapely.is_missing(geoms)
+        presentes = ~shapely.is_missing(geoms)
+        stats["geometria_nula"] += int(nulas.sum())
+        stats["geometria_ilegible"] += int(ilegibles.sum())
+        stats["geometria_invalida"] += int((presentes & ~shapely.is_valid(geoms)).sum())
+        stats["geometria_vacia"] += int((presentes & shapely.is_empty(geoms)).sum())
+
+        tipos = shapely.get_type_id(geoms)
+        lineas = tipos == shapely.GeometryType.LINESTRING
+        stats["linestring"] += int(lineas.sum())
+        stats["multilinestring"] += int((tipos == shapely.GeometryType.MULTILINESTRING).sum())
+        stats["otro_tipo"] += int((presentes & ~lineas & (tipos != shapely.GeometryType.MULTILINESTRING)).sum())
+        stats["linea_degenerada"] += int((lineas & ((shapely.get_num_points(geoms) < 2) | (shapely.length(geoms) == 0))).sum())
+
+        if "link_id" in atributos:
+            link_ids = pd.to_numeric(atributos["link_id"], errors="coerce")
+            stats["link_id_nulo"] += int(link_ids.isna().sum())
+            ids.append(link_ids.dropna().astype(np.int64).to_numpy())
+        else:
+            stats["link_id_nulo"] += len(geoms)
+        if "MULTIDIGIT" in atributos:
+            multidigit = atributos["MULTIDIGIT"]
+            texto = multidigit.astype(str).str.strip().str.upper()
+            stats["multidigit_nulo"] += int(multidigit.isna().sum())
+            stats["multidigit_desconocido"] += int((multidigit.notna() & ~texto.isin(["YES", "Y", "NO", "N"])).sum())
+
+    malformadas = stats["geometria_nula"] + stats["geometria_ilegible"] + stats["geometria_invalida"] + \
+        stats["geometria_vacia"] + stats["linea_degenerada"]
+    stats["geometria_malformada_pct"] = _pct(malformadas, stats["features"])
+    stats["multilinestring_pct"] = _pct(stats["multilinestring"], stats["features"])
+    return stats
+
+
+# === POIs ===
+def perfil_pois(ruta, ids_poi, links_poi, tam_lote=TAM_LOTE):
+    """
+    Estadísticas de un CSV de POIs leído por bloques. Agrega POI_ID y LINK_ID a las listas.
+    """
+    stats = dict.fromkeys(["pois", "percfrref_nulo", "percfrref_no_numerico", "percfrref_fuera_rango",
+                           "link_id_nulo"], 0)
+    columnas = set(pd.read_csv(ruta, nrows=0).columns)
+    usar = [c for c in ["POI_ID", "LINK_ID", "PERCFRREF"] if c in columnas]
+    for bloque in pd.read_csv(ruta, usecols=usar, chunksize=tam_lote, dtype=str):
+        stats["pois"] += len(bloque)
+        if "PERCFRREF" in bloque:
+            crudo = bloque["PERCFRREF"]
+            valor = pd.to_numeric(crudo, errors="coerce")
+            stats["percfrref_nulo"] += int(crudo.isna().sum())
+            stats["percfrref_no_numerico"] += int((crudo.notna() & valor.isna()).sum())
+            stats["percfrref_fuera_rango"] += int(((valor < 0) | (valor > 1000)).sum())
+        else:
+            stats["percfrref_nulo"] += len(bloque)
+        if "LINK_ID" in bloque:
+            link_ids = pd.to_numeric(bloque["LINK_ID"], errors="coerce")
+            stats["link_id_nulo"] += int(link_ids.isna().sum())
+            links_poi.append(link_ids.dropna().astype(np.int64).to_numpy())
+        else:
+            stats["link_id_nulo"] += len(bloque)
+        if "POI_ID" in bloque:
+            ids_poi.append(pd.to_numeric(bloque["POI_ID"], errors="coerce").dropna().astype(np.int64).to_numpy())
+    stats["percfrref_nulo_pct"] = _pct(stats["percfrref_nulo"], stats["pois"])
+    return stats
+
+
+def _pct(parte, total):
+    return round(100 * parte / total, 3) if total else 0.0
+
+
+def _repetidos(arreglos):
+    """
+    Cantidad de valores distintos que aparecen más de una vez en la concatenación.
+    """
+    if not arreglos:
+        return 0
+    _, conteos = np.unique(np.concatenate(arreglos), return_counts=True)
+    return int((conteos > 1).sum())
+
+
+# === PERFIL COMPLETO ===
+def perfilar(carpetas_calles=CARPETAS_CALLES, carpeta_pois="POIs"):
+    """
+    Recorre todas las entradas una vez. Devuelve (tabla por archivo, resumen global).
+    """
+    filas = []
+    globales = {}
+    for carpeta in carpetas_calles:
+        ids_por_archivo = []
+        for ruta in sorted(glob.glob(os.path.join(carpeta, "*.geojson"))):
+            ids = []
+            stats = perfil_calles(ruta, ids)
+            stats["link_id_repetido_en_archivo"] = _repetidos(ids)
+            ids_archivo = np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+            ids_por_archivo.append(ids_archivo)
+            filas.append({"archivo": ruta, "capa": carpeta, **stats})
+        # Un link_id que aparece en más de un archivo de la misma carpeta
+        globales[f"{carpeta}_link_id_entre_archivos"] = _repetidos(ids_por_archivo)
+        globales[f"{carpeta}_links"] = int(sum(len(a) for a in ids_por_archivo))
+        if carpeta == "STREETS_NAMING_ADDRESSING":
+            links_calles = np.unique(np.concatenate(ids_por_archivo)) if ids_por_archivo else np.empty(0, dtype=np.int64)
+
+    ids_poi, links_poi = [], []
+    for ruta in sorted(glob.glob(os.path.join(carpeta_pois, "*.csv"))):
+        filas.append({"archivo": ruta, "capa": carpeta_pois, **perfil_pois(ruta, ids_poi, links_poi)})
+
+    tabla = pd.DataFrame(filas)
+    pois = tabla[tabla["capa"] == carpeta_pois] if len(tabla) else tabla
+    total_pois = int(pois["pois"].sum()) if "pois" in pois else 0
+    calles = tabla[tabla["capa"] != carpeta_pois] if len(tabla) else tabla
+    total_features = int(calles["features"].sum()) if "features" in calles else 0
+
+    globales["poi_id_repetido"] = _repetidos(ids_poi)
+    if links_poi and "STREETS_NAMING_ADDRESSING" in carpetas_calles:
+        enlazados = np.concatenate(links_poi)
+        globales["pois_sin_calle"] = int((~np.isin(enlazados, links_calles)).sum())
+        globales["pois_sin_calle_pct"] = _pct(globales["pois_sin_calle"], total_pois)
+    if total_pois:
+        globales["percfrref_nulo_pct"] = _pct(int(pois["percfrref_nulo"].sum()), total_pois)
+    if total_features:
+        malformadas = calles[["geometria_nula", "geometria_ilegible", "geometria_invalida",
+                              "geometria_vacia", "linea_degenerada"]].to_numpy().sum()
+        globales["geometria_malformada_pct"] = _pct(int(malformadas), total_features)
+        globales["multilinestring"] = int(calles["multilinestring"].sum())
+    return tabla, globales
+
+
+def rechazos(globales, umbrales=RECHAZO):
+    """
+    Métricas globales que superan su umbral: lista de (métrica, valor, umbral).
+    """
+    return [(m, globales[m], u) for m, u in umbrales.items() if globales.get(m, 0) > u]
+
+
+if __name__ == "__main__":
+    tabla, globales = perfilar()
+    if tabla.empty:
+        raise FileNotFoundError("No se encontraron archivos en POIs/ ni en las carpetas de STREETS")
+    resumen = pd.concat([
+        tabla,
+        pd.DataFrame([{"archivo": "TOTAL", "capa": "global", **globales}]),
+    ], ignore_index=True)
+    escribir_csv(resumen, RUTA_RESUMEN)
+
+    for metrica, valor in globales.items():
+        print(f"{metrica}: {valor}")
+    print(f"Resumen por archivo guardado en: {RUTA_RESUMEN}")
+
+    fallas = rechazos(globales)
+    for metrica, valor, umbral in fallas:
+        print(f"❌ {metrica} = {valor} (máximo {umbral})")
+    if fallas:
+        print("Entrega RECHAZADA")
+        sys.exit(1)
+    print("Entrega aceptada")
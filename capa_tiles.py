@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
+
+from tiles import obtener_tile
+from medicion import contar
+
+# Capa de tiles en memoria, compartida entre hilos, delante del caché en disco:
+#   - coalescencia: si varios hilos piden el mismo tile a la vez, solo el primero lo
+#     descarga / lee y decodifica; los demás esperan su resultado (Future)
+#   - LRU acotada por tamaño (bytes decodificados) de imágenes PIL ya decodificadas
+#   - contadores de aciertos, fallos y pedidos coalescidos
+# Las imágenes devueltas se comparten: quien las use no debe modificarlas en sitio.
+
+MEMORIA_POR_DEFECTO_MB = 256
+
+
+def memoria_tiles():
+    """
+    Tamaño máximo de la LRU en bytes, leído de MEMORIA_TILES_MB (por defecto 256 MB).
+    """
+    return int(float(os.getenv("MEMORIA_TILES_MB", MEMORIA_POR_DEFECTO_MB)) * 1024 * 1024)
+
+
+def decodificar(contenido):
+    """
+    Bytes del tile -> imagen PIL RGB ya cargada en memoria.
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(contenido)) as imagen:
+        return imagen.convert("RGB")
+
+
+def _tamano(imagen):
+    return imagen.width * imagen.height * len(imagen.getbands())
+
+
+class CapaTiles:
+    """
+    LRU de tiles decodificados con coalescencia de pedidos en curso.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = memoria_tiles() if max_bytes is None else max_bytes
+        self.bytes_en_uso = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidos = 0
+        self._lru = OrderedDict()
+        self._en_vuelo = {}
+        self._candado = threading.Lock()
+
+    def _guardar(self, clave, imagen):
+        tamano = _tamano(imagen)
+        if tamano > self.max_bytes:
+            return
+        with self._candado:
+            if clave in self._lru:
+                return
+            self._lru[clave] = imagen
+            self.bytes_en_uso += tamano
+            while self.bytes_en_uso > self.max_bytes:
+                _, expulsada = self._lru.popitem(last=False)
+                self.bytes_en_uso -= _tamano(expulsada)
+
+    def _obtener(self, clave, cargar):
+        with self._candado:
+            if clave in self._lru:
+                self._lru.move_to_end(clave)
+                self.aciertos += 1
+                contar("tiles_memoria_aciertos")
+                return self._lru[clave]
+            futuro = self._en_vuelo.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = Future()
+                self._en_vuelo[clave] = futuro
+                self.fallos += 1
+                contar("tiles_memoria_fallos")
+            else:
+                self.coalescidos += 1
+                contar("tiles_coalescidos")
+
+        if not propio:
+            return futuro.result()
+
+        try:
+            imagen = cargar()
+            if imagen is not None:
+                self._guardar(clave, imagen)
+            futuro.set_result(imagen)
+            return imagen
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._candado:
+                self._en_vuelo.pop(clave, None)
+
+    def imagen(self, x, y, zoom, tile_format, api_key, sesion=None):
+        """
+        Imagen decodificada del tile (None si no está en caché y no se pudo descargar).
+        """
+        def cargar():
+            contenido = obtener_tile(x, y, zoom, tile_format, api_key, sesion)
+            return decodificar(contenido) if contenido is not None else None
+
+        return self._obtener((zoom, x, y, tile_format), cargar)
+
+    def estadisticas(self):
+        with self._candado:
+            pedidos = self.aciertos + self.fallos + self.coalescidos
+            return {
+                "tiles_en_memoria": len(self._lru),
+                "bytes_en_uso": self.bytes_en_uso,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "coalescidos": self.coalescidos,
+                "tasa_aciertos": round((self.aciertos + self.coalescidos) / pedidos, 4) if pedidos else 0.0,
+            }
+
+
+_CAPA = None
+_CAPA_CANDADO = threading.Lock()
+
+
+def capa_compartida():
+    """
+    Instancia única del proceso, creada al primer uso.
+    """
+    global _CAPA
+    with _CAPA_CANDADO:
+        if _CAPA is None:
+            _CAPA = CapaTiles()
+        return _CAPA
@@ -1,13 +1,20 @@
 import os
-import math
-import requests
 import geopandas as gpd
-from shapely.geometry import LineString
-from PIL import Image
-from io import BytesIO
-import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 import glob
+import numpy as np
+import pandas as pd
+from vecinos import contar_vecinos
+from grafo_vecinos import vecinos_persistidos
+from partes import solo_lineas
+from exportar import formato_salida, escribir_capa, escribir_delta
+from pipeline_revision import ejecutar_revision
+from snapshots import seleccionar, contar_pois_por_link
+from esquema import a_entero
+from borde_tiles import segmentos_de_borde
+from consistencia_multidigit import tabla_consistencia, escribir_reporte
+from prefiltro_vecinos import consultas_necesarias, imprimir_prefiltro
+from puntos_control import puntos_control_desde_entorno
 
 # CARGAR VARIABLES DE ENTORNO
 load_dotenv()
@@ -18,63 +25,6 @@ if not api_key:
 # CREAR CARPETA PARA IMÁGENES CORREGIDAS
 os.makedirs("imagenes_segmentos", exist_ok=True)
 
-# FUNCIONES
-def lat_lon_to_tile(lat, lon, zoom):
-    lat = min(max(lat, -85.0511), 85.0511)
-    lat_rad = math.radians(lat)
-    n = 2.0 ** zoom
-    x = int((lon + 180.0) / 360.0 * n)
-    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
-    return x, y
-
-def tile_coords_to_lat_lon(x, y, zoom):
-    n = 2.0 ** zoom
-    lon_deg = x / n * 360.0 - 180.0
-    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
-    lat_deg = math.degrees(lat_rad)
-    return lat_deg, lon_deg
-
-def get_tile_bounds(x, y, zoom):
-    lat1, lon1 = tile_coords_to_lat_lon(x, y, zoom)
-    lat2, lon2 = tile_coords_to_lat_lon(x + 1, y + 1, zoom)
-    return lat1, lon1, lat2, lon2
-
-def fetch_satellite_tile(lat, lon, zoom, tile_format, api_key):
-    """
-    Descarga una imagen del tile para una latitud, longitud y zoom dados,
-    usando la API de HERE. Devuelve la imagen y los límites geográficos del tile.
-    """
-    x, y = lat_lon_to_tile(lat, lon, zoom)
-    url = f'https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{tile_format}?apiKey={api_key}&style=satellite.day&size=512'
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"Falló la descarga de imagen: {response.status_code}")
-        return None, None
-    image = Image.open(BytesIO(response.content))
-    return image, get_tile_bounds(x, y, zoom)
-
-def latlon_to_pixel(lat, lon, bounds):
-    """
-    Convierte una latitud y longitud a coordenadas de píxel (x, y) dentro de una imagen de 512x512 píxeles,
-    usando los límites geográficos del tile.
-    """
-    lat1, lon1, lat2, lon2 = bounds
-    x_rel = (lon - lon1) / (lon2 - lon1)
-    y_rel = (lat1 - lat) / (lat1 - lat2)
-    return int(x_rel * 512), int(y_rel * 512)
-
-def calculate_angle(line: LineString):
-    """
-    Calcula el ángulo (en grados, 0-180) del segmento LineString respecto al eje X.
-    Si el segmento tiene menos de dos puntos, devuelve None.
-    """
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return None
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    return math.degrees(math.atan2(y2 - y1, x2 - x1)) % 180
-
 # ARCHIVO 
 geojson_files = sorted(glob.glob("STREETS_NAV/*.geojson"))
 if not geojson_files:
@@ -83,94 +33,93 @@ nav_path = geojson_files[0]
 print(f"Procesando archivo: {os.path.basename(nav_path)}")
 
 nav_gdf = gpd.read_file(nav_path)
-nav_gdf = nav_gdf[nav_gdf.geometry.type == "LineString"]
+nav_gdf = solo_lineas(nav_gdf)
 if nav_gdf.empty:
-    raise ValueError("El archivo no contiene segmentos tipo LineString.")
+    raise ValueError("El archivo no contiene segmentos tipo LineString ni MultiLineString.")
 
 nav_gdf_proj = nav_gdf.to_crs(epsg=3857)
 nav_gdf_proj["original_MULTIDIGIT"] = nav_gdf["MULTIDIGIT"].values
+n_propios = len(nav_gdf_proj)
+
+# Segmentos de los archivos vecinos a menos de 25 m del borde: cuentan como calzadas
+# paralelas posibles, pero no se corrigen ni se escriben desde este archivo
+borde, aportaron = segmentos_de_borde(nav_path, geojson_files)
+if aportaron:
+    print(f"Segmentos de borde agregados: {len(borde)} de {len(aportaron)} archivos vecinos")
+    nav_gdf_proj = gpd.GeoDataFrame(pd.concat([nav_gdf_proj, borde], ignore_index=False), crs=nav_gdf_proj.crs)
 
 updated_segments = []
-imagenes_guardadas = 0  # contador para imágenes
 zoom = 18
 
-for idx, segment in nav_gdf_proj.iterrows():
-    geom = segment.geometry
-    link_id = segment.get("link_id")
-
-    if geom.length < 5:
-        continue
-
-    angle_segment = calculate_angle(geom)
-    if angle_segment is None:
-        continue
-
-    buffer = geom.buffer(25)
-    nearby = nav_gdf_proj[
-        (nav_gdf_proj.geometry.intersects(buffer)) &
-        (nav_gdf_proj["link_id"] != link_id) &
-        (nav_gdf_proj.index != idx)
-    ]
-
-    valid_neighbors = []
-    for _, neighbor in nearby.iterrows():
-        angle_neighbor = calculate_angle(neighbor.geometry)
-        if angle_neighbor is None:
-            continue
-
-        angle_diff = abs(angle_segment - angle_neighbor)
-        if angle_diff > 90:
-            angle_diff = 180 - angle_diff
-
-        overlap = geom.intersection(neighbor.geometry)
-        overlap_ratio = overlap.length / geom.length if geom.length > 0 else 0
-        centroid_distance = geom.centroid.distance(neighbor.geometry.centroid)
-
-        print(f"→ Segmento {idx}: angle diff={angle_diff:.1f}°, overlap={overlap_ratio:.2f}, dist={centroid_distance:.1f}")
-
-        if angle_diff <= 20 and (overlap_ratio >= 0.05 or centroid_distance < 25):
-            valid_neighbors.append(neighbor)
-
-    inferred = "YES" if len(valid_neighbors) >= 1 else "NO"
-
-    original = str(segment["original_MULTIDIGIT"]).strip().upper()
-    if original not in ["YES", "Y", "NO", "N"]:
-        original = "NO"
-
-    was_correct = (
-        (inferred == "YES" and original in ["YES", "Y"]) or
-        (inferred == "NO" and original in ["NO", "N"])
+# Solo los segmentos propios se consultan; los de borde quedan como vecinos posibles
+consultas, reporte = consultas_necesarias(nav_gdf_proj, "multidigit", np.arange(len(nav_gdf_proj)) >= n_propios)
+imprimir_prefiltro(nav_gdf_proj, consultas, reporte)
+
+# Vecinos de los segmentos consultados (del grafo persistido si GRAFO_VECINOS está definido)
+pares = vecinos_persistidos(nav_gdf_proj, [nav_path, *aportaron], consultas=consultas)
+num_vecinos = contar_vecinos(pares, len(nav_gdf_proj))
+indices = nav_gdf_proj.index.to_numpy()
+
+# Consistencia original vs inferido en una sola pasada; el detalle por link va a archivo
+consistencia = tabla_consistencia(nav_gdf_proj, num_vecinos, nav_gdf_proj["original_MULTIDIGIT"].to_numpy(), n_propios)
+nombre_base = os.path.splitext(os.path.basename(nav_path))[0]
+ruta_detalle, ruta_resumen, resumen = escribir_reporte(consistencia, nombre_base)
+total = resumen.iloc[0]
+print(f"Consistencia MULTIDIGIT: {total['consultados']} consultados, "
+      f"YES→NO {total['yes_a_no']} ({total['tasa_yes_a_no']}), NO→YES {total['no_a_yes']} ({total['tasa_no_a_yes']})")
+print(f"Detalle por link: {ruta_detalle} | Resumen por clase y tile: {ruta_resumen}")
+
+def segmentos_corregidos():
+    """
+    Corrige MULTIDIGIT donde la inferencia no coincide con el original y arma la tabla
+    de segmentos corregidos con los datos necesarios para priorizar su imagen.
+    """
+    corregidos = consistencia[consistencia["cambio"] != "sin_cambio"]
+    idx = indices[corregidos["posicion"].to_numpy()]
+    nav_gdf.loc[idx, "MULTIDIGIT"] = corregidos["inferido"].astype(str).to_numpy()
+    updated_segments.extend(idx)
+
+    centroides = nav_gdf.loc[idx, "geometry"].centroid
+    titulos = (
+        "Segmento " + pd.Series(idx).astype(str) + " | MULTIDIGIT: " +
+        corregidos["original"].astype(str).to_numpy() + " → " + corregidos["inferido"].astype(str).to_numpy() + " | Corregido"
     )
-
-    if not was_correct:
-        nav_gdf.at[idx, "MULTIDIGIT"] = inferred
-        updated_segments.append(idx)
-
-        # Mostrar y guardar imagen solo si fue corregido y aún no se ha llegado al límite
-        if imagenes_guardadas < 20:
-            centroid = nav_gdf.at[idx, "geometry"].centroid
-            lat, lon = centroid.y, centroid.x
-            image, bounds = fetch_satellite_tile(lat, lon, zoom, 'png', api_key)
-            if image:
-                fig, ax = plt.subplots(figsize=(6, 6))
-                ax.imshow(image)
-                px, py = latlon_to_pixel(lat, lon, bounds)
-                ax.plot(px, py, 'ro', markersize=10)
-                ax.set_title(f"Segmento {idx} | MULTIDIGIT: {original} → {inferred} | Corregido")
-                ax.axis("off")
-                plt.tight_layout()
-                plt.savefig(f"imagenes_segmentos/segmento_{idx}.png")
-                plt.close()
-                imagenes_guardadas += 1
-
-                if imagenes_guardadas == 10:
-                    print("Límite de 10 imágenes alcanzado. No se guardarán más.")
+    return pd.DataFrame({
+        "link_id": corregidos["link_id"].to_numpy(),
+        "longitud": corregidos["longitud"].to_numpy(),
+        "lat": centroides.y.to_numpy(),
+        "lon": centroides.x.to_numpy(),
+        "titulo": titulos.to_numpy(),
+        "ruta": ("imagenes_segmentos/segmento_" + pd.Series(idx).astype(str) + ".png").to_numpy(),
+    })
+
+# Priorizar las imágenes por longitud del segmento y POIs sobre el link, dentro del presupuesto
+marcados = segmentos_corregidos()
+if not marcados.empty:
+    conteo_pois = contar_pois_por_link(sorted(glob.glob("POIs/*.csv")))
+    marcados["densidad_pois"] = a_entero(marcados["link_id"]).map(conteo_pois).fillna(0)
+    elegidos = seleccionar(marcados)
+    print(f"Snapshots priorizados: {len(elegidos)} de {len(marcados)} segmentos corregidos")
+
+    # Las descargas de tiles y el render se traslapan entre sí; con CHECKPOINTS, por lotes reanudables
+    puntos_control = puntos_control_desde_entorno(
+        f"multidigit_{os.path.splitext(os.path.basename(nav_path))[0]}",
+        [nav_path, *aportaron, *glob.glob("POIs/*.csv")],
+        {"PRESUPUESTO_SNAPSHOTS": os.getenv("PRESUPUESTO_SNAPSHOTS"), "ORDEN_ESPACIAL": os.getenv("ORDEN_ESPACIAL")},
+    )
+    imagenes = ejecutar_revision(elegidos.to_dict("records"), api_key, puntos_control=puntos_control,
+                                 zoom=zoom, tile_format='png')
+    print(f"Imágenes guardadas en imagenes_segmentos/: {len(imagenes)}")
 
 # GUARDAR SI HAY CAMBIOS
 if updated_segments:
     filename = os.path.basename(nav_path)
     output_path = os.path.join("STREETS_NAV", f"ACTUALIZADO_{filename}")
-    nav_gdf.to_file(output_path, driver="GeoJSON")
+    formato = formato_salida()
+    if formato == "delta":
+        output_path = escribir_delta(nav_gdf, output_path, ["MULTIDIGIT"])
+    else:
+        output_path = escribir_capa(nav_gdf, output_path, formato)
     print(f"\n Archivo actualizado guardado en: {output_path}")
     print(f" Segmentos corregidos: {len(updated_segments)}")
 else:
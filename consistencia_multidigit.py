@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import pandas as pd
+
+from vecinos import LONGITUD_MINIMA
+from grafo_vecinos import claves_tile, ZOOM_PARTICION
+from exportar import escribir_csv
+
+# Reporte de consistencia de MULTIDIGIT (original vs inferido por vecinos), en una sola
+# pasada vectorizada sobre los arreglos que ya calculó check_multiply_digitised.py:
+#   - detalle por link (columnar, parquet o CSV si no hay pyarrow)
+#   - resumen con conteos y tasas de YES→NO y NO→YES por clase de vía y por tile (zoom 14)
+# No vuelve a leer geometrías: solo usa longitudes y centroides de la capa ya cargada.
+
+COLUMNAS_CLASE = ["FUNC_CLASS", "func_class", "FUNCTIONAL_CLASS", "functional_class"]
+SIN_CLASE = "desconocida"
+CAMBIOS = ["YES→NO", "NO→YES", "sin_cambio"]
+
+
+def normalizar_multidigit(valores):
+    """
+    YES / Y -> 'YES'; cualquier otro valor (NO, N, vacío, basura) -> 'NO',
+    igual que la comparación original de check_multiply_digitised.py.
+    """
+    texto = pd.Series(valores).astype(str).str.strip().str.upper().to_numpy()
+    return np.where(np.isin(texto, ["YES", "Y"]), "YES", "NO").astype(object)
+
+
+def columna_clase(gdf):
+    """
+    Nombre de la columna de clase funcional de la vía, o None si la capa no la trae.
+    """
+    return next((c for c in COLUMNAS_CLASE if c in gdf.columns), None)
+
+
+def tabla_consistencia(gdf_proj, num_vecinos, original, n_propios=None):
+    """
+    Una fila por segmento consultado (longitud >= LONGITUD_MINIMA) de las primeras
+    n_propios filas de gdf_proj: link_id, clase, tile, longitud, num_vecinos, original,
+    inferido y cambio. La columna 'posicion' es la fila en gdf_proj.
+    """
+    n_propios = len(gdf_proj) if n_propios is None else n_propios
+    propios = gdf_proj.iloc[:n_propios]
+    longitudes = propios.geometry.length.to_numpy()
+    posiciones = np.flatnonzero(longitudes >= LONGITUD_MINIMA)
+    consultados = propios.iloc[posiciones]
+
+    original = normalizar_multidigit(np.asarray(original)[posiciones])
+    inferido = np.where(np.asarray(num_vecinos)[posiciones] >= 1, "YES", "NO").astype(object)
+    cambio = np.select(
+        [(original == "YES") & (inferido == "NO"), (original == "NO") & (inferido == "YES")],
+        CAMBIOS[:2],
+        default=CAMBIOS[2],
+    )
+
+    clase = columna_clase(gdf_proj)
+    if clase is None:
+        clases = np.full(len(posiciones), SIN_CLASE, dtype=object)
+    else:
+        clases = consultados[clase].fillna(SIN_CLASE).astype(str).to_numpy()
+
+    lado = 2 ** ZOOM_PARTICION
+    claves = claves_tile(consultados) if len(consultados) else np.empty(0, dtype=np.int64)
+    tiles = f"{ZOOM_PARTICION}/" + pd.Series(claves // lado).astype(str) + "/" + pd.Series(claves % lado).astype(str)
+
+    return pd.DataFrame({
+        "posicion": posiciones,
+        "link_id": consultados["link_id"].to_numpy() if "link_id" in consultados else consultados.index.to_numpy(),
+        "clase": pd.Categorical(clases),
+        "tile": pd.Categorical(tiles.to_numpy()),
+        "longitud": longitudes[posiciones],
+        "num_vecinos": np.asarray(num_vecinos)[posiciones],
+        "original": pd.Categorical(original, categories=["YES", "NO"]),
+        "inferido": pd.Categorical(inferido, categories=["YES", "NO"]),
+        "cambio": pd.Categorical(cambio, categories=CAMBIOS),
+    })
+
+
+def _con_tasas(resumen):
+    """
+    Agrega las tasas de YES→NO, NO→YES y de cambio total (vacías si no hay denominador).
+    """
+    resumen["tasa_yes_a_no"] = (resumen["yes_a_no"] / resumen["originales_yes"].replace(0, np.nan)).round(4)
+    resumen["tasa_no_a_yes"] = (resumen["no_a_yes"] / resumen["originales_no"].replace(0, np.nan)).round(4)
+    resumen["tasa_cambio"] = ((resumen["yes_a_no"] + resumen["no_a_yes"]) / resumen["consultados"].replace(0, np.nan)).round(4)
+    return resumen
+
+
+def resumir(detalle, por):
+    """
+    Conteos y tasas de corrección agrupados por la columna 'por' ('clase' o 'tile').
+    Las tasas son sobre los segmentos consultados con ese valor original.
+    """
+    conteos = pd.crosstab(detalle[por], detalle["cambio"]).reindex(columns=CAMBIOS, fill_value=0)
+    originales = pd.crosstab(detalle[por], detalle["original"]).reindex(columns=["YES", "NO"], fill_value=0)
+    resumen = pd.DataFrame({
+        "agrupacion": por,
+        "valor": conteos.index.astype(str),
+        "consultados": conteos.sum(axis=1).to_numpy(),
+        "originales_yes": originales["YES"].to_numpy(),
+        "originales_no": originales["NO"].to_numpy(),
+        "yes_a_no": conteos["YES→NO"].to_numpy(),
+        "no_a_yes": conteos["NO→YES"].to_numpy(),
+    })
+    return _con_tasas(resumen).sort_values(["tasa_cambio", "consultados"], ascending=False, ignore_index=True)
+
+
+def escribir_reporte(detalle, nombre_base, carpeta="."):
+    """
+    Guarda el detalle por link (parquet; CSV si pyarrow no está instalado) y el resumen
+    por clase y por tile en CSV. Devuelve (ruta_detalle, ruta_resumen, resumen).
+    """
+    base = os.path.join(carpeta, f"consistencia_multidigit_{nombre_base}")
+    columnas = detalle.drop(columns="posicion")
+    try:
+        ruta_detalle = base + "_detalle.parquet"
+        columnas.to_parquet(ruta_detalle, index=False)
+    except ImportError:
+        ruta_detalle = escribir_csv(columnas, base + "_detalle.csv")
+
+    total = pd.DataFrame([{
+        "agrupacion": "total", "valor": "total",
+        "consultados": len(detalle),
+        "originales_yes": int((detalle["original"] == "YES").sum()),
+        "originales_no": int((detalle["original"] == "NO").sum()),
+        "yes_a_no": int((detalle["cambio"] == "YES→NO").sum()),
+        "no_a_yes": int((detalle["cambio"] == "NO→YES").sum()),
+    }])
+    resumen = pd.concat([_con_tasas(total), resumir(detalle, "clase"), resumir(detalle, "tile")], ignore_index=True)
+    ruta_resumen = escribir_csv(resumen, base + "_resumen.csv")
+    return ruta_detalle, ruta_resumen, resumen
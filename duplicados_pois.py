@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pandas as pd
+
+from limpia import limpiar_tabla
+from exportar import escribir_csv
+from medicion import contar
+
+# Detección de POIs duplicados o casi duplicados (el mismo negocio digitalizado varias
+# veces, en el mismo CSV o en varios) antes de las validaciones de lado y MULTIDIGIT y de
+# pedir snapshots.
+# Dos POIs son duplicados si su nombre normalizado (limpiar_tabla, en mayúsculas) es igual
+# y sus posiciones (EPSG:3857) están a menos de DUPLICADOS_POIS metros. Las posiciones se
+# agrupan en una grilla de celdas de lado distancia/√2, así todo lo que cae en la misma
+# celda ya está a menos de la distancia y solo se comparan punto a punto los POIs de
+# celdas vecinas con el mismo nombre. Los grupos se cierran transitivamente.
+
+CELDAS_VECINAS = [(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if (dx, dy) != (0, 0)]
+
+
+def distancia_duplicados():
+    """
+    Distancia en metros leída de DUPLICADOS_POIS; None (no se buscan duplicados) si no está definida.
+    """
+    valor = os.getenv("DUPLICADOS_POIS", "").strip()
+    return float(valor) if valor else None
+
+
+def normalizar_nombres(nombres):
+    """
+    Nombres limpios con limpiar_tabla (sin tildes, signos ni espacios) y en mayúsculas.
+    Cada nombre distinto se limpia una sola vez.
+    """
+    nombres = pd.Series(nombres).reset_index(drop=True)
+    unicos = pd.DataFrame({"POI_NAME": nombres.dropna().unique()})
+    limpios = limpiar_tabla(unicos.copy())["POI_NAME"].str.upper()
+    return nombres.map(pd.Series(limpios.to_numpy(), index=unicos["POI_NAME"]))
+
+
+def _componentes(n, a, b):
+    """
+    Etiqueta de componente conexa (la posición más baja del grupo) para n nodos y aristas (a, b).
+    """
+    etiquetas = np.arange(n)
+    if len(a) == 0:
+        return etiquetas
+    while True:
+        minimo = np.minimum(etiquetas[a], etiquetas[b])
+        nuevas = etiquetas.copy()
+        np.minimum.at(nuevas, a, minimo)
+        np.minimum.at(nuevas, b, minimo)
+        nuevas = nuevas[nuevas]
+        if np.array_equal(nuevas, etiquetas):
+            return etiquetas
+        etiquetas = nuevas
+
+
+def grupos_duplicados(x, y, nombres, distancia):
+    """
+    Grupo (posición del primer POI del grupo) de cada POI. Los POIs sin nombre o sin
+    posición forman su propio grupo.
+    """
+    n = len(x)
+    codigos, _ = pd.factorize(pd.Series(nombres))
+    validos = (codigos >= 0) & np.isfinite(x) & np.isfinite(y)
+    lado = distancia / np.sqrt(2)
+
+    tabla = pd.DataFrame({
+        "pos": np.flatnonzero(validos),
+        "nombre": codigos[validos],
+        "cx": np.floor(x[validos] / lado).astype(np.int64),
+        "cy": np.floor(y[validos] / lado).astype(np.int64),
+    })
+
+    # Misma celda y mismo nombre: duplicados directos, sin comparar pares
+    celda = tabla.groupby(["nombre", "cx", "cy"], sort=False)["pos"].transform("min").to_numpy()
+    a, b = [tabla["pos"].to_numpy()], [celda]
+
+    # Celdas vecinas: pares punto a punto, solo entre POIs con el mismo nombre
+    por_celda = tabla.assign(primero=celda)
+    for dx, dy in CELDAS_VECINAS:
+        desplazada = por_celda.assign(cx=por_celda["cx"] + dx, cy=por_celda["cy"] + dy)
+        pares = por_celda.merge(desplazada, on=["nombre", "cx", "cy"], suffixes=("_a", "_b"))
+        pares = pares[pares["pos_a"] < pares["pos_b"]]
+        if pares.empty:
+            continue
+        pa, pb = pares["pos_a"].to_numpy(), pares["pos_b"].to_numpy()
+        cerca = np.hypot(x[pa] - x[pb], y[pa] - y[pb]) < distancia
+        a.append(pares["primero_a"].to_numpy()[cerca])
+        b.append(pares["primero_b"].to_numpy()[cerca])
+
+    return _componentes(n, np.concatenate(a), np.concatenate(b))
+
+
+def colapsar_duplicados(gdf_pois, distancia, ruta_reporte="pois_duplicados.csv"):
+    """
+    Deja un POI por grupo de duplicados (el primero en el orden de carga) y escribe los
+    descartados con el POI_ID que se conservó. Devuelve (gdf sin duplicados, cantidad descartada).
+    """
+    puntos = gdf_pois.geometry
+    if gdf_pois.crs is not None and gdf_pois.crs.to_epsg() != 3857:
+        puntos = puntos.to_crs(epsg=3857)
+    x = puntos.x.to_numpy(dtype=float)
+    y = puntos.y.to_numpy(dtype=float)
+
+    nombres = normalizar_nombres(gdf_pois["POI_NAME"])
+    grupo = grupos_duplicados(x, y, nombres.to_numpy(), distancia)
+    conservar = grupo == np.arange(len(grupo))
+
+    tamanos = np.bincount(grupo, minlength=len(grupo))
+    columnas = [c for c in ["POI_ID", "POI_NAME", "LINK_ID", "ARCHIVO_POI"] if c in gdf_pois.columns]
+    descartados = pd.DataFrame(gdf_pois[columnas]).iloc[np.flatnonzero(~conservar)].reset_index(drop=True)
+    descartados["NOMBRE_NORMALIZADO"] = nombres.to_numpy()[~conservar]
+    descartados["POI_ID_CONSERVADO"] = gdf_pois["POI_ID"].to_numpy()[grupo[~conservar]]
+    descartados["TAMANO_GRUPO"] = tamanos[grupo[~conservar]]
+    escribir_csv(descartados, ruta_reporte)
+
+    n_descartados = int((~conservar).sum())
+    contar("pois_duplicados", n_descartados)
+    return gdf_pois[conservar].reset_index(drop=True), n_descartados
@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from tiles import tiles_vectorizados, posicion_relativa_en_tile
+from capa_tiles import capa_compartida
+
+# Triage automático de "POI no existe en la realidad" sobre el caché de tiles.
+# Para cada POI se toma una ventana de píxeles alrededor de su posición en el tile
+# (la misma que marca latlon_to_pixel), se calculan características baratas de bordes,
+# textura y color, vectorizadas con NumPy sobre lotes de tiles, y se combinan en una
+# probabilidad de que haya un edificio. Solo los POIs ambiguos pasan a revisión humana.
+
+ZOOM = 18
+VENTANA = 48             # píxeles por lado (~15 m en un tile de 512 px a zoom 18)
+UMBRAL_BORDE = 0.08      # magnitud de gradiente (escala de grises 0-1) que cuenta como borde
+TILES_POR_LOTE = 64
+
+# Pesos heurísticos iniciales de la combinación logística; conviene recalibrarlos con las
+# respuestas de la revisión manual (s/n de ver_POI.py).
+PESOS = {
+    "densidad_bordes": 6.0,
+    "textura": 4.0,
+    "brillo": 1.0,
+    "saturacion": -3.0,
+    "vegetacion": -8.0,
+}
+SESGO = -1.5
+
+UMBRAL_EDIFICIO = 0.7
+UMBRAL_SIN_EDIFICIO = 0.3
+
+
+def cargar_tile(imagen):
+    """
+    Imagen PIL RGB del tile -> arreglo float32 en [0, 1] de forma (alto, ancho, 3).
+    """
+    return np.asarray(imagen, dtype=np.float32) / 255.0
+
+
+def extraer_ventanas(imagen, x_rel, y_rel, ventana=VENTANA):
+    """
+    Ventanas (B, ventana, ventana, 3) centradas en cada posición relativa del tile.
+    Los bordes del tile se rellenan repitiendo el último píxel.
+    """
+    alto, ancho, _ = imagen.shape
+    px = np.clip((np.asarray(x_rel) * ancho).astype(np.int64), 0, ancho - 1)
+    py = np.clip((np.asarray(y_rel) * alto).astype(np.int64), 0, alto - 1)
+    medio = ventana // 2
+    relleno = np.pad(imagen, ((medio, medio), (medio, medio), (0, 0)), mode="edge")
+    vistas = np.lib.stride_tricks.sliding_window_view(relleno, (ventana, ventana, 3))
+    return vistas[py, px, 0]
+
+
+def caracteristicas(ventanas):
+    """
+    Características por ventana, calculadas de una vez para todo el lote.
+    """
+    gris = ventanas @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = np.abs(np.diff(gris, axis=2))[:, :-1, :]
+    gy = np.abs(np.diff(gris, axis=1))[:, :, :-1]
+    magnitud = np.hypot(gx, gy)
+
+    r, g = ventanas[..., 0], ventanas[..., 1]
+    maximo = ventanas.max(axis=-1)
+    minimo = ventanas.min(axis=-1)
+
+    return pd.DataFrame({
+        "densidad_bordes": (magnitud > UMBRAL_BORDE).mean(axis=(1, 2)),
+        "textura": gris.std(axis=(1, 2)),
+        "brillo": gris.mean(axis=(1, 2)),
+        "saturacion": ((maximo - minimo) / (maximo + 1e-6)).mean(axis=(1, 2)),
+        "vegetacion": ((g - r) / (g + r + 1e-6)).mean(axis=(1, 2)),
+    })
+
+
+def probabilidad_edificio(feats):
+    """
+    Combinación logística de las características: 0 = sin edificio, 1 = edificio.
+    """
+    z = np.full(len(feats), SESGO)
+    for columna, peso in PESOS.items():
+        z += peso * feats[columna].to_numpy()
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def veredicto(puntaje):
+    if pd.isna(puntaje):
+        return "sin_tile"
+    if puntaje >= UMBRAL_EDIFICIO:
+        return "edificio"
+    if puntaje <= UMBRAL_SIN_EDIFICIO:
+        return "sin_edificio"
+    return "revisar"
+
+
+def puntuar_pois(lat, lon, zoom=ZOOM, api_key=None, tile_format="png", tiles_por_lote=TILES_POR_LOTE):
+    """
+    Puntaje de edificio para cada POI. Los tiles se leen del caché en disco; con api_key
+    los que falten se descargan y se guardan. Los POIs sin tile quedan en NaN.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    x, y = tiles_vectorizados(lat, lon, zoom)
+    x_rel, y_rel = posicion_relativa_en_tile(lat, lon, x, y, zoom)
+
+    puntaje = np.full(len(lat), np.nan)
+    grupos = pd.DataFrame({"x": x, "y": y}).groupby(["x", "y"]).indices
+
+    lote_ventanas, lote_posiciones = [], []
+
+    def procesar_lote():
+        if not lote_ventanas:
+            return
+        feats = caracteristicas(np.concatenate(lote_ventanas))
+        puntaje[np.concatenate(lote_posiciones)] = probabilidad_edificio(feats)
+        lote_ventanas.clear()
+        lote_posiciones.clear()
+
+    capa = capa_compartida()
+    for (tx, ty), posiciones in grupos.items():
+        tile = capa.imagen(int(tx), int(ty), zoom, tile_format, api_key)
+        if tile is None:
+            continue
+        imagen = cargar_tile(tile)
+        lote_ventanas.append(extraer_ventanas(imagen, x_rel[posiciones], y_rel[posiciones]))
+        lote_posiciones.append(posiciones)
+        if len(lote_ventanas) >= tiles_por_lote:
+            procesar_lote()
+    procesar_lote()
+
+    return puntaje
+
+
+# Uso:
+#   python edificios.py  -> lee output_POIs.geojson y escribe triage_edificios.csv
+if __name__ == "__main__":
+    import geopandas as gpd
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.getenv("HERE_API_KEY")
+
+    gdf = gpd.read_file("output_POIs.geojson")
+    points = gdf[gdf.geometry.type == "Point"]
+
+    puntajes = puntuar_pois(points.geometry.y.to_numpy(), points.geometry.x.to_numpy(), api_key=api_key)
+    triage = pd.DataFrame({
+        "indice": np.arange(len(points)),
+        "lat": points.geometry.y.to_numpy(),
+        "lon": points.geometry.x.to_numpy(),
+        "puntaje_edificio": puntajes,
+    })
+    if "POI_ID" in points.columns:
+        triage.insert(1, "POI_ID", points["POI_ID"].to_numpy())
+    triage["veredicto"] = triage["puntaje_edificio"].apply(veredicto)
+    triage.to_csv("triage_edificios.csv", index=False)
+
+    conteo = triage["veredicto"].value_counts()
+    print("Archivo generado: triage_edificios.csv")
+    for clave in ["edificio", "sin_edificio", "revisar", "sin_tile"]:
+        print(f"- {clave}: {conteo.get(clave, 0)}")
+    pendientes = conteo.get("revisar", 0) + conteo.get("sin_tile", 0)
+    print(f"POIs que requieren revisión humana: {pendientes} de {len(triage)}")
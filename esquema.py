@@ -0,0 +1,110 @@
+import pandas as pd
+
+# Esquema de tipos para las tablas de POIs y calles, aplicado al cargar:
+#   - link_id / LINK_ID como enteros (Int64, admite nulos), así los merges son joins de
+#     enteros y no hace falta ir y venir con astype(str); los LINK_ID que no son enteros
+#     se cuentan y se informan
+#   - POI_ID como entero solo si todos sus valores lo son; si no, queda como texto
+#   - MULTIDIGIT normalizado una sola vez a booleano (Y/YES -> True)
+#   - columnas de lado y de evaluación como categóricas de pocas categorías fijas
+
+LADOS = pd.CategoricalDtype(["L", "R", "center", "unknown"])
+EVAL_SIDE = pd.CategoricalDtype(["ok", "relink"])
+EVAL_MULTIDIGIT = pd.CategoricalDtype(["ok", "delete"])
+SI_NO = pd.CategoricalDtype(["NO", "YES"])
+
+TIPOS_RESULTADO = {
+    "DECLARED_SIDE": LADOS,
+    "GEOMETRIC_SIDE": LADOS,
+    "EVAL_SIDE": EVAL_SIDE,
+    "LOCATION_STATUS": EVAL_SIDE,
+    "EVAL_MULTIDIGIT": EVAL_MULTIDIGIT,
+    "EXCEPTION_LEGIT": SI_NO,
+}
+
+# Columnas de texto libre que no conviene volver categóricas
+TEXTO_LIBRE = {"POI_NAME"}
+
+
+def a_entero(serie):
+    """
+    Convierte identificadores a Int64; lo que no sea un entero (texto, decimales) queda como nulo.
+    """
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if pd.api.types.is_float_dtype(numeros):
+        numeros = numeros.where(numeros % 1 == 0)
+    return numeros.astype("Int64")
+
+
+def no_enteros(serie, convertida):
+    """
+    Valores de la serie original que no eran nulos y a_entero dejó como nulos.
+    """
+    return serie[serie.notna().to_numpy() & convertida.isna().to_numpy()]
+
+
+def _id_texto_o_entero(serie):
+    """
+    Int64 si todos los valores no nulos son enteros; si no, texto sin tocar los valores.
+    """
+    convertida = a_entero(serie)
+    if no_enteros(serie, convertida).empty:
+        return convertida
+    return serie.astype("string")
+
+
+def multidigit_bool(serie):
+    """
+    MULTIDIGIT como booleano: True para Y/YES (sin importar espacios ni mayúsculas).
+    Los nulos y cualquier otro valor cuentan como NO, igual que en las comparaciones originales.
+    """
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.fillna(False).astype(bool)
+    return serie.astype(str).str.strip().str.upper().isin(["YES", "Y"])
+
+
+def tipar_pois(df):
+    """
+    Aplica el esquema a la tabla de POIs recién cargada. Los LINK_ID que no son enteros
+    se informan por consola y quedan nulos (salen en pois_sin_link.csv). Las columnas de texto con pocos
+    valores distintos (menos de la mitad de las filas) se vuelven categóricas.
+    """
+    if "LINK_ID" in df.columns:
+        convertida = a_entero(df["LINK_ID"])
+        invalidos = no_enteros(df["LINK_ID"], convertida)
+        if len(invalidos):
+            ejemplos = ", ".join(map(str, invalidos.astype(str).unique()[:5]))
+            print(f"⚠️ {len(invalidos)} POIs con LINK_ID no entero (p. ej. {ejemplos}); quedan sin link")
+        df["LINK_ID"] = convertida
+    if "POI_ID" in df.columns:
+        df["POI_ID"] = _id_texto_o_entero(df["POI_ID"])
+    if "PERCFRREF" in df.columns:
+        df["PERCFRREF"] = pd.to_numeric(df["PERCFRREF"], errors="coerce").astype("float64")
+
+    for columna in df.select_dtypes(include="object").columns:
+        if columna in TEXTO_LIBRE:
+            continue
+        if df[columna].nunique(dropna=True) < len(df) // 2:
+            df[columna] = df[columna].astype("category")
+    return df
+
+
+def tipar_calles(gdf):
+    """
+    Aplica el esquema a una capa de calles (STREETS_NAV o STREETS_NAMING_ADDRESSING).
+    MULTIDIGIT se deja como texto porque se reescribe en las capas de salida;
+    para compararlo se usa multidigit_bool.
+    """
+    if "link_id" in gdf.columns:
+        gdf["link_id"] = a_entero(gdf["link_id"])
+    return gdf
+
+
+def tipar_resultados(df):
+    """
+    Convierte a categóricas las columnas de lado y evaluación presentes en la tabla.
+    """
+    for columna, tipo in TIPOS_RESULTADO.items():
+        if columna in df.columns:
+            df[columna] = df[columna].astype(tipo)
+    return df
@@ -0,0 +1,97 @@
+import os
+import shapely
+
+# Escritores rápidos para las capas y tablas de resultados.
+# El formato se elige con FORMATO_SALIDA en el .env:
+#   geojson   -> GeoJSON vía GDAL (comportamiento original)
+#   parquet   -> GeoParquet (pyarrow)
+#   fgb       -> FlatGeobuf (pyogrio)
+#   geojsonl  -> GeoJSON por líneas, escrito en bloques sin pasar por GDAL
+#   delta     -> solo la tabla link_id → columnas calculadas, sin geometría
+
+EXTENSIONES = {
+    "geojson": ".geojson",
+    "parquet": ".parquet",
+    "fgb": ".fgb",
+    "geojsonl": ".geojsonl",
+    "delta": ".parquet",
+}
+
+
+def formato_salida():
+    """
+    Lee FORMATO_SALIDA del entorno (por defecto 'geojson') y valida que sea conocido.
+    """
+    formato = os.getenv("FORMATO_SALIDA", "geojson").strip().lower()
+    if formato not in EXTENSIONES:
+        raise ValueError(f"FORMATO_SALIDA no reconocido: {formato}. Opciones: {', '.join(EXTENSIONES)}")
+    return formato
+
+
+def ruta_con_formato(ruta, formato):
+    """
+    Cambia la extensión de la ruta por la del formato elegido.
+    """
+    base, _ = os.path.splitext(ruta)
+    return base + EXTENSIONES[formato]
+
+
+def escribir_geojson_lineas(gdf, ruta, tam_bloque=50_000):
+    """
+    Escribe un GeoDataFrame como GeoJSON por líneas (un Feature por línea, RFC 8142).
+    Las geometrías se serializan en bloque con shapely.to_geojson y las propiedades con
+    pandas, así que nunca se arma la colección completa en memoria.
+    """
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    columna_geom = gdf.geometry.name
+
+    with open(ruta, "w", encoding="utf-8") as f:
+        for inicio in range(0, len(gdf), tam_bloque):
+            bloque = gdf.iloc[inicio:inicio + tam_bloque]
+            geoms = shapely.to_geojson(bloque.geometry.values)
+            props = bloque.drop(columns=columna_geom).to_json(
+                orient="records", lines=True, force_ascii=False, date_format="iso"
+            ).splitlines()
+            for p, g in zip(props, geoms):
+                g = "null" if g is None else g
+                f.write(f'{{"type":"Feature","properties":{p},"geometry":{g}}}\n')
+
+
+def escribir_capa(gdf, ruta, formato="geojson"):
+    """
+    Guarda una capa completa en el formato indicado y devuelve la ruta final.
+    """
+    ruta = ruta_con_formato(ruta, formato)
+    if formato == "parquet":
+        gdf.to_parquet(ruta, index=False)
+    elif formato == "fgb":
+        gdf.to_file(ruta, driver="FlatGeobuf", engine="pyogrio")
+    elif formato == "geojsonl":
+        escribir_geojson_lineas(gdf, ruta)
+    elif formato == "geojson":
+        gdf.to_file(ruta, driver="GeoJSON")
+    else:
+        raise ValueError(f"Formato de capa no soportado: {formato}")
+    return ruta
+
+
+def escribir_delta(gdf, ruta, columnas):
+    """
+    Guarda solo link_id y las columnas calculadas (MULTIDIGIT, EXCEPTION_LEGIT, ...)
+    en vez de duplicar toda la capa con sus geometrías. Devuelve la ruta final.
+    """
+    ruta = ruta_con_formato(ruta, "delta")
+    delta = gdf[["link_id", *columnas]].copy()
+    delta.to_parquet(ruta, index=False)
+    return ruta
+
+
+def escribir_csv(df, ruta):
+    """
+    Escribe una tabla de resultados como CSV con pandas. Estos CSV son el contrato de salida:
+    no se usa el escritor de pyarrow porque entrecomilla todo el texto y escribe nulos y
+    booleanos distinto, y el archivo cambiaría según esté instalado o no.
+    """
+    df.to_csv(ruta, index=False)
+    return ruta
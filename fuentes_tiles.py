@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+
+# Fuentes de tiles intercambiables (esquema XYZ, y hacia abajo):
+#   FuenteHERE        -> Raster Tile API v3 de HERE (red, requiere HERE_API_KEY)
+#   FuenteDirectorio  -> carpeta local <raíz>/<z>/<x>/<y>.<formato> (p. ej. un caché ya descargado)
+#   FuenteMBTiles     -> archivo MBTiles (SQLite, filas en esquema TMS)
+# Todas exponen tile(x, y, zoom, tile_format) -> bytes o None, local (si conviene
+# guardarlas en el caché en disco) y plantilla_url() para visores web (folium); las fuentes
+# locales devuelven None y el visor usa OpenStreetMap.
+# FUENTE_TILES elige la fuente: 'here' (por defecto), una ruta a .mbtiles, o una carpeta.
+
+TAMANO_TILE = 512
+URL_HERE = "https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{formato}?apiKey={api_key}&style={estilo}&size={tamano}"
+
+
+class FuenteHERE:
+    local = False
+
+    def __init__(self, api_key, estilo="satellite.day", tamano=TAMANO_TILE, sesion=None, timeout=30):
+        self.api_key = api_key
+        self.estilo = estilo
+        self.tamano = tamano
+        self.sesion = sesion
+        self.timeout = timeout
+
+    def url(self, x, y, zoom, tile_format):
+        return URL_HERE.format(zoom=zoom, x=x, y=y, formato=tile_format, api_key=self.api_key,
+                               estilo=self.estilo, tamano=self.tamano)
+
+    def tile(self, x, y, zoom, tile_format, sesion=None):
+        """
+        Descarga el tile. Devuelve None si no hay api_key o si la respuesta no es 200.
+        """
+        if not self.api_key:
+            return None
+        sesion = sesion or self.sesion
+        if sesion is None:
+            import requests
+            sesion = requests
+        response = sesion.get(self.url(x, y, zoom, tile_format), timeout=self.timeout)
+        if response.status_code != 200:
+            print(f"Falló la descarga de imagen: {response.status_code}")
+            return None
+        return response.content
+
+    def plantilla_url(self, estilo=None, tile_format="png", tamano=256):
+        """
+        Plantilla {z}/{x}/{y} para capas de folium / Leaflet.
+        """
+        return URL_HERE.format(zoom="{z}", x="{x}", y="{y}", formato=tile_format, api_key=self.api_key,
+                               estilo=estilo or self.estilo, tamano=tamano)
+
+
+class FuenteDirectorio:
+    local = True
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+
+    def ruta(self, x, y, zoom, tile_format):
+        return os.path.join(self.raiz, str(zoom), str(x), f"{y}.{tile_format}")
+
+    def tile(self, x, y, zoom, tile_format, sesion=None):
+        ruta = self.ruta(x, y, zoom, tile_format)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, "rb") as f:
+            return f.read()
+
+    def plantilla_url(self, estilo=None, tile_format="png", tamano=256):
+        # Una ruta del sistema de archivos no se puede cargar desde la página de Leaflet
+        # (y una URL file:// tampoco, por las restricciones del navegador)
+        return None
+
+
+class FuenteMBTiles:
+    """
+    Lectura de un MBTiles de solo lectura. Cada hilo abre su propia conexión SQLite.
+    El formato de los tiles lo fija el archivo, así que tile_format se ignora.
+    """
+    local = True
+
+    def __init__(self, ruta):
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(f"No existe el archivo MBTiles: {ruta}")
+        self.ruta = ruta
+        self._local = threading.local()
+
+    def _conexion(self):
+        if not hasattr(self._local, "conexion"):
+            self._local.conexion = sqlite3.connect(f"file:{self.ruta}?mode=ro", uri=True, check_same_thread=False)
+        return self._local.conexion
+
+    def tile(self, x, y, zoom, tile_format=None, sesion=None):
+        fila_tms = (2 ** zoom - 1) - y
+        fila = self._conexion().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, fila_tms),
+        ).fetchone()
+        return bytes(fila[0]) if fila else None
+
+    def metadatos(self):
+        return dict(self._conexion().execute("SELECT name, value FROM metadata").fetchall())
+
+    def plantilla_url(self, estilo=None, tile_format="png", tamano=256):
+        # Un navegador no puede leer el SQLite directamente
+        return None
+
+
+def crear_fuente(especificacion, api_key=None, sesion=None):
+    """
+    'here' -> FuenteHERE; ruta terminada en .mbtiles -> FuenteMBTiles; otra ruta -> FuenteDirectorio.
+    """
+    if not especificacion or especificacion.lower() == "here":
+        return FuenteHERE(api_key, sesion=sesion)
+    if especificacion.lower().endswith(".mbtiles"):
+        return FuenteMBTiles(especificacion)
+    if not os.path.isdir(especificacion):
+        raise FileNotFoundError(f"FUENTE_TILES no es 'here', un .mbtiles ni una carpeta: {especificacion}")
+    return FuenteDirectorio(especificacion)
+
+
+_FUENTES = {}
+_FUENTES_CANDADO = threading.Lock()
+
+
+def fuente_tiles(api_key=None):
+    """
+    Fuente configurada en FUENTE_TILES, una instancia por (especificación, api_key) en el proceso.
+    """
+    especificacion = os.getenv("FUENTE_TILES", "here")
+    clave = (especificacion, api_key)
+    with _FUENTES_CANDADO:
+        if clave not in _FUENTES:
+            _FUENTES[clave] = crear_fuente(especificacion, api_key)
+        return _FUENTES[clave]
@@ -0,0 +1,249 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import shapely
+
+from vecinos import detectar_vecinos, marcar_validos, DISTANCIA_BUFFER, LONGITUD_MINIMA
+from tiles import tiles_vectorizados
+
+# Grafo de vecinos persistido junto a los datos.
+# Las relaciones de calzada paralela entre links se guardan como una matriz dispersa CSR
+# (link_ids ordenados, indptr, indices) con los atributos de cada arista (angle_diff,
+# overlap_ratio, centroid_distance). Se guardan todos los pares candidatos, no solo los
+# válidos, para que el criterio se pueda aplicar al cargar y para saber qué links se
+# tocan cuando algo cambia.
+#
+# Invalidación por tile: cada segmento pertenece al tile (zoom 14) de su centroide y por
+# tile se guarda una huella de los link_id y geometrías que contiene. Al cargar, solo se
+# recalculan los segmentos de los tiles cuya huella cambió y los que están a su alrededor.
+
+VERSION = 1
+ZOOM_PARTICION = 14
+
+
+def normalizar_link_ids(link_ids):
+    """
+    link_id como int64 si todos son numéricos y, si no, como texto (sin objetos de Python,
+    para que el archivo .npz se pueda leer sin pickle).
+    """
+    serie = pd.Series(link_ids).reset_index(drop=True)
+    numericos = pd.to_numeric(serie, errors="coerce")
+    if numericos.notna().all():
+        return numericos.astype(np.int64).to_numpy()
+    return serie.astype(str).to_numpy(dtype=str)
+
+
+def claves_tile(gdf, zoom=ZOOM_PARTICION):
+    """
+    Clave int64 (x * 2^zoom + y) del tile que contiene el centroide de cada segmento.
+    """
+    centroides = gdf.geometry.centroid.to_crs(epsg=4326)
+    x, y = tiles_vectorizados(centroides.y.to_numpy(), centroides.x.to_numpy(), zoom)
+    return x * (2 ** zoom) + y
+
+
+def huellas_por_tile(geoms, link_ids, tile_de_fila):
+    """
+    Huella (blake2b de 16 bytes) de los link_id y geometrías WKB de cada tile.
+    Devuelve (tiles ordenados, huellas).
+    """
+    wkb = shapely.to_wkb(np.asarray(geoms, dtype=object))
+    orden = np.lexsort((link_ids, tile_de_fila))
+    tiles_ordenados = tile_de_fila[orden]
+    tiles, inicios = np.unique(tiles_ordenados, return_index=True)
+    fines = np.append(inicios[1:], len(orden))
+
+    huellas = np.empty(len(tiles), dtype="S16")
+    for k, (inicio, fin) in enumerate(zip(inicios, fines)):
+        h = hashlib.blake2b(digest_size=16)
+        for fila in orden[inicio:fin]:
+            h.update(str(link_ids[fila]).encode())
+            h.update(wkb[fila] or b"")
+        huellas[k] = h.digest()
+    return tiles, huellas
+
+
+class GrafoVecinos:
+    """
+    Adyacencia CSR por link_id con atributos por arista y huellas por tile.
+    """
+
+    CAMPOS = ("link_ids", "indptr", "indices", "angle_diff", "overlap_ratio",
+              "centroid_distance", "tile_de_link", "tiles", "huellas", "parametros")
+
+    def __init__(self, **arreglos):
+        for campo in self.CAMPOS:
+            setattr(self, campo, arreglos[campo])
+
+    @classmethod
+    def desde_pares(cls, pares, link_ids, tile_de_fila, tiles, huellas):
+        """
+        Construye el grafo a partir de pares en posiciones de fila (salida de detectar_vecinos).
+        """
+        orden_links = np.argsort(link_ids, kind="stable")
+        fila_a_nodo = np.empty(len(link_ids), dtype=np.int64)
+        fila_a_nodo[orden_links] = np.arange(len(link_ids))
+
+        origen = fila_a_nodo[pares["i"].to_numpy()]
+        destino = fila_a_nodo[pares["j"].to_numpy()]
+        orden = np.lexsort((destino, origen))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(origen, minlength=len(link_ids)))])
+
+        return cls(
+            link_ids=link_ids[orden_links],
+            indptr=indptr.astype(np.int64),
+            indices=destino[orden].astype(np.int64),
+            angle_diff=pares["angle_diff"].to_numpy()[orden],
+            overlap_ratio=pares["overlap_ratio"].to_numpy()[orden],
+            centroid_distance=pares["centroid_distance"].to_numpy()[orden],
+            tile_de_link=tile_de_fila[orden_links],
+            tiles=tiles,
+            huellas=huellas,
+            parametros=np.array([VERSION, DISTANCIA_BUFFER, LONGITUD_MINIMA, ZOOM_PARTICION], dtype=np.float64),
+        )
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta, allow_pickle=False) as datos:
+            return cls(**{campo: datos[campo] for campo in cls.CAMPOS})
+
+    def guardar(self, ruta):
+        """
+        Escribe el .npz a un temporal y lo renombra, para que un lector nunca vea un archivo a medias.
+        """
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, **{campo: getattr(self, campo) for campo in self.CAMPOS})
+        os.replace(temporal, ruta)
+
+    def compatible(self):
+        actuales = np.array([VERSION, DISTANCIA_BUFFER, LONGITUD_MINIMA, ZOOM_PARTICION], dtype=np.float64)
+        return self.parametros.shape == actuales.shape and np.array_equal(self.parametros, actuales)
+
+    def aristas(self):
+        """
+        DataFrame de aristas con link_id de origen y destino y sus atributos.
+        """
+        origen = np.repeat(np.arange(len(self.link_ids)), np.diff(self.indptr))
+        return pd.DataFrame({
+            "link_origen": self.link_ids[origen],
+            "link_destino": self.link_ids[self.indices],
+            "angle_diff": self.angle_diff,
+            "overlap_ratio": self.overlap_ratio,
+            "centroid_distance": self.centroid_distance,
+        })
+
+    def tiles_sucios(self, tiles, huellas):
+        """
+        Tiles cuya huella cambió, más los que aparecieron o desaparecieron.
+        """
+        anteriores = dict(zip(self.tiles.tolist(), self.huellas.tolist()))
+        actuales = dict(zip(tiles.tolist(), huellas.tolist()))
+        sucios = {t for t in anteriores.keys() | actuales.keys() if anteriores.get(t) != actuales.get(t)}
+        return np.array(sorted(sucios), dtype=np.int64)
+
+
+def _aristas_a_pares(aristas, link_ids):
+    """
+    Convierte aristas por link_id a pares en posiciones de fila de la capa actual.
+    """
+    indice = pd.Index(link_ids)
+    i = indice.get_indexer(aristas["link_origen"])
+    j = indice.get_indexer(aristas["link_destino"])
+    pares = pd.DataFrame({
+        "i": i,
+        "j": j,
+        "angle_diff": aristas["angle_diff"].to_numpy(),
+        "overlap_ratio": aristas["overlap_ratio"].to_numpy(),
+        "centroid_distance": aristas["centroid_distance"].to_numpy(),
+    })
+    return pares[(pares["i"] >= 0) & (pares["j"] >= 0)]
+
+
+def _ordenar(pares):
+    return pares.sort_values(["i", "j"], kind="stable").reset_index(drop=True)
+
+
+def ruta_grafo(fuentes, directorio=None):
+    """
+    Ruta del grafo para un conjunto de archivos de entrada, dentro de GRAFO_VECINOS.
+    Devuelve None si la persistencia no está activada.
+    """
+    directorio = directorio or os.getenv("GRAFO_VECINOS")
+    if not directorio:
+        return None
+    nombres = "|".join(sorted(os.path.basename(f) for f in fuentes))
+    return os.path.join(directorio, f"grafo_{hashlib.sha1(nombres.encode()).hexdigest()[:12]}.npz")
+
+
+def vecinos_persistidos(gdf, fuentes, directorio=None, consultas=None):
+    """
+    Igual que detectar_vecinos, pero usando y manteniendo el grafo persistido.
+    Sin GRAFO_VECINOS (o con link_id duplicados) calcula todo como siempre.
+    consultas (máscara del prefiltro) solo se aplica sin grafo: el grafo guarda los
+    pares de todos los segmentos para poder reutilizarse desde cualquier script.
+    """
+    ruta = ruta_grafo(fuentes, directorio)
+    if ruta is None:
+        return detectar_vecinos(gdf, consultas=consultas)
+
+    link_ids = normalizar_link_ids(gdf["link_id"])
+    if pd.Index(link_ids).has_duplicates:
+        print("Hay link_id duplicados; el grafo de vecinos no se usa en esta corrida.")
+        return detectar_vecinos(gdf, consultas=consultas)
+
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    tile_de_fila = claves_tile(gdf)
+    tiles, huellas = huellas_por_tile(geoms, link_ids, tile_de_fila)
+
+    anterior = None
+    if os.path.exists(ruta):
+        anterior = GrafoVecinos.cargar(ruta)
+        if not anterior.compatible():
+            anterior = None
+
+    if anterior is None:
+        pares = detectar_vecinos(gdf)
+        print(f"Grafo de vecinos creado: {ruta}")
+    else:
+        sucios = anterior.tiles_sucios(tiles, huellas)
+        if len(sucios) == 0:
+            print(f"Grafo de vecinos cargado: {ruta}")
+            return marcar_validos(_ordenar(_aristas_a_pares(anterior.aristas(), link_ids)))
+        pares = _actualizar(gdf, geoms, link_ids, tile_de_fila, anterior, sucios)
+        print(f"Grafo de vecinos actualizado ({len(sucios)} tiles recalculados): {ruta}")
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    GrafoVecinos.desde_pares(pares, link_ids, tile_de_fila, tiles, huellas).guardar(ruta)
+    return pares
+
+
+def _actualizar(gdf, geoms, link_ids, tile_de_fila, anterior, sucios):
+    """
+    Recalcula solo los segmentos afectados por los tiles sucios y conserva el resto de aristas.
+    """
+    aristas = anterior.aristas()
+
+    # Links cambiados: los que hoy caen en un tile sucio y los que caían ahí antes
+    cambiados = np.union1d(
+        link_ids[np.isin(tile_de_fila, sucios)],
+        anterior.link_ids[np.isin(anterior.tile_de_link, sucios)],
+    )
+    # Segmentos que tenían aristas con un link cambiado
+    toca = np.isin(aristas["link_origen"], cambiados) | np.isin(aristas["link_destino"], cambiados)
+    afectados = np.union1d(aristas.loc[toca, "link_origen"], aristas.loc[toca, "link_destino"])
+
+    consultas = np.isin(link_ids, cambiados) | np.isin(link_ids, afectados)
+    # Segmentos cerca de la geometría nueva de los cambiados (con margen, porque el buffer
+    # poligonal no es exactamente simétrico)
+    filas_cambiadas = np.flatnonzero(np.isin(link_ids, cambiados))
+    if len(filas_cambiadas):
+        arbol = shapely.STRtree(geoms)
+        cercanos = arbol.query(shapely.buffer(geoms[filas_cambiadas], 2 * DISTANCIA_BUFFER), predicate="intersects")[1]
+        consultas[cercanos] = True
+
+    nuevos = detectar_vecinos(gdf, consultas=consultas)
+    conservadas = _aristas_a_pares(aristas[~np.isin(aristas["link_origen"], link_ids[consultas])], link_ids)
+    conservadas = marcar_validos(conservadas)
+    return _ordenar(pd.concat([conservadas, nuevos], ignore_index=True))
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from pandas.api.extensions import take
+
+from esquema import tipar_pois, tipar_calles
+
+# Unión POI ↔ link por índice hash.
+# Se arma un único índice de link_id con todos los archivos de calles y cada POI se resuelve
+# contra él en una sola pasada (pd.Index.get_indexer). Las columnas que se necesiten del link
+# (geometría, MULTIDIGIT, EXCEPTION_LEGIT, ...) se toman por posición, sin merges repetidos,
+# y los POIs cuyo link no aparece se reportan por archivo de origen en lugar de perderse.
+
+COLUMNA_FUENTE_POI = "ARCHIVO_POI"
+COLUMNA_FUENTE_CALLE = "ARCHIVO_CALLE"
+
+
+def cargar_pois(rutas):
+    """
+    Concatena los CSV de POIs, anota el archivo de origen de cada fila y aplica el esquema.
+    """
+    if not rutas:
+        raise FileNotFoundError("No se encontró ningún archivo CSV de POIs")
+    partes = [pd.read_csv(f).assign(**{COLUMNA_FUENTE_POI: os.path.basename(f)}) for f in rutas]
+    df = pd.concat(partes, ignore_index=True)
+    df[COLUMNA_FUENTE_POI] = df[COLUMNA_FUENTE_POI].astype("category")
+    return tipar_pois(df)
+
+
+def cargar_calles(rutas):
+    """
+    Concatena archivos GeoJSON de calles, anota el archivo de origen y aplica el esquema.
+    """
+    if not rutas:
+        raise FileNotFoundError("No se encontró ningún archivo GeoJSON de calles")
+    partes = [gpd.read_file(f).assign(**{COLUMNA_FUENTE_CALLE: os.path.basename(f)}) for f in rutas]
+    gdf = gpd.GeoDataFrame(pd.concat(partes, ignore_index=True))
+    gdf[COLUMNA_FUENTE_CALLE] = gdf[COLUMNA_FUENTE_CALLE].astype("category")
+    return tipar_calles(gdf)
+
+
+class IndiceLinks:
+    """
+    Índice hash global de link_id sobre una tabla de calles. Si un link_id aparece en más
+    de un archivo se conserva la primera aparición. Las calles sin link_id no entran al
+    índice: get_indexer empareja nulo con nulo y les asignaría todos los POIs sin LINK_ID.
+    """
+
+    def __init__(self, calles):
+        nulos = calles["link_id"].isna().to_numpy()
+        if nulos.any():
+            print(f"Calles sin link_id: {int(nulos.sum())} (no entran al índice)")
+            calles = calles[~nulos]
+        duplicados = calles["link_id"].duplicated(keep="first")
+        if duplicados.any():
+            print(f"link_id repetidos entre archivos de calles: {int(duplicados.sum())} (se usa la primera aparición)")
+        self.calles = calles[~duplicados.to_numpy()].reset_index(drop=True)
+        self.indice = pd.Index(self.calles["link_id"])
+
+    def resolver(self, link_ids):
+        """
+        Posición de cada link_id en la tabla de calles, o -1 si no existe.
+        """
+        return self.indice.get_indexer(pd.Index(link_ids))
+
+    def tomar(self, posiciones, columna):
+        """
+        Valores de una columna de calles en las posiciones dadas (nulo donde la posición es -1).
+        """
+        return take(self.calles[columna].array, np.asarray(posiciones), allow_fill=True)
+
+    def valores_para(self, link_ids, columna):
+        """
+        Atajo: resuelve los link_id y toma la columna en una sola llamada.
+        """
+        return self.tomar(self.resolver(link_ids), columna)
+
+
+def reporte_sin_link(df_pois, posiciones, columna_fuente=COLUMNA_FUENTE_POI):
+    """
+    Resumen por archivo de POIs: total de filas, cuántas no encontraron su link y el porcentaje.
+    """
+    sin_link = pd.Series(np.asarray(posiciones) < 0, index=df_pois.index)
+    resumen = sin_link.groupby(df_pois[columna_fuente], observed=True).agg(["size", "sum"])
+    resumen.columns = ["pois", "sin_link"]
+    resumen["porcentaje"] = (100.0 * resumen["sin_link"] / resumen["pois"]).round(2)
+    return resumen.reset_index()
@@ -0,0 +1,60 @@
+import numpy as np
+import shapely
+
+from partes import parte_mas_cercana
+
+# Evaluación de lado vectorizada: las mismas reglas que lado_declaro,
+# calcular_lado_geometrico y evaluar_discrepancia de main_validation.py (que se conservan
+# como referencia para regresion.py), aplicadas con NumPy/shapely sobre todos los POIs a la vez.
+
+
+def lados_declarados(percfrref):
+    """
+    PERCFRREF (0-1000) -> 'L' (< 30 %), 'R' (> 70 %), 'center' o 'unknown' si falta.
+    """
+    pct = np.asarray(percfrref, dtype=float) / 1000.0
+    return np.select(
+        [np.isnan(pct), pct < 0.3, pct > 0.7],
+        ["unknown", "L", "R"],
+        default="center",
+    ).astype(object)
+
+
+def lados_geometricos(puntos, lineas):
+    """
+    Lado del punto respecto a la recta entre el primer y el último vértice de la línea,
+    por el signo del producto cruzado. En un MultiLineString se usa la parte más cercana
+    al punto. 'unknown' si falta alguna geometría, si no son Point / LineString /
+    MultiLineString o si la línea tiene menos de dos vértices.
+    """
+    puntos = np.asarray(puntos, dtype=object)
+    lineas = parte_mas_cercana(lineas, puntos)
+    validos = (
+        (shapely.get_type_id(puntos) == shapely.GeometryType.POINT) &
+        (shapely.get_type_id(lineas) == shapely.GeometryType.LINESTRING) &
+        ~shapely.is_empty(puntos)
+    )
+    validos &= shapely.get_num_points(lineas) >= 2
+
+    lados = np.full(len(puntos), "unknown", dtype=object)
+    if not validos.any():
+        return lados
+
+    inicio = shapely.get_point(lineas[validos], 0)
+    fin = shapely.get_point(lineas[validos], -1)
+    x1, y1 = shapely.get_x(inicio), shapely.get_y(inicio)
+    dx, dy = shapely.get_x(fin) - x1, shapely.get_y(fin) - y1
+    dxp, dyp = shapely.get_x(puntos[validos]) - x1, shapely.get_y(puntos[validos]) - y1
+    cross = dx * dyp - dy * dxp
+    lados[validos] = np.select([cross > 0, cross < 0], ["L", "R"], default="center")
+    return lados
+
+
+def evaluar_lados(declarados, geometricos):
+    """
+    'relink' cuando ambos lados son L/R y no coinciden; 'ok' en cualquier otro caso.
+    """
+    declarados = np.asarray(declarados, dtype=object)
+    geometricos = np.asarray(geometricos, dtype=object)
+    definidos = np.isin(declarados, ["L", "R"]) & np.isin(geometricos, ["L", "R"])
+    return np.where(definidos & (declarados != geometricos), "relink", "ok").astype(object)
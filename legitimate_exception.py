@@ -1,78 +1,59 @@
 import os
-import math
+import sys
 import glob
-import geopandas as gpd
-from shapely.geometry import LineString
-import folium
+from dotenv import load_dotenv
+from vecinos import contar_vecinos
+from grafo_vecinos import vecinos_persistidos
+from prefiltro_vecinos import consultas_necesarias, imprimir_prefiltro
+from exportar import formato_salida, escribir_capa, escribir_delta
+from borde_tiles import cargar_con_borde
 
-# Función para calcular el ángulo de un segmento LineString respecto al eje X
-def calculate_angle(line: LineString):
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return None
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    return math.degrees(math.atan2(y2 - y1, x2 - x1)) % 180
+load_dotenv()
 
 # Buscar archivos GeoJSON de calles de navegación
 archivos = sorted(glob.glob("STREETS_NAV/*.geojson"))
 if not archivos:
     raise FileNotFoundError("No se encontró ningún archivo en STREETS_NAV/")
 
-# Seleccionar el primer archivo encontrado
-archivo = archivos[0]
+# Archivo a analizar: el indicado en la línea de comandos o, si no, el primero encontrado.
+# Así se pueden correr varios archivos en paralelo (python legitimate_exception.py STREETS_NAV/x.geojson)
+archivo = sys.argv[1] if len(sys.argv) > 1 else archivos[0]
 print(f"Analizando archivo: {os.path.basename(archivo)}")
 
-# Leer el archivo GeoJSON como GeoDataFrame
-gdf = gpd.read_file(archivo)
-gdf = gdf[gdf.geometry.type == "LineString"]
-gdf = gdf.to_crs(epsg=3857)
+# Leer el archivo más los segmentos de los archivos vecinos a menos de 25 m de su borde,
+# para que una calzada paralela en el tile de al lado también cuente
+gdf, es_borde, aportaron = cargar_con_borde(archivo, archivos)
+if aportaron:
+    print(f"Segmentos de borde agregados: {int(es_borde.sum())} de {len(aportaron)} archivos vecinos")
 gdf["EXCEPTION_LEGIT"] = "NO"
 
-# Recorrer cada segmento de calle
-for idx, segment in gdf.iterrows():
-    geom = segment.geometry
-    link_id = segment.get("link_id")
+# Solo se buscan vecinos de los links propios con MULTIDIGIT original YES y más de 10 m;
+# el resto queda en NO sin importar los vecinos (todos siguen siendo vecinos posibles)
+consultas, reporte = consultas_necesarias(gdf, "excepcion", es_borde)
+imprimir_prefiltro(gdf, consultas, reporte)
 
-    if geom.length < 5:
-        continue
+# Detectar vecinos paralelos de los segmentos consultados en un solo paso vectorizado
+pares = vecinos_persistidos(gdf, [archivo, *aportaron], consultas=consultas)
+num_vecinos = contar_vecinos(pares, len(gdf))
 
-    angle_segment = calculate_angle(geom)
-    if angle_segment is None:
-        continue
+multidigit = gdf["MULTIDIGIT"].astype(str).str.strip().str.upper()
+es_excepcion = (
+    multidigit.isin(["YES", "Y"]).to_numpy() &
+    (num_vecinos >= 1) &
+    (gdf.geometry.length > 10).to_numpy()
+)
+gdf.loc[es_excepcion, "EXCEPTION_LEGIT"] = "YES"
 
-    buffer = geom.buffer(25)
-    nearby = gdf[
-        (gdf.geometry.intersects(buffer)) &
-        (gdf["link_id"] != link_id) &
-        (gdf.index != idx)
-    ]
+# Los segmentos de borde solo sirven como vecinos; se escriben en la corrida de su propio archivo
+gdf = gdf[~es_borde]
 
-    valid_neighbors = []
-    for _, neighbor in nearby.iterrows():
-        angle_neighbor = calculate_angle(neighbor.geometry)
-        if angle_neighbor is None:
-            continue
-        
-        # Calcular diferencia de ángulo
-        angle_diff = abs(angle_segment - angle_neighbor)
-        if angle_diff > 90:
-            angle_diff = 180 - angle_diff
-
-        overlap = geom.intersection(neighbor.geometry)
-        overlap_ratio = overlap.length / geom.length if geom.length > 0 else 0
-        centroid_distance = geom.centroid.distance(neighbor.geometry.centroid)
-
-        if angle_diff <= 20 and (overlap_ratio >= 0.05 or centroid_distance < 25):
-            valid_neighbors.append(neighbor)
-
-    multidigit = str(segment.get("MULTIDIGIT", "NO")).strip().upper()
-    if multidigit in ["YES", "Y"] and len(valid_neighbors) >= 1 and geom.length > 10:
-        gdf.at[idx, "EXCEPTION_LEGIT"] = "YES"
-        
-# Guardar el resultado en un nuevo archivo GeoJSON
+# Guardar el resultado (capa completa o solo la tabla delta link_id → EXCEPTION_LEGIT)
 output_path = os.path.join("STREETS_NAV", f"EXCEPCIONES_{os.path.basename(archivo)}")
-gdf.to_file(output_path, driver="GeoJSON")
+formato = formato_salida()
+if formato == "delta":
+    output_path = escribir_delta(gdf, output_path, ["EXCEPTION_LEGIT"])
+else:
+    output_path = escribir_capa(gdf, output_path, formato)
 
 print(f"\nArchivo con excepciones guardado como: {output_path}")
 print("Excepciones legítimas detectadas:", (gdf["EXCEPTION_LEGIT"] == "YES").sum())
\ No newline at end of file
@@ -1,63 +1,113 @@
 import os
-import math
 import glob
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import LineString, Point
 from dotenv import load_dotenv
+from vecinos import contar_vecinos, LONGITUD_MINIMA
+from grafo_vecinos import vecinos_persistidos
+from partes import solo_lineas
+from exportar import formato_salida, escribir_capa, escribir_delta, escribir_csv
+from almacen_geometria import AlmacenGeometria
+from esquema import tipar_calles, tipar_resultados, multidigit_bool
+from piramide import directorio_piramide, exportar_piramide
+from indice_links import IndiceLinks, cargar_pois, cargar_calles, reporte_sin_link
+from lados import lados_declarados, lados_geometricos, evaluar_lados
+from medicion import etapa, contar, medidor_desde_entorno, cerrar_medicion
+from duplicados_pois import distancia_duplicados, colapsar_duplicados
+from reasociacion import reasociar_relink, MARGEN_CANDIDATOS
+from puntos_control import puntos_control_desde_entorno
 
-# === CARGAR VARIABLES DE ENTORNO ===
-load_dotenv()
-api_key = os.getenv("HERE_API_KEY")
-if not api_key:
-    raise ValueError("HERE_API_KEY no encontrado en .env")
+# Pipeline de validación completo, separado en etapas importables:
+#   cargar_datos -> unir_pois -> [colapsar_duplicados] -> evaluar_lado -> reasociar_relink -> evaluar_segmentos -> evaluar_multidigit -> exportar_resultados
+# Cada etapa corre dentro de medicion.etapa(...), así un perfil (PERFIL_PIPELINE) o un
+# cProfile muestran el costo por etapa en vez de un único marco <module>.
 
-# === FUNCIONES ===
-def calculate_angle(line: LineString):
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return None
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    return math.degrees(math.atan2(y2 - y1, x2 - x1)) % 180
 
 # === CARGA DE DATOS ===
-csv_files = sorted(glob.glob("POIs/*.csv"))[:1]
-df_pois = pd.concat([pd.read_csv(f) for f in csv_files], ignore_index=True)
-
-geojson_calles = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))[:1]
-gdf_calles = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_calles], ignore_index=True))
-
-geojson_nav = sorted(glob.glob("STREETS_NAV/*.geojson"))[:1]
-gdf_nav = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_nav], ignore_index=True))
-
-# === AGREGAR MULTIDIGIT A gdf_calles DESDE gdf_nav ===
-if 'link_id' in gdf_nav.columns and 'MULTIDIGIT' in gdf_nav.columns:
-    gdf_nav['link_id'] = gdf_nav['link_id'].astype(str)
-    gdf_calles['link_id'] = gdf_calles['link_id'].astype(str)
-    gdf_calles = gdf_calles.merge(
-        gdf_nav[['link_id', 'MULTIDIGIT']],
-        on='link_id',
-        how='left'
-    )
-
-# === MERGE POIs ===
-df_merge = df_pois.merge(
-    gdf_calles[['link_id', 'geometry', 'MULTIDIGIT']],
-    left_on='LINK_ID',
-    right_on='link_id',
-    how='left'
-)
-
-# === CENTROIDES ===
-gdf_pois = gpd.GeoDataFrame(df_merge, geometry='geometry', crs=gdf_calles.crs)
-gdf_pois = gdf_pois.to_crs(epsg=3857)
-gdf_pois['geometry'] = gdf_pois['geometry'].centroid
-gdf_pois = gdf_pois.to_crs(epsg=4326)
+def cargar_datos():
+    """
+    Lee todos los POIs, las calles (GeoJSON o almacén binario) y STREETS_NAV.
+    Todos los archivos: un POI puede apuntar a un link que vive en otro archivo de calles.
+    """
+    csv_files = sorted(glob.glob("POIs/*.csv"))
+    df_pois = cargar_pois(csv_files)
 
-# === EVALUACIÓN DE LADO ===
-gdf_pois['PERCFRREF_NORM'] = gdf_pois['PERCFRREF'] / 1000.0
+    # Si hay un almacén binario (python almacen_geometria.py), solo se construyen las
+    # geometrías de los links que usan los POIs en vez de parsear los GeoJSON completos
+    ruta_almacen = os.getenv("ALMACEN_CALLES")
+    if ruta_almacen:
+        gdf_calles = tipar_calles(AlmacenGeometria(ruta_almacen).a_geodataframe(df_pois['LINK_ID']))
+    else:
+        geojson_calles = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))
+        gdf_calles = cargar_calles(geojson_calles)
+
+    geojson_nav = sorted(glob.glob("STREETS_NAV/*.geojson"))
+    gdf_nav = cargar_calles(geojson_nav)
+    contar("pois_cargados", len(df_pois))
+    contar("segmentos_nav", len(gdf_nav))
+    return df_pois, gdf_calles, gdf_nav, geojson_nav
+
+
+# === UNIÓN POIs ↔ LINKS (una sola pasada) ===
+def unir_pois(df_pois, gdf_calles, gdf_nav):
+    """
+    Resuelve cada POI contra el índice global de links y lo ubica en el centroide del link.
+    Los POIs sin link se escriben en pois_sin_link.csv. Devuelve (gdf_pois, cantidad sin link).
+    """
+    indice_calles = IndiceLinks(gdf_calles)
+    if 'link_id' in gdf_nav.columns and 'MULTIDIGIT' in gdf_nav.columns:
+        # MULTIDIGIT normalizado una sola vez a booleano
+        multidigit_calles = IndiceLinks(gdf_nav).valores_para(indice_calles.calles['link_id'], 'MULTIDIGIT')
+        indice_calles.calles['MULTIDIGIT'] = multidigit_bool(pd.Series(multidigit_calles)).to_numpy()
+
+    pos_links = indice_calles.resolver(df_pois['LINK_ID'])
+    resumen_sin_link = reporte_sin_link(df_pois, pos_links)
+    for fila in resumen_sin_link[resumen_sin_link['sin_link'] > 0].itertuples():
+        print(f"⚠️ {fila.ARCHIVO_POI}: {fila.sin_link} de {fila.pois} POIs sin link ({fila.porcentaje}%)")
+    encontrados = pos_links >= 0
+    escribir_csv(df_pois.loc[~encontrados, ['POI_ID', 'POI_NAME', 'LINK_ID', 'ARCHIVO_POI']], "pois_sin_link.csv")
 
+    df_pois = df_pois[encontrados].reset_index(drop=True)
+    pos_links = pos_links[encontrados]
+    lineas = indice_calles.tomar(pos_links, 'geometry')
+    columnas_link = {'link_id': indice_calles.tomar(pos_links, 'link_id')}
+    if 'MULTIDIGIT' in indice_calles.calles.columns:
+        columnas_link['MULTIDIGIT'] = indice_calles.tomar(pos_links, 'MULTIDIGIT')
+
+    # === CENTROIDES ===
+    gdf_pois = gpd.GeoDataFrame(df_pois.assign(**columnas_link), geometry=lineas, crs=gdf_calles.crs)
+    gdf_pois = gdf_pois.to_crs(epsg=3857)
+    gdf_pois['geometry'] = gdf_pois['geometry'].centroid
+    gdf_pois = gdf_pois.to_crs(epsg=4326)
+    # La línea del link se toma de las mismas posiciones, sin un segundo merge
+    gdf_pois['geometry_right'] = gpd.GeoSeries(lineas, index=gdf_pois.index, crs=gdf_calles.crs)
+    return gdf_pois, int((~encontrados).sum())
+
+
+def calles_para_relink(relink, gdf_calles):
+    """
+    Links entre los que reasociar_relink busca candidatos. Sin ALMACEN_CALLES son todas las
+    calles ya leídas; con el almacén gdf_calles solo trae los links de los POIs, así que se
+    cargan del almacén los links cuyo bbox queda a menos de (distancia al link actual +
+    MARGEN_CANDIDATOS) de algún POI. El link más cercano nunca está más lejos que el
+    actual, por eso esa ventana contiene todos los candidatos que daría la capa completa.
+    """
+    ruta_almacen = os.getenv("ALMACEN_CALLES")
+    if not ruta_almacen:
+        return gdf_calles
+    almacen = AlmacenGeometria(ruta_almacen)
+    puntos = relink.geometry.to_crs(epsg=3857)
+    puntos = puntos[~puntos.is_empty & puntos.notna()]
+    lineas = gpd.GeoSeries(relink['geometry_right'], crs=gdf_calles.crs).to_crs(epsg=3857).loc[puntos.index]
+    radios = puntos.distance(lineas).fillna(0).to_numpy() + MARGEN_CANDIDATOS
+    # El envolvente se toma después de reproyectar el buffer, así la ventana lo cubre entero
+    ventanas = puntos.buffer(radios).to_crs(almacen.crs).envelope
+    return tipar_calles(almacen.a_geodataframe_en_ventanas(ventanas.values))
+
+
+# === EVALUACIÓN DE LADO ===
 def lado_declaro(pct):
     if pd.isna(pct):
         return 'unknown'
@@ -68,10 +118,6 @@ def lado_declaro(pct):
     else:
         return 'center'
 
-gdf_pois['DECLARED_SIDE'] = gdf_pois['PERCFRREF_NORM'].apply(lado_declaro)
-
-gdf_pois = gdf_pois.merge(gdf_calles[['link_id', 'geometry']], on='link_id', how='left', suffixes=('', '_right'))
-gdf_pois = gdf_pois[~gdf_pois['geometry_right'].isna()].copy()
 
 def calcular_lado_geometrico(poi_point, line):
     if not isinstance(line, LineString) or not isinstance(poi_point, Point):
@@ -91,83 +137,173 @@ def calcular_lado_geometrico(poi_point, line):
     else:
         return 'center'
 
-gdf_pois['GEOMETRIC_SIDE'] = gdf_pois.apply(lambda row: calcular_lado_geometrico(row.geometry, row.geometry_right), axis=1)
 
 def evaluar_discrepancia(declared, geo):
     if declared in ['L', 'R'] and geo in ['L', 'R'] and declared != geo:
         return 'relink'
     return 'ok'
 
-gdf_pois['EVAL_SIDE'] = gdf_pois.apply(lambda row: evaluar_discrepancia(row['DECLARED_SIDE'], row['GEOMETRIC_SIDE']), axis=1)
+
+def evaluar_lado(gdf_pois):
+    """
+    DECLARED_SIDE (PERCFRREF), GEOMETRIC_SIDE (producto cruzado) y EVAL_SIDE, con el motor
+    vectorizado de lados.py. Las funciones de arriba son la referencia fila por fila que
+    regresion.py compara contra este motor.
+    """
+    gdf_pois['PERCFRREF_NORM'] = gdf_pois['PERCFRREF'] / 1000.0
+    gdf_pois['DECLARED_SIDE'] = lados_declarados(gdf_pois['PERCFRREF'].to_numpy(dtype=float))
+    gdf_pois['GEOMETRIC_SIDE'] = lados_geometricos(gdf_pois.geometry.values, gdf_pois['geometry_right'].values)
+    gdf_pois['EVAL_SIDE'] = evaluar_lados(gdf_pois['DECLARED_SIDE'].to_numpy(), gdf_pois['GEOMETRIC_SIDE'].to_numpy())
+    contar("evaluaciones_lado", len(gdf_pois))
+    return gdf_pois
+
 
 # === EXCEPCIONES LEGÍTIMAS Y MULTIDIGIT ===
-gdf_nav = gdf_nav[gdf_nav.geometry.type == "LineString"].to_crs(epsg=3857)
-gdf_nav["EXCEPTION_LEGIT"] = "NO"
-gdf_nav["original_MULTIDIGIT"] = gdf_nav["MULTIDIGIT"].values
-
-for idx, segment in gdf_nav.iterrows():
-    geom = segment.geometry
-    link_id = segment.get("link_id")
-    if geom.length < 5:
-        continue
-    angle_segment = calculate_angle(geom)
-    if angle_segment is None:
-        continue
-    buffer = geom.buffer(25)
-    nearby = gdf_nav[
-        (gdf_nav.geometry.intersects(buffer)) & 
-        (gdf_nav["link_id"] != link_id) & 
-        (gdf_nav.index != idx)
-    ]
+def evaluar_segmentos(gdf_nav, fuentes):
+    """
+    Infiere MULTIDIGIT y marca EXCEPTION_LEGIT en los segmentos de STREETS_NAV (EPSG:3857).
+    """
+    gdf_nav = solo_lineas(gdf_nav).to_crs(epsg=3857)
+    gdf_nav["EXCEPTION_LEGIT"] = "NO"
+    gdf_nav["original_MULTIDIGIT"] = gdf_nav["MULTIDIGIT"].values
+
+    # Vecinos de todos los segmentos (del grafo persistido si GRAFO_VECINOS está definido)
+    pares = vecinos_persistidos(gdf_nav, fuentes)
+    num_vecinos = contar_vecinos(pares, len(gdf_nav))
+    longitudes = gdf_nav.geometry.length.to_numpy()
+    consultados = longitudes >= LONGITUD_MINIMA
+
+    gdf_nav.loc[consultados, "MULTIDIGIT"] = np.where(num_vecinos[consultados] >= 1, "YES", "NO")
+    original = multidigit_bool(gdf_nav["original_MULTIDIGIT"]).to_numpy()
+    es_excepcion = original & (num_vecinos >= 1) & (longitudes > 10)
+    gdf_nav.loc[es_excepcion, "EXCEPTION_LEGIT"] = "YES"
+    return gdf_nav
 
-    valid_neighbors = []
-    for _, neighbor in nearby.iterrows():
-        angle_neighbor = calculate_angle(neighbor.geometry)
-        if angle_neighbor is None:
-            continue
-        angle_diff = abs(angle_segment - angle_neighbor)
-        if angle_diff > 90:
-            angle_diff = 180 - angle_diff
-        overlap = geom.intersection(neighbor.geometry)
-        overlap_ratio = overlap.length / geom.length if geom.length > 0 else 0
-        centroid_distance = geom.centroid.distance(neighbor.geometry.centroid)
-        if angle_diff <= 20 and (overlap_ratio >= 0.05 or centroid_distance < 25):
-            valid_neighbors.append(neighbor)
-
-    inferred = "YES" if len(valid_neighbors) >= 1 else "NO"
-    gdf_nav.at[idx, "MULTIDIGIT"] = inferred
-    if str(segment.get("MULTIDIGIT")).strip().upper() in ["YES", "Y"] and len(valid_neighbors) >= 1 and geom.length > 10:
-        gdf_nav.at[idx, "EXCEPTION_LEGIT"] = "YES"
-
-# === MERGE EXCEPTION_LEGIT ===
-gdf_nav.to_file("STREETS_NAV/FINAL_SEGMENTOS.geojson", driver="GeoJSON")
-gdf_nav_subset = gdf_nav[['link_id', 'EXCEPTION_LEGIT']].copy()
-gdf_pois['link_id'] = gdf_pois['link_id'].astype(str)
-gdf_nav_subset['link_id'] = gdf_nav_subset['link_id'].astype(str)
-gdf_pois = gdf_pois.merge(gdf_nav_subset, on='link_id', how='left')
 
 # === EVALUACIÓN FINAL MULTIDIGIT ===
-def evaluar_multidigit(multidigit, excepcion):
-    if str(multidigit).strip().upper() in ['Y', 'YES']:
-        return 'ok' if excepcion == 'YES' else 'delete'
-    return 'ok'
+def evaluar_multidigit(gdf_pois, gdf_nav):
+    """
+    Trae EXCEPTION_LEGIT del link de cada POI y calcula EVAL_MULTIDIGIT.
+    MULTIDIGIT ya es booleano: 'delete' si es multidigitalizado y no es excepción legítima.
+    """
+    gdf_pois['EXCEPTION_LEGIT'] = IndiceLinks(gdf_nav).valores_para(gdf_pois['link_id'], 'EXCEPTION_LEGIT')
+    multidigit = gdf_pois['MULTIDIGIT'].fillna(False).astype(bool)
+    gdf_pois['EVAL_MULTIDIGIT'] = np.where(multidigit & (gdf_pois['EXCEPTION_LEGIT'] != 'YES'), 'delete', 'ok')
+    return tipar_resultados(gdf_pois)
 
-gdf_pois['EVAL_MULTIDIGIT'] = gdf_pois.apply(
-    lambda row: evaluar_multidigit(row['MULTIDIGIT'], row['EXCEPTION_LEGIT']), axis=1
-)
 
 # === EXPORTAR RESULTADOS ===
-gdf_pois[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']].to_csv("resultado_pois.csv", index=False)
-gdf_invalid_all = gdf_pois[
-    (gdf_pois['EVAL_MULTIDIGIT'] == 'delete') & 
-    (gdf_pois['EVAL_SIDE'] == 'relink')
-]
-gdf_invalid_all[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']].to_csv("pois_invalidos_completos.csv", index=False)
-
-print("✅ Validación completa.")
-print(f"📄 POIs totales evaluados: {len(gdf_pois)}")
-print(f"❌ POIs inválidos detectados: {len(gdf_invalid_all)}")
-print("📝 Archivos generados:")
-print("- resultado_pois.csv")
-print("- pois_invalidos_completos.csv")
-print("- STREETS_NAV/FINAL_SEGMENTOS.geojson")
\ No newline at end of file
+def exportar_resultados(gdf_pois, gdf_nav, puntos_control=None):
+    """
+    Escribe FINAL_SEGMENTOS, los CSV de resultados y, si se pidió, la pirámide de tiles
+    (reanudable por zoom con puntos_control). Devuelve la lista de archivos generados y
+    los POIs inválidos.
+    """
+    generados = []
+    formato = formato_salida()
+    if formato == "delta":
+        generados.append(escribir_delta(gdf_nav, "STREETS_NAV/FINAL_SEGMENTOS", ["MULTIDIGIT", "EXCEPTION_LEGIT"]))
+    else:
+        generados.append(escribir_capa(gdf_nav, "STREETS_NAV/FINAL_SEGMENTOS", formato))
+
+    escribir_csv(gdf_pois[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']], "resultado_pois.csv")
+    gdf_invalid_all = gdf_pois[
+        (gdf_pois['EVAL_MULTIDIGIT'] == 'delete') &
+        (gdf_pois['EVAL_SIDE'] == 'relink')
+    ]
+    escribir_csv(gdf_invalid_all[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']], "pois_invalidos_completos.csv")
+    generados += ["resultado_pois.csv", "pois_invalidos_completos.csv", "pois_sin_link.csv"]
+
+    # Pirámide de tiles XYZ para ver los resultados en un visor web (si PIRAMIDE_TILES está definido)
+    ruta_piramide = directorio_piramide()
+    if ruta_piramide:
+        tiles_escritos = exportar_piramide(gdf_pois, gdf_nav, ruta_piramide, puntos_control=puntos_control)
+        generados.append(f"{ruta_piramide}/{{z}}/{{x}}/{{y}}.png ({tiles_escritos} tiles)")
+    return generados, gdf_invalid_all
+
+
+def archivos_entrada():
+    """
+    Archivos que leen las etapas; su huella decide si los puntos de control siguen valiendo.
+    """
+    return sorted(glob.glob("POIs/*.csv")) + sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson")) + \
+        sorted(glob.glob("STREETS_NAV/*.geojson"))
+
+
+def validar():
+    """
+    Corre todas las etapas en orden. Devuelve (gdf_pois, gdf_nav).
+    Con CHECKPOINTS definido, las etapas de POIs y de segmentos se guardan al terminar y una
+    corrida reanudada las carga en vez de recalcularlas; la pirámide se reanuda por zoom.
+    """
+    puntos_control = puntos_control_desde_entorno("main_validation", archivos_entrada(), {
+        "DUPLICADOS_POIS": os.getenv("DUPLICADOS_POIS"),
+        "ALMACEN_CALLES": os.getenv("ALMACEN_CALLES"),
+    })
+    pois_listos = puntos_control.etapa_lista("pois")
+    segmentos_listos = puntos_control.etapa_lista("segmentos")
+    if not (pois_listos and segmentos_listos):
+        with etapa("cargar_datos"):
+            df_pois, gdf_calles, gdf_nav, geojson_nav = cargar_datos()
+
+    distancia = distancia_duplicados()
+    if pois_listos:
+        tablas, valores = puntos_control.cargar_etapa("pois")
+        gdf_pois, sin_link, duplicados, hay_relink = tablas["pois"], valores["sin_link"], valores["duplicados"], valores["relink"]
+    else:
+        with etapa("unir_pois"):
+            gdf_pois, sin_link = unir_pois(df_pois, gdf_calles, gdf_nav)
+        duplicados = 0
+        if distancia:
+            with etapa("colapsar_duplicados"):
+                gdf_pois, duplicados = colapsar_duplicados(gdf_pois, distancia)
+        with etapa("evaluar_lado"):
+            gdf_pois = evaluar_lado(gdf_pois)
+        # Links candidatos para los POIs con relink (con ALMACEN_CALLES, del almacén por ventanas)
+        relink = gdf_pois[gdf_pois['EVAL_SIDE'] == 'relink']
+        hay_relink = not relink.empty
+        if hay_relink:
+            with etapa("reasociar_relink"):
+                sugeridas = reasociar_relink(relink, calles_para_relink(relink, gdf_calles))
+            print(f"🧭 Sugerencias para POIs con relink: {(sugeridas['MOTIVO'] == 'otro_link').sum()} a otro link, "
+                  f"{(sugeridas['MOTIVO'] == 'invertir_lado').sum()} invirtiendo el lado")
+        puntos_control.guardar_etapa("pois", {"pois": gdf_pois},
+                                     {"sin_link": sin_link, "duplicados": duplicados, "relink": hay_relink})
+
+    if segmentos_listos:
+        gdf_nav = puntos_control.cargar_etapa("segmentos")[0]["nav"]
+    else:
+        with etapa("evaluar_segmentos"):
+            gdf_nav = evaluar_segmentos(gdf_nav, geojson_nav)
+        puntos_control.guardar_etapa("segmentos", {"nav": gdf_nav})
+
+    with etapa("evaluar_multidigit"):
+        gdf_pois = evaluar_multidigit(gdf_pois, gdf_nav)
+    with etapa("exportar_resultados"):
+        generados, gdf_invalid_all = exportar_resultados(gdf_pois, gdf_nav, puntos_control)
+    if hay_relink:
+        generados += ["relink_candidatos.csv", "relink_sugerencias.csv"]
+
+    print("✅ Validación completa.")
+    print(f"📄 POIs totales evaluados: {len(gdf_pois)}")
+    print(f"🔗 POIs sin link en ningún archivo de calles: {sin_link}")
+    if distancia:
+        print(f"👯 POIs duplicados descartados: {duplicados} (detalle en pois_duplicados.csv)")
+    print(f"❌ POIs inválidos detectados: {len(gdf_invalid_all)}")
+    print("📝 Archivos generados:")
+    for ruta in generados:
+        print(f"- {ruta}")
+    return gdf_pois, gdf_nav
+
+
+if __name__ == "__main__":
+    # === CARGAR VARIABLES DE ENTORNO ===
+    load_dotenv()
+    api_key = os.getenv("HERE_API_KEY")
+    if not api_key:
+        raise ValueError("HERE_API_KEY no encontrado en .env")
+
+    medidor = medidor_desde_entorno()
+    with etapa("main_validation"):
+        validar()
+    cerrar_medicion(medidor)
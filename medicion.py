@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Ganchos de medición para las etapas del pipeline.
+# Las etapas y los puntos calientes llaman a etapa("nombre") (bloque medido) y a
+# contar("contador", n); por defecto no hacen nada. Con instalar(MedidorTiempos()) se
+# acumulan tiempos por pila de etapas y contadores (pares candidatos, evaluaciones de
+# predicado, tiles descargados, ...), y exportar_pilas() escribe el formato de pilas
+# colapsadas ("a;b;c microsegundos") que leen flamegraph.pl, speedscope o inferno.
+#
+# Cualquier objeto con los métodos etapa(nombre) y contar(nombre, n) sirve como medidor.
+
+
+class MedidorNulo:
+    """
+    Medidor por defecto: no mide nada y no cuesta casi nada.
+    """
+
+    @contextmanager
+    def etapa(self, nombre):
+        yield
+
+    def contar(self, nombre, n=1):
+        pass
+
+
+class MedidorTiempos:
+    """
+    Acumula tiempo propio por pila de etapas (sin contar el de las etapas hijas) y contadores.
+    Cada hilo lleva su propia pila; los acumulados se comparten.
+    """
+
+    def __init__(self, reloj=time.perf_counter):
+        self.reloj = reloj
+        self.tiempos = defaultdict(float)
+        self.contadores = defaultdict(int)
+        self._local = threading.local()
+        self._candado = threading.Lock()
+
+    def _pila(self):
+        if not hasattr(self._local, "pila"):
+            self._local.pila = []
+        return self._local.pila
+
+    @contextmanager
+    def etapa(self, nombre):
+        pila = self._pila()
+        pila.append([nombre, 0.0])
+        inicio = self.reloj()
+        try:
+            yield
+        finally:
+            total = self.reloj() - inicio
+            clave = ";".join(marco[0] for marco in pila)
+            _, hijos = pila.pop()
+            if pila:
+                pila[-1][1] += total
+            with self._candado:
+                self.tiempos[clave] += total - hijos
+
+    def contar(self, nombre, n=1):
+        with self._candado:
+            self.contadores[nombre] += int(n)
+
+    def resumen(self):
+        """
+        Texto con el tiempo propio de cada pila (de mayor a menor) y los contadores.
+        """
+        lineas = ["Tiempo propio por etapa:"]
+        for clave, segundos in sorted(self.tiempos.items(), key=lambda kv: -kv[1]):
+            lineas.append(f"  {segundos:10.3f} s  {clave}")
+        if self.contadores:
+            lineas.append("Contadores:")
+            for nombre, valor in sorted(self.contadores.items()):
+                lineas.append(f"  {nombre}: {valor}")
+        return "\n".join(lineas)
+
+    def exportar_pilas(self, ruta):
+        """
+        Escribe las pilas colapsadas (una por línea, peso en microsegundos).
+        """
+        with open(ruta, "w") as f:
+            for clave, segundos in sorted(self.tiempos.items()):
+                f.write(f"{clave} {max(1, round(segundos * 1e6))}\n")
+        return ruta
+
+
+_MEDIDOR = MedidorNulo()
+
+
+def instalar(medidor):
+    """
+    Define el medidor global y devuelve el anterior.
+    """
+    global _MEDIDOR
+    anterior, _MEDIDOR = _MEDIDOR, medidor
+    return anterior
+
+
+def medidor_actual():
+    return _MEDIDOR
+
+
+def etapa(nombre):
+    return _MEDIDOR.etapa(nombre)
+
+
+def contar(nombre, n=1):
+    _MEDIDOR.contar(nombre, n)
+
+
+def medidor_desde_entorno():
+    """
+    Si PERFIL_PIPELINE está definido (ruta del archivo de pilas), instala un MedidorTiempos
+    y lo devuelve; si no, devuelve None.
+    """
+    if not os.getenv("PERFIL_PIPELINE"):
+        return None
+    medidor = MedidorTiempos()
+    instalar(medidor)
+    return medidor
+
+
+def cerrar_medicion(medidor):
+    """
+    Imprime el resumen y escribe el archivo de pilas indicado en PERFIL_PIPELINE.
+    """
+    if medidor is None:
+        return None
+    print(medidor.resumen())
+    ruta = medidor.exportar_pilas(os.getenv("PERFIL_PIPELINE"))
+    print(f"Pilas colapsadas para flamegraph: {ruta}")
+    return ruta
@@ -6,6 +6,7 @@ import folium
 import math
 import os
 from dotenv import load_dotenv
+from fuentes_tiles import fuente_tiles
 
 # Cargar variables de entorno
 load_dotenv()
@@ -94,19 +95,20 @@ print(f"Total de POIs sospechosos (MULTIDIGIT = YES): {len(gdf_pois_sospechosos)
 # 9. Visualización con HERE
 centro = [gdf_pois.geometry.y.mean(), gdf_pois.geometry.x.mean()]
 
-tiles_url = (
-    f"https://1.base.maps.ls.hereapi.com/maptile/2.1/maptile/newest/normal.day/"
-    f"{{z}}/{{x}}/{{y}}/256/png8?apiKey={here_api_key}&lg=spa"
-)
-
-m = folium.Map(location=centro, zoom_start=15, tiles=None)
-folium.TileLayer(
-    tiles=tiles_url,
-    attr='HERE Maps',
-    name='HERE',
-    overlay=False,
-    control=True
-).add_to(m)
+# Capa base de la fuente configurada (FUENTE_TILES); una carpeta local o un MBTiles no se
+# pueden servir al navegador directamente, en ese caso se usa OpenStreetMap
+fuente = fuente_tiles(here_api_key)
+tiles_url = fuente.plantilla_url(estilo='explore.day', tile_format='png8', tamano=256)
+
+m = folium.Map(location=centro, zoom_start=15, tiles=None if tiles_url else 'OpenStreetMap')
+if tiles_url:
+    folium.TileLayer(
+        tiles=tiles_url,
+        attr='HERE Maps',
+        name='HERE',
+        overlay=False,
+        control=True
+    ).add_to(m)
 
 # 10. Marcadores
 for _, row in gdf_pois.iterrows():
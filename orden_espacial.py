@@ -0,0 +1,96 @@
+import os
+import numpy as np
+
+# Orden espacial opcional (ORDEN_ESPACIAL=hilbert | morton) para que el trabajo consecutivo
+# caiga cerca en el espacio: las consultas al STRtree recorren los mismos nodos y los
+# snapshots seguidos piden los mismos tiles (más aciertos en la LRU de capa_tiles).
+# Las claves se calculan sobre la grilla de 2^BITS x 2^BITS celdas que cubre la extensión
+# de los datos. Solo se reordena el recorrido: los resultados conservan el orden original.
+
+BITS = 16
+CURVAS = ("hilbert", "morton")
+
+
+def curva_espacial():
+    """
+    Curva elegida en ORDEN_ESPACIAL, o None si no está definida (orden de archivo).
+    """
+    curva = os.getenv("ORDEN_ESPACIAL", "").strip().lower()
+    if not curva:
+        return None
+    if curva not in CURVAS:
+        raise ValueError(f"ORDEN_ESPACIAL no reconocido: {curva}. Opciones: {', '.join(CURVAS)}")
+    return curva
+
+
+def _a_grilla(valores, bits):
+    valores = np.asarray(valores, dtype=float)
+    finitos = np.isfinite(valores)
+    if not finitos.any():
+        return np.zeros(len(valores), dtype=np.int64)
+    minimo, maximo = valores[finitos].min(), valores[finitos].max()
+    escala = ((1 << bits) - 1) / (maximo - minimo) if maximo > minimo else 0.0
+    celdas = np.where(finitos, (valores - minimo) * escala, 0.0)
+    return celdas.astype(np.int64)
+
+
+def claves_hilbert(x, y, bits=BITS):
+    """
+    Distancia sobre la curva de Hilbert de cada celda (x, y) de una grilla de 2^bits (enteros).
+    """
+    n = 1 << bits
+    x = np.asarray(x, dtype=np.int64).copy()
+    y = np.asarray(y, dtype=np.int64).copy()
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotación del cuadrante para que la curva siga continua
+        voltear = (ry == 0) & (rx == 1)
+        x = np.where(voltear, n - 1 - x, x)
+        y = np.where(voltear, n - 1 - y, y)
+        girar = ry == 0
+        x, y = np.where(girar, y, x), np.where(girar, x, y)
+        s >>= 1
+    return d
+
+
+def _separar_bits(v):
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+
+def claves_morton(x, y):
+    """
+    Clave Z-order (bits de x e y intercalados) de cada celda de una grilla de 2^16.
+    """
+    return _separar_bits(np.asarray(x, dtype=np.int64)) | (_separar_bits(np.asarray(y, dtype=np.int64)) << 1)
+
+
+def orden_por_curva(x, y, curva="hilbert"):
+    """
+    Permutación (argsort estable) que recorre los puntos (x, y) a lo largo de la curva.
+    Los puntos sin coordenadas quedan al final.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    gx, gy = _a_grilla(x, BITS), _a_grilla(y, BITS)
+    claves = claves_hilbert(gx, gy) if curva == "hilbert" else claves_morton(gx, gy)
+    claves[~(np.isfinite(x) & np.isfinite(y))] = np.iinfo(np.int64).max
+    return np.argsort(claves, kind="stable")
+
+
+def orden_geometrias(geoms, curva="hilbert"):
+    """
+    Permutación por la curva del centro del rectángulo de cada geometría (las faltantes al final).
+    """
+    import shapely
+
+    limites = shapely.bounds(np.asarray(geoms, dtype=object))
+    return orden_por_curva((limites[:, 0] + limites[:, 2]) / 2, (limites[:, 1] + limites[:, 3]) / 2, curva)
+
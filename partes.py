@@ -0,0 +1,55 @@
+import numpy as np
+import shapely
+
+# Links de varias partes (MultiLineString). Las etapas vectorizadas trabajan sobre arreglos
+# planos de LineString: cada link se explota en sus partes con un índice parte -> link, se
+# calculan rumbo, vecinos y lado por parte y el resultado se agrega de vuelta por link.
+# Un link LineString es una sola parte, así que para ellos todo queda igual que antes.
+
+TIPOS_LINEA = ["LineString", "MultiLineString"]
+
+
+def solo_lineas(gdf):
+    """
+    Filas de gdf con geometría LineString o MultiLineString.
+    """
+    return gdf[gdf.geometry.type.isin(TIPOS_LINEA)]
+
+
+def explotar(geoms):
+    """
+    (partes, link_de_parte): las LineString de cada geometría en arreglo plano y la posición
+    de la geometría de la que sale cada una. Las faltantes, vacías o que no son líneas no
+    aportan partes.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    tipos = shapely.get_type_id(geoms)
+    lineas = np.flatnonzero(
+        ((tipos == shapely.GeometryType.LINESTRING) | (tipos == shapely.GeometryType.MULTILINESTRING)) &
+        ~shapely.is_empty(geoms)
+    )
+    partes, indice = shapely.get_parts(geoms[lineas], return_index=True)
+    return partes, lineas[indice].astype(np.int64)
+
+
+def parte_mas_cercana(lineas, puntos):
+    """
+    Para cada fila, la parte de lineas[k] más cercana a puntos[k] (None si la fila no tiene
+    partes o le falta el punto). Con LineString devuelve la misma línea.
+    """
+    lineas = np.asarray(lineas, dtype=object)
+    puntos = np.asarray(puntos, dtype=object)
+    elegidas = np.full(len(lineas), None, dtype=object)
+    partes, fila = explotar(lineas)
+    con_punto = ~shapely.is_missing(puntos[fila])
+    partes, fila = partes[con_punto], fila[con_punto]
+    if len(partes) == 0:
+        return elegidas
+
+    distancia = shapely.distance(puntos[fila], partes)
+    # Por fila, la primera parte a menor distancia
+    orden = np.lexsort((np.arange(len(fila)), distancia, fila))
+    primera = np.ones(len(orden), dtype=bool)
+    primera[1:] = fila[orden][1:] != fila[orden][:-1]
+    elegidas[fila[orden][primera]] = partes[orden][primera]
+    return elegidas
@@ -0,0 +1,232 @@
+import os
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from tiles import lat_lon_to_tile, get_tile_bounds, latlon_to_pixel
+from capa_tiles import capa_compartida
+from puntos_control import PuntosControlNulo
+from orden_espacial import curva_espacial, orden_por_curva
+
+# Pipeline asíncrono de revisión visual:
+#   evaluación (generador) -> cola acotada -> descargadores de tiles -> cola acotada -> renderizadores
+# Los elementos salen de la etapa de evaluación mientras esta sigue corriendo, la latencia de
+# red se esconde detrás del trabajo de CPU y, como ambas colas tienen tamaño máximo, un API
+# lento frena al productor en vez de acumular tiles en memoria. Los tiles pasan por la capa
+# compartida en memoria (capa_tiles): varios elementos en el mismo tile generan una sola
+# descarga y una sola decodificación, y además quedan en el caché en disco.
+#
+# Cada elemento es un dict con: lat, lon, titulo y ruta (PNG de salida).
+# Con ORDEN_ESPACIAL los elementos se programan a lo largo de la curva, así los snapshots
+# seguidos caen en el mismo tile o en uno vecino (más aciertos y coalescencia en la LRU).
+#
+# Con puntos de control (puntos_control.py) los elementos se procesan en lotes de
+# TAMANO_LOTE: cada lote con todas sus imágenes se confirma con la lista de tiles que usó;
+# un lote con imágenes faltantes queda en curso con esa lista. Al reanudar se saltan los
+# lotes confirmados y, en los lotes en curso, las imágenes que ya existen. Cada lote guarda
+# la firma de sus rutas: si cambió el orden (ORDEN_ESPACIAL) o la selección y el lote con ese
+# número ahora tiene otros elementos, no cuenta como confirmado.
+
+_FIN = object()
+TAMANO_LOTE = 256
+
+
+def renderizar_snapshot(image, bounds, item):
+    """
+    Dibuja el tile (imagen PIL ya decodificada) con un punto rojo en (lat, lon) y lo guarda
+    en item['ruta']. Usa la API orientada a objetos de matplotlib (sin pyplot) para poder
+    correr en hilos.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 6))
+    ax = fig.subplots()
+    ax.imshow(image)
+    # Tamaño real de la imagen: HERE entrega 512 px, una carpeta o un MBTiles suelen ser de 256
+    px, py = latlon_to_pixel(item["lat"], item["lon"], bounds, image.size)
+    ax.plot(px, py, 'ro', markersize=10)
+    ax.set_title(item["titulo"])
+    ax.axis("off")
+    fig.tight_layout()
+    # Escritura atómica: una imagen a medio escribir nunca queda con su nombre final
+    ruta = item["ruta"]
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    fig.savefig(temporal, format=os.path.splitext(ruta)[1].lstrip(".") or "png")
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def _terminar(estado, ruta=None):
+    """
+    Registra un elemento resuelto (guardado si trae ruta, fallido si no) y despierta al productor.
+    """
+    if ruta is None:
+        estado["fallidos"] += 1
+    else:
+        estado["guardadas"].append(ruta)
+    estado["cambio"].set()
+
+
+async def _productor(items, cola, limite, n_consumidores, estado):
+    for item in items:
+        # El generador se consume completo aunque se llegue al límite, porque la
+        # etapa de evaluación también actualiza datos mientras produce.
+        # Como en el ciclo original, el límite cuenta imágenes guardadas: mientras los
+        # elementos en vuelo todavía pueden completar el límite se espera a que se
+        # resuelvan, y cada uno que falla deja lugar para el siguiente.
+        if limite is not None:
+            while (estado["enviados"] - estado["fallidos"] >= limite and
+                   estado["enviados"] > estado["fallidos"] + len(estado["guardadas"])):
+                estado["cambio"].clear()
+                await estado["cambio"].wait()
+        if limite is None or estado["enviados"] - estado["fallidos"] < limite:
+            await cola.put(item)
+            estado["enviados"] += 1
+        # Cede el turno para que los descargadores arranquen mientras se sigue evaluando
+        await asyncio.sleep(0)
+    for _ in range(n_consumidores):
+        await cola.put(_FIN)
+
+
+async def _descargador(cola_items, cola_render, sesion, zoom, tile_format, api_key, estado):
+    capa = capa_compartida()
+    while True:
+        item = await cola_items.get()
+        if item is _FIN:
+            return
+        x, y = lat_lon_to_tile(item["lat"], item["lon"], zoom)
+        try:
+            imagen = await asyncio.to_thread(capa.imagen, x, y, zoom, tile_format, api_key, sesion)
+        except Exception as e:
+            print(f"Falló la descarga de imagen: {e}")
+            _terminar(estado)
+            continue
+        if imagen is None:
+            _terminar(estado)
+            continue
+        await cola_render.put((imagen, get_tile_bounds(x, y, zoom), item))
+
+
+async def _renderizador(cola_render, executor, estado):
+    loop = asyncio.get_running_loop()
+    while True:
+        trabajo = await cola_render.get()
+        if trabajo is _FIN:
+            return
+        # Un error al dibujar o guardar no puede matar la tarea: sin renderizadores nadie
+        # vacía cola_render y los descargadores y el productor quedan bloqueados
+        try:
+            ruta = await loop.run_in_executor(executor, renderizar_snapshot, *trabajo)
+        except Exception as e:
+            print(f"Falló el guardado de {trabajo[2]['ruta']}: {e}")
+            _terminar(estado)
+            continue
+        _terminar(estado, ruta)
+
+
+async def revisar(items, api_key, zoom=18, tile_format="png", limite=None,
+                  max_en_cola=32, descargadores=8, renderizadores=2):
+    """
+    Corre el pipeline completo y devuelve la lista de imágenes guardadas. Con limite se
+    guardan como máximo esa cantidad de imágenes (los elementos que fallan no cuentan).
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    cola_items = asyncio.Queue(maxsize=max_en_cola)
+    cola_render = asyncio.Queue(maxsize=max_en_cola)
+    estado = {"enviados": 0, "fallidos": 0, "guardadas": [], "cambio": asyncio.Event()}
+
+    with requests.Session() as sesion, ThreadPoolExecutor(renderizadores) as executor:
+        sesion.mount("https://", HTTPAdapter(pool_maxsize=descargadores))
+        tareas_descarga = [
+            asyncio.create_task(_descargador(cola_items, cola_render, sesion, zoom, tile_format, api_key, estado))
+            for _ in range(descargadores)
+        ]
+        tareas_render = [
+            asyncio.create_task(_renderizador(cola_render, executor, estado))
+            for _ in range(renderizadores)
+        ]
+        await _productor(items, cola_items, limite, descargadores, estado)
+        await asyncio.gather(*tareas_descarga)
+        for _ in range(renderizadores):
+            await cola_render.put(_FIN)
+        await asyncio.gather(*tareas_render)
+
+    stats = capa_compartida().estadisticas()
+    print(f"Tiles en memoria: {stats['aciertos']} aciertos, {stats['coalescidos']} coalescidos, "
+          f"{stats['fallos']} fallos ({stats['tasa_aciertos']:.0%} reutilizados)")
+    if estado["fallidos"]:
+        print(f"Snapshots que fallaron: {estado['fallidos']}")
+    return estado["guardadas"]
+
+
+def firma_lote(lote):
+    """
+    blake2b de las rutas del lote, en orden.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for item in lote:
+        h.update(f"{item['ruta']}\n".encode())
+    return h.hexdigest()
+
+
+def ejecutar_revision(items, api_key, puntos_control=None, etapa="snapshots", **opciones):
+    """
+    Punto de entrada síncrono para los scripts: asyncio.run(revisar(...)). Con
+    puntos_control activos corre lote por lote y confirma cada lote terminado. limite
+    (opcional) es el máximo de imágenes guardadas, contando las de lotes ya terminados.
+    """
+    puntos_control = puntos_control or PuntosControlNulo()
+    curva = curva_espacial()
+    if not puntos_control.activo and curva is None:
+        return asyncio.run(revisar(items, api_key, **opciones))
+
+    # limite cuenta imágenes guardadas en todos los caminos: aquí se pasa a revisar y,
+    # por lotes, se descuenta lo ya guardado antes de cada lote
+    items = list(items)
+    limite = opciones.pop("limite", None)
+    if curva is not None and items:
+        orden = orden_por_curva([item["lon"] for item in items], [item["lat"] for item in items], curva)
+        items = [items[k] for k in orden]
+    if not puntos_control.activo:
+        return asyncio.run(revisar(items, api_key, limite=limite, **opciones))
+    zoom = opciones.get("zoom", 18)
+    listos = puntos_control.particiones_listas(etapa)
+    en_curso = puntos_control.en_curso(etapa)
+
+    guardadas = []
+    for numero, inicio in enumerate(range(0, len(items), TAMANO_LOTE)):
+        restante = None if limite is None else limite - len(guardadas)
+        if restante is not None and restante <= 0:
+            break
+        lote = items[inicio:inicio + TAMANO_LOTE]
+        existentes = [item["ruta"] for item in lote if os.path.exists(item["ruta"])]
+        firma = firma_lote(lote)
+        if listos.get(str(numero), {}).get("firma") == firma:
+            guardadas.extend(existentes[:restante])
+            continue
+        pendientes = lote
+        if str(numero) in en_curso:
+            guardadas.extend(existentes[:restante])
+            ya_escritas = set(existentes)
+            pendientes = [item for item in lote if item["ruta"] not in ya_escritas]
+            if restante is not None:
+                restante = limite - len(guardadas)
+        puntos_control.iniciar_particion(etapa, numero)
+        if restante is None or restante > 0:
+            guardadas.extend(asyncio.run(revisar(pendientes, api_key, limite=restante, **opciones)))
+        # Solo se confirma el lote si están todas sus imágenes; si falló alguna descarga o
+        # algún dibujo, queda en curso con sus faltantes y se reintenta al reanudar
+        faltantes = [item["ruta"] for item in lote if not os.path.exists(item["ruta"])]
+        if faltantes:
+            puntos_control.anotar_faltantes(etapa, numero, faltantes)
+            print(f"Lote {numero}: faltan {len(faltantes)} de {len(lote)} imágenes; queda en curso")
+            continue
+        tiles = sorted({lat_lon_to_tile(item["lat"], item["lon"], zoom) for item in lote})
+        puntos_control.confirmar_particion(etapa, numero, {
+            "imagenes": len(lote),
+            "firma": firma,
+            "tiles": [f"{zoom}/{x}/{y}" for x, y in tiles],
+        })
+    return guardadas
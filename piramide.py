@@ -0,0 +1,229 @@
+import os
+from multiprocessing import get_context
+
+import numpy as np
+import shapely
+
+from partes import explotar, solo_lineas
+from puntos_control import PuntosControlNulo
+
+# Pirámide de tiles XYZ (PNG 256 px) con los resultados de la validación, para verlos
+# como capa estática en cualquier visor web o SIG sin cargar resultado_pois.csv:
+#   <directorio>/<z>/<x>/<y>.png  +  <directorio>/visor.html (folium, si está instalado)
+# Segmentos de FINAL_SEGMENTOS coloreados por EXCEPTION_LEGIT / MULTIDIGIT y POIs por
+# EVAL_MULTIDIGIT / EVAL_SIDE. Las coordenadas se normalizan a Web Mercator [0, 1] una
+# sola vez; cada tile se dibuja en un proceso aparte (pool con fork, como la búsqueda de vecinos).
+
+TAMANO_TILE = 256
+ZOOM_MINIMO = 10
+ZOOM_MAXIMO = 16
+ANCHO_LINEA = 2
+RADIO_PUNTO = 4
+EXTENSION_3857 = 20037508.342789244
+
+COLORES_SEGMENTO = {
+    "excepcion": (31, 119, 180, 255),     # EXCEPTION_LEGIT = YES
+    "multidigit": (90, 90, 90, 255),      # MULTIDIGIT = YES
+    "normal": (170, 170, 170, 200),
+}
+COLORES_POI = {
+    "delete_relink": (148, 0, 211, 255),  # EVAL_MULTIDIGIT = delete y EVAL_SIDE = relink
+    "delete": (214, 39, 40, 255),
+    "relink": (255, 127, 14, 255),
+    "ok": (44, 160, 44, 255),
+}
+
+
+def directorio_piramide():
+    """
+    Carpeta de salida de la pirámide, leída de PIRAMIDE_TILES (None = no se genera).
+    """
+    return os.getenv("PIRAMIDE_TILES")
+
+
+def _normalizar(coords_3857):
+    """
+    Coordenadas EPSG:3857 -> Web Mercator normalizado (x a la derecha, y hacia abajo, en [0, 1]).
+    """
+    nx = (coords_3857[:, 0] + EXTENSION_3857) / (2 * EXTENSION_3857)
+    ny = (EXTENSION_3857 - coords_3857[:, 1]) / (2 * EXTENSION_3857)
+    return np.column_stack([nx, ny])
+
+
+def _es_si(serie):
+    return serie.astype(str).str.strip().str.upper().isin(["YES", "Y", "TRUE"]).to_numpy()
+
+
+def colores_segmentos(gdf):
+    colores = np.tile(COLORES_SEGMENTO["normal"], (len(gdf), 1)).astype(np.uint8)
+    if "MULTIDIGIT" in gdf.columns:
+        colores[_es_si(gdf["MULTIDIGIT"])] = COLORES_SEGMENTO["multidigit"]
+    if "EXCEPTION_LEGIT" in gdf.columns:
+        colores[_es_si(gdf["EXCEPTION_LEGIT"])] = COLORES_SEGMENTO["excepcion"]
+    return colores
+
+
+def colores_pois(gdf):
+    delete = (gdf["EVAL_MULTIDIGIT"].astype(str) == "delete").to_numpy()
+    relink = (gdf["EVAL_SIDE"].astype(str) == "relink").to_numpy()
+    colores = np.tile(COLORES_POI["ok"], (len(gdf), 1)).astype(np.uint8)
+    colores[delete] = COLORES_POI["delete"]
+    colores[relink] = COLORES_POI["relink"]
+    colores[delete & relink] = COLORES_POI["delete_relink"]
+    return colores
+
+
+def tiles_por_elemento(minimos, maximos, zoom, margen_px):
+    """
+    Para cada elemento con rectángulo normalizado [minimos, maximos] (n x 2), todos los
+    tiles del zoom que toca, ampliando el rectángulo en margen_px píxeles.
+    Devuelve (elemento, tx, ty) como arreglos planos.
+    """
+    escala = TAMANO_TILE * 2 ** zoom
+    limite = 2 ** zoom - 1
+    t0 = np.clip(np.floor((minimos * escala - margen_px) / TAMANO_TILE), 0, limite).astype(np.int64)
+    t1 = np.clip(np.floor((maximos * escala + margen_px) / TAMANO_TILE), 0, limite).astype(np.int64)
+    ancho = t1[:, 0] - t0[:, 0] + 1
+    cuenta = ancho * (t1[:, 1] - t0[:, 1] + 1)
+
+    elemento = np.repeat(np.arange(len(cuenta)), cuenta)
+    k = np.arange(cuenta.sum()) - np.repeat(np.cumsum(cuenta) - cuenta, cuenta)
+    ancho = np.repeat(ancho, cuenta)
+    tx = t0[elemento, 0] + k % ancho
+    ty = t0[elemento, 1] + k // ancho
+    return elemento, tx, ty
+
+
+def _agrupar(elemento, tx, ty, zoom):
+    """
+    Diccionario (tx, ty) -> índices de elementos, con una sola ordenación.
+    """
+    clave = tx * (2 ** zoom) + ty
+    orden = np.argsort(clave, kind="stable")
+    claves, inicios = np.unique(clave[orden], return_index=True)
+    grupos = np.split(elemento[orden], inicios[1:]) if len(orden) else []
+    return {(int(c // 2 ** zoom), int(c % 2 ** zoom)): g for c, g in zip(claves, grupos)}
+
+
+# === DIBUJO EN PARALELO ===
+# Los arreglos se heredan por fork a través del initializer, sin copiarlos por tile.
+
+_TRABAJADOR = {}
+
+
+def ruta_tile(directorio, zoom, tx, ty):
+    return os.path.join(directorio, str(zoom), str(tx), f"{ty}.png")
+
+
+def _iniciar_trabajador(datos, directorio):
+    _TRABAJADOR.update(datos, directorio=directorio)
+
+
+def _dibujar_tile(tarea):
+    from PIL import Image, ImageDraw
+
+    zoom, tx, ty, lineas, puntos = tarea
+    datos = _TRABAJADOR
+    escala = TAMANO_TILE * 2 ** zoom
+    origen = np.array([tx * TAMANO_TILE, ty * TAMANO_TILE], dtype=float)
+
+    imagen = Image.new("RGBA", (TAMANO_TILE, TAMANO_TILE), (0, 0, 0, 0))
+    dibujo = ImageDraw.Draw(imagen)
+    offsets = datos["offsets"]
+    for i in lineas:
+        pixeles = datos["coords"][offsets[i]:offsets[i + 1]] * escala - origen
+        dibujo.line([tuple(p) for p in pixeles], fill=tuple(datos["color_linea"][i]), width=ANCHO_LINEA)
+    for i in puntos:
+        px, py = datos["puntos"][i] * escala - origen
+        dibujo.ellipse([px - RADIO_PUNTO, py - RADIO_PUNTO, px + RADIO_PUNTO, py + RADIO_PUNTO],
+                       fill=tuple(datos["color_punto"][i]), outline=(255, 255, 255, 255))
+
+    ruta = ruta_tile(datos["directorio"], zoom, tx, ty)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    imagen.save(ruta + ".tmp", format="PNG")
+    os.replace(ruta + ".tmp", ruta)
+    return ruta
+
+
+def tareas_de_zoom(datos, zoom):
+    """
+    Una tarea por tile que tiene al menos un segmento o un POI en ese zoom.
+    """
+    lineas = _agrupar(*tiles_por_elemento(datos["lineas_min"], datos["lineas_max"], zoom, ANCHO_LINEA), zoom)
+    puntos = _agrupar(*tiles_por_elemento(datos["puntos"], datos["puntos"], zoom, RADIO_PUNTO + 1), zoom)
+    vacio = np.empty(0, dtype=np.int64)
+    return [(zoom, tx, ty, lineas.get((tx, ty), vacio), puntos.get((tx, ty), vacio))
+            for tx, ty in sorted(lineas.keys() | puntos.keys())]
+
+
+def exportar_piramide(gdf_pois, gdf_segmentos, directorio, zoom_minimo=ZOOM_MINIMO,
+                      zoom_maximo=ZOOM_MAXIMO, procesos=None, puntos_control=None):
+    """
+    Genera la pirámide de tiles de los POIs evaluados y los segmentos finales.
+    Devuelve el número de tiles de la pirámide. Con puntos_control, cada zoom es una
+    partición: los zooms confirmados se saltan y en un zoom en curso solo se dibujan los
+    tiles que faltan.
+    """
+    puntos_control = puntos_control or PuntosControlNulo()
+    segmentos = solo_lineas(gdf_segmentos).to_crs(epsg=3857)
+    pois = gdf_pois[gdf_pois.geometry.notna() & ~gdf_pois.geometry.is_empty].to_crs(epsg=3857)
+
+    # Cada parte de un MultiLineString se dibuja como una línea con el color de su link
+    partes, link_de_parte = explotar(segmentos.geometry.values)
+    _, coords, (offsets,) = shapely.to_ragged_array(partes)
+    coords = _normalizar(coords)
+    limites = shapely.bounds(partes)
+    datos = {
+        "coords": coords,
+        "offsets": offsets.astype(np.int64),
+        "lineas_min": _normalizar(limites[:, [0, 3]]),
+        "lineas_max": _normalizar(limites[:, [2, 1]]),
+        "color_linea": colores_segmentos(segmentos)[link_de_parte],
+        "puntos": _normalizar(np.column_stack([pois.geometry.x, pois.geometry.y])),
+        "color_punto": colores_pois(pois),
+    }
+
+    listos = puntos_control.particiones_listas("piramide")
+    en_curso = puntos_control.en_curso("piramide")
+    escritos = 0
+    procesos = procesos or os.cpu_count() or 1
+    with get_context().Pool(procesos, initializer=_iniciar_trabajador, initargs=(datos, directorio)) as pool:
+        for zoom in range(zoom_minimo, zoom_maximo + 1):
+            if str(zoom) in listos:
+                escritos += listos[str(zoom)]["tiles"]
+                continue
+            tareas = tareas_de_zoom(datos, zoom)
+            pendientes = tareas
+            if str(zoom) in en_curso:
+                pendientes = [t for t in tareas if not os.path.exists(ruta_tile(directorio, *t[:3]))]
+            puntos_control.iniciar_particion("piramide", zoom)
+            for _ in pool.imap_unordered(_dibujar_tile, pendientes, chunksize=16):
+                pass
+            puntos_control.confirmar_particion("piramide", zoom, {"tiles": len(tareas)})
+            escritos += len(tareas)
+
+    escribir_visor(directorio, pois, zoom_minimo, zoom_maximo)
+    return escritos
+
+
+def escribir_visor(directorio, pois, zoom_minimo, zoom_maximo):
+    """
+    visor.html con la pirámide como capa sobre OpenStreetMap; se sirve con
+    python -m http.server desde la carpeta de la pirámide.
+    """
+    try:
+        import folium
+    except ImportError:
+        return None
+
+    puntos = pois.to_crs(epsg=4326).geometry
+    centro = [puntos.y.mean(), puntos.x.mean()] if len(puntos) else [0, 0]
+    mapa = folium.Map(location=centro, zoom_start=zoom_minimo)
+    folium.TileLayer(
+        tiles="{z}/{x}/{y}.png", attr="Validación de POIs", name="Resultados",
+        overlay=True, min_zoom=zoom_minimo, max_native_zoom=zoom_maximo, max_zoom=zoom_maximo + 3,
+    ).add_to(mapa)
+    folium.LayerControl().add_to(mapa)
+    ruta = os.path.join(directorio, "visor.html")
+    mapa.save(ruta)
+    return ruta
@@ -0,0 +1,91 @@
+import os
+import sys
+import argparse
+
+# Punto de entrada único para los scripts del pipeline:
+#   python poi_validate.py side|multidigit|exceptions|validate|triage|review|regression|quality|clean|store
+# Aquí solo se importa la biblioteca estándar; geopandas, matplotlib, PIL, requests
+# y folium se cargan dentro del subcomando que los necesita, así que --help y las
+# invocaciones cortas arrancan de inmediato.
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Subcomando -> (script que lo implementa, descripción)
+SCRIPTS = {
+    "side": ("verificacion_lado.py", "Evalúa el lado declarado vs. el lado geométrico de cada POI."),
+    "multidigit": ("check_multiply_digitised.py", "Infiere y corrige MULTIDIGIT a partir de las calzadas paralelas."),
+    "exceptions": ("legitimate_exception.py", "Marca EXCEPTION_LEGIT en los segmentos de STREETS_NAV."),
+    "validate": ("main_validation.py", "Validación completa: lado, MULTIDIGIT y excepciones legítimas."),
+    "triage": ("edificios.py", "Puntúa la presencia de edificios en el caché de tiles para filtrar la revisión manual."),
+    "review": ("ver_POI.py", "Revisión manual de un POI sobre la imagen satelital."),
+    "regression": ("regresion.py", "Compara las implementaciones de referencia con los motores optimizados."),
+    "quality": ("calidad_datos.py", "Perfil de calidad de la entrega (POIs y STREETS) en una pasada; rechaza las entregas malas."),
+}
+
+
+def ejecutar_script(nombre, argumentos=()):
+    """
+    Ejecuta uno de los scripts del pipeline como si se llamara con python <script> [argumentos].
+    """
+    import runpy
+    ruta = os.path.join(DIRECTORIO, nombre)
+    sys.argv = [ruta, *argumentos]
+    runpy.run_path(ruta, run_name="__main__")
+    return 0
+
+
+def limpiar(entradas, salida=None):
+    """
+    Aplica limpiar_tabla a uno o más CSV y guarda cada uno como <nombre>_CLEAN.csv.
+    """
+    import pandas as pd
+    from limpia import limpiar_tabla
+
+    if salida and len(entradas) > 1:
+        raise SystemExit("--salida solo se puede usar con un único archivo de entrada")
+    for entrada in entradas:
+        destino = salida or f"{os.path.splitext(entrada)[0]}_CLEAN.csv"
+        df_limpio = limpiar_tabla(pd.read_csv(entrada))
+        df_limpio.to_csv(destino, index=False, na_rep='NaN')
+        print(f"Archivo limpio guardado en: {destino}")
+    return 0
+
+
+def construir_parser():
+    parser = argparse.ArgumentParser(
+        prog="poi-validate",
+        description="Validación de POIs con imágenes satelitales y geometría (HERE).",
+    )
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for comando, (_, ayuda) in SCRIPTS.items():
+        sub.add_parser(comando, help=ayuda, description=ayuda)
+    sub.choices["regression"].add_argument("modo", nargs="?", default="sintetico", choices=["sintetico", "muestra", "ambos"])
+    sub.choices["regression"].add_argument("n", nargs="?", default="500", help="segmentos (y POIs) por conjunto")
+    sub.choices["exceptions"].add_argument(
+        "archivo", nargs="?", help="GeoJSON de STREETS_NAV a analizar (por defecto el primero); incluye el borde de los vecinos")
+
+    store = sub.add_parser("store", help="Construye el almacén binario (memmap) de geometrías de calles.")
+    store.add_argument("carpeta", nargs="?", default="STREETS_NAMING_ADDRESSING", help="carpeta con los GeoJSON de calles")
+    store.add_argument("destino", nargs="?", default="ALMACEN_CALLES", help="carpeta del almacén")
+
+    clean = sub.add_parser("clean", help="Limpia caracteres especiales y columnas excluidas de CSV de POIs.")
+    clean.add_argument("entradas", nargs="+", help="CSV a limpiar")
+    clean.add_argument("-o", "--salida", help="ruta de salida (solo con un archivo de entrada)")
+    return parser
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    if args.comando == "clean":
+        return limpiar(args.entradas, args.salida)
+    if args.comando == "store":
+        return ejecutar_script("almacen_geometria.py", [args.carpeta, args.destino])
+    if args.comando == "regression":
+        return ejecutar_script(SCRIPTS["regression"][0], [args.modo, args.n])
+    if args.comando == "exceptions" and args.archivo:
+        return ejecutar_script(SCRIPTS["exceptions"][0], [args.archivo])
+    return ejecutar_script(SCRIPTS[args.comando][0])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from vecinos import LONGITUD_MINIMA
+from medicion import contar
+
+# Prefiltro de consultas de vecinos por atributos del link.
+# Cada script solo necesita el número de vecinos de los links cuyo veredicto depende de él:
+#   multidigit -> todos los segmentos propios con longitud >= LONGITUD_MINIMA
+#   excepcion  -> además, MULTIDIGIT original YES/Y y longitud > 10 (si no, EXCEPTION_LEGIT
+#                 es NO sin importar los vecinos)
+# Los segmentos de borde (de archivos vecinos) nunca se consultan: solo sirven como
+# candidatos. Los descartados siguen en el STRtree como vecinos posibles de los demás, así
+# que los veredictos no cambian. Clase funcional y sentido de circulación no deciden nada
+# (cambiarían los veredictos); solo se usan para desglosar cuánto se achicó la consulta.
+
+LONGITUD_EXCEPCION = 10
+COLUMNAS_CLASE = ["FUNC_CLASS", "func_class", "FUNCTIONAL_CLASS", "functional_class"]
+COLUMNAS_SENTIDO = ["DIR_TRAVEL", "dir_travel", "DIRECTION", "direction"]
+OBJETIVOS = ("multidigit", "excepcion")
+
+
+def _primera_columna(gdf, candidatas):
+    return next((c for c in candidatas if c in gdf.columns), None)
+
+
+def reglas_consulta(gdf, objetivo="multidigit", es_borde=None):
+    """
+    Lista ordenada de (nombre, máscara) con los links que cada regla deja como consulta.
+    gdf debe estar en EPSG:3857.
+    """
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo de prefiltro no reconocido: {objetivo}. Opciones: {', '.join(OBJETIVOS)}")
+    longitudes = gdf.geometry.length.to_numpy()
+    reglas = [("longitud", longitudes >= LONGITUD_MINIMA)]
+    if es_borde is not None:
+        reglas.append(("borde", ~np.asarray(es_borde, dtype=bool)))
+    if objetivo == "excepcion":
+        multidigit = gdf["MULTIDIGIT"].astype(str).str.strip().str.upper()
+        reglas.append(("multidigit_original", multidigit.isin(["YES", "Y"]).to_numpy()))
+        reglas.append(("longitud_excepcion", longitudes > LONGITUD_EXCEPCION))
+    return reglas
+
+
+def consultas_necesarias(gdf, objetivo="multidigit", es_borde=None):
+    """
+    Máscara de links que necesitan búsqueda de vecinos y reporte de cuánto descartó cada
+    regla (en orden, sobre lo que dejó la anterior).
+    """
+    mascara = np.ones(len(gdf), dtype=bool)
+    filas = []
+    for nombre, regla in reglas_consulta(gdf, objetivo, es_borde):
+        antes = int(mascara.sum())
+        mascara &= regla
+        filas.append({"regla": nombre, "descartados": antes - int(mascara.sum()), "quedan": int(mascara.sum())})
+    reporte = pd.DataFrame(filas, columns=["regla", "descartados", "quedan"])
+    contar("consultas_vecinos", int(mascara.sum()))
+    contar("consultas_descartadas", len(gdf) - int(mascara.sum()))
+    return mascara, reporte
+
+
+def desglose(gdf, mascara):
+    """
+    Consultas y descartes por clase funcional y sentido de circulación (las columnas que
+    la capa traiga). None si no trae ninguna.
+    """
+    columnas = [c for c in (_primera_columna(gdf, COLUMNAS_CLASE), _primera_columna(gdf, COLUMNAS_SENTIDO)) if c]
+    if not columnas:
+        return None
+    tabla = gdf[columnas].astype(str).assign(consulta=np.asarray(mascara, dtype=bool))
+    resumen = tabla.groupby(columnas, observed=True)["consulta"].agg(links="size", consultas="sum").reset_index()
+    resumen["descartados"] = resumen["links"] - resumen["consultas"]
+    return resumen
+
+
+def imprimir_prefiltro(gdf, mascara, reporte):
+    """
+    Resumen en consola de cuánto se achicó el conjunto de consultas.
+    """
+    total = len(gdf)
+    quedan = int(np.asarray(mascara).sum())
+    reduccion = 100 * (total - quedan) / total if total else 0.0
+    print(f"Prefiltro de vecinos: {quedan} de {total} links consultados ({reduccion:.1f} % menos)")
+    for fila in reporte.itertuples(index=False):
+        print(f"   {fila.regla}: -{fila.descartados} (quedan {fila.quedan})")
+    por_clase = desglose(gdf, mascara)
+    if por_clase is not None:
+        print(por_clase.to_string(index=False))
@@ -0,0 +1,194 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+# Puntos de control para corridas largas que se pueden reanudar (CHECKPOINTS=<carpeta>).
+#   - por etapa: las tablas que deja la etapa (parquet) y sus valores escalares
+#   - por partición: dentro de una etapa, cada partición terminada (un zoom de la pirámide,
+#     un lote de snapshots) con el manifiesto de tiles que usó. Las particiones empezadas y
+#     no terminadas quedan "en curso": al reanudar se rehace solo lo que les falta
+# Cada archivo se escribe a un temporal y se mueve con os.replace. El manifiesto
+# (manifiesto.json, también reemplazado de forma atómica) es el punto de confirmación: lo
+# que no está en él no cuenta como terminado, aunque sus archivos ya existan.
+# El manifiesto guarda una huella de las entradas (nombre, tamaño y fecha de cada archivo
+# más los parámetros que cambian el resultado); si la huella no coincide, los puntos de
+# control anteriores se descartan y la corrida empieza de cero.
+
+VERSION = 1
+
+
+def huella_entradas(rutas, parametros=None):
+    """
+    blake2b de nombre, tamaño y fecha de modificación de cada archivo, más los parámetros.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for ruta in sorted(rutas):
+        estado = os.stat(ruta)
+        h.update(f"{os.path.basename(ruta)}|{estado.st_size}|{estado.st_mtime_ns}\n".encode())
+    h.update(json.dumps(parametros or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _escribir_atomico(ruta, escribir):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+class PuntosControlNulo:
+    """
+    Sin CHECKPOINTS: nada está terminado y nada se guarda.
+    """
+    activo = False
+
+    def etapa_lista(self, nombre):
+        return False
+
+    def guardar_etapa(self, nombre, tablas=None, valores=None):
+        pass
+
+    def particiones_listas(self, etapa):
+        return {}
+
+    def en_curso(self, etapa):
+        return set()
+
+    def iniciar_particion(self, etapa, particion):
+        pass
+
+    def anotar_faltantes(self, etapa, particion, faltantes):
+        pass
+
+    def confirmar_particion(self, etapa, particion, detalle=None):
+        pass
+
+
+class PuntosControl:
+    """
+    Puntos de control de una corrida en `directorio`, válidos para la huella dada.
+    """
+    activo = True
+
+    def __init__(self, directorio, huella):
+        self.directorio = directorio
+        self.ruta_manifiesto = os.path.join(directorio, "manifiesto.json")
+        self._candado = threading.Lock()
+
+        manifiesto = None
+        if os.path.exists(self.ruta_manifiesto):
+            with open(self.ruta_manifiesto, encoding="utf-8") as f:
+                manifiesto = json.load(f)
+            if manifiesto.get("version") != VERSION or manifiesto.get("huella") != huella:
+                print(f"Las entradas cambiaron; se descartan los puntos de control de {directorio}")
+                shutil.rmtree(directorio)
+                manifiesto = None
+        if manifiesto is None:
+            manifiesto = {"version": VERSION, "huella": huella, "etapas": {}, "particiones": {}, "en_curso": {},
+                          "faltantes": {}}
+        elif manifiesto["etapas"] or manifiesto["particiones"]:
+            print(f"Reanudando desde {directorio}: etapas listas {sorted(manifiesto['etapas'])}")
+        os.makedirs(directorio, exist_ok=True)
+        self.manifiesto = manifiesto
+
+    def _confirmar(self):
+        contenido = json.dumps(self.manifiesto, ensure_ascii=False, indent=1, default=str)
+
+        def escribir(temporal):
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+
+        _escribir_atomico(self.ruta_manifiesto, escribir)
+
+    # === ETAPAS ===
+    def etapa_lista(self, nombre):
+        return nombre in self.manifiesto["etapas"]
+
+    def guardar_etapa(self, nombre, tablas=None, valores=None):
+        """
+        Guarda las tablas (DataFrame o GeoDataFrame, en parquet) y los valores de la etapa
+        y la confirma en el manifiesto.
+        """
+        archivos = {}
+        for clave, tabla in (tablas or {}).items():
+            archivo = f"{nombre}.{clave}.parquet"
+            _escribir_atomico(os.path.join(self.directorio, archivo), lambda t, tabla=tabla: tabla.to_parquet(t, index=False))
+            archivos[clave] = {"archivo": archivo, "geo": hasattr(tabla, "geometry")}
+        with self._candado:
+            self.manifiesto["etapas"][nombre] = {"tablas": archivos, "valores": valores or {}}
+            self._confirmar()
+
+    def cargar_etapa(self, nombre):
+        """
+        (tablas, valores) de una etapa confirmada.
+        """
+        import pandas as pd
+
+        etapa = self.manifiesto["etapas"][nombre]
+        tablas = {}
+        for clave, info in etapa["tablas"].items():
+            ruta = os.path.join(self.directorio, info["archivo"])
+            if info["geo"]:
+                import geopandas as gpd
+                tablas[clave] = gpd.read_parquet(ruta)
+            else:
+                tablas[clave] = pd.read_parquet(ruta)
+        return tablas, etapa["valores"]
+
+    # === PARTICIONES ===
+    def particiones_listas(self, etapa):
+        """
+        {partición: detalle} de las particiones confirmadas de la etapa.
+        """
+        return dict(self.manifiesto["particiones"].get(etapa, {}))
+
+    def en_curso(self, etapa):
+        """
+        Particiones de la etapa que se empezaron en esta huella y no se confirmaron.
+        """
+        return set(self.manifiesto["en_curso"].get(etapa, []))
+
+    def iniciar_particion(self, etapa, particion):
+        """
+        Anota la partición como en curso: sus archivos escritos de forma atómica se pueden
+        reutilizar al reanudar, porque son de esta misma huella.
+        """
+        with self._candado:
+            en_curso = self.manifiesto["en_curso"].setdefault(etapa, [])
+            if str(particion) not in en_curso:
+                en_curso.append(str(particion))
+                self._confirmar()
+
+    def anotar_faltantes(self, etapa, particion, faltantes):
+        """
+        Deja la partición en curso con la lista de lo que le falta (p. ej. imágenes que no
+        se pudieron guardar); al reanudar se reintenta.
+        """
+        with self._candado:
+            self.manifiesto.setdefault("faltantes", {}).setdefault(etapa, {})[str(particion)] = list(faltantes)
+            self._confirmar()
+
+    def confirmar_particion(self, etapa, particion, detalle=None):
+        """
+        Marca la partición como terminada, con su detalle (p. ej. el manifiesto de tiles).
+        """
+        with self._candado:
+            self.manifiesto["particiones"].setdefault(etapa, {})[str(particion)] = detalle or {}
+            en_curso = self.manifiesto["en_curso"].get(etapa, [])
+            if str(particion) in en_curso:
+                en_curso.remove(str(particion))
+            self.manifiesto.get("faltantes", {}).get(etapa, {}).pop(str(particion), None)
+            self._confirmar()
+
+
+def puntos_control_desde_entorno(nombre, entradas, parametros=None):
+    """
+    PuntosControl en CHECKPOINTS/<nombre> si CHECKPOINTS está definido; si no, PuntosControlNulo.
+    """
+    raiz = os.getenv("CHECKPOINTS")
+    if not raiz:
+        return PuntosControlNulo()
+    return PuntosControl(os.path.join(raiz, nombre), huella_entradas(entradas, parametros))
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from lados import lados_declarados, lados_geometricos
+from exportar import escribir_csv
+from medicion import contar
+from orden_espacial import curva_espacial, orden_geometrias
+
+# Reasociación de POIs con relink a un link cercano.
+# Para todos los POIs marcados a la vez:
+#   1. sindex.nearest sobre todos los links de STREETS_NAMING_ADDRESSING da el link más
+#      cercano y su distancia d1
+#   2. una sola consulta al mismo índice trae los links a menos de d1 + MARGEN_CANDIDATOS
+#   3. se calcula distancia y lado geométrico del POI respecto a cada candidato, se ordenan
+#      (primero los que coinciden con el lado declarado, luego por distancia) y se dejan k
+# Sugerencia por POI: el mejor candidato consistente con el lado declarado (LINK_ID nuevo,
+# PERCFRREF igual) o, si no hay ninguno, el mismo link con el lado invertido
+# (PERCFRREF -> 1000 - PERCFRREF, que pasa de L a R y viceversa).
+# Con ORDEN_ESPACIAL las consultas al índice se lanzan en orden de la curva; la salida
+# queda en el orden de los POIs igual.
+
+K_CANDIDATOS = 3
+MARGEN_CANDIDATOS = 50  # metros (EPSG:3857) más allá del link más cercano
+
+
+def candidatos_links(puntos, calles, link_actual, percfrref, k=K_CANDIDATOS, margen=MARGEN_CANDIDATOS):
+    """
+    Top-k links candidatos por POI. puntos y calles en EPSG:3857; calles con link_id.
+    Devuelve un DataFrame con fila (posición del POI), rango, link_id, distancia,
+    lado geométrico, consistente (coincide con el lado declarado) y es_actual.
+    """
+    geoms = np.asarray(puntos, dtype=object)
+    lineas = np.asarray(calles.geometry.values, dtype=object)
+    validos = np.flatnonzero(~shapely.is_missing(geoms) & ~shapely.is_empty(geoms))
+    curva = curva_espacial()
+    if curva is not None:
+        validos = validos[orden_geometrias(geoms[validos], curva)]
+
+    if len(validos) == 0 or len(lineas) == 0:
+        i = j = np.empty(0, dtype=np.int64)
+        distancia = np.empty(0)
+    else:
+        arbol = calles.sindex
+        (_, _), d1 = arbol.nearest(geoms[validos], return_all=False, return_distance=True)
+        radios = d1 + margen
+        idx, j = arbol.query(shapely.buffer(geoms[validos], radios), predicate="intersects")
+        i = validos[idx]
+        distancia = shapely.distance(geoms[i], lineas[j])
+        cerca = distancia <= radios[idx]
+        i, j, distancia = i[cerca], j[cerca], distancia[cerca]
+    contar("candidatos_relink", len(i))
+
+    declarado = lados_declarados(np.asarray(percfrref, dtype=float)[i])
+    lado = lados_geometricos(geoms[i], lineas[j])
+    consistente = np.isin(declarado, ["L", "R"]) & (declarado == lado)
+
+    orden = np.lexsort((distancia, ~consistente, i))
+    candidatos = pd.DataFrame({
+        "fila": i[orden],
+        "link_id": calles["link_id"].array.take(j[orden]),
+        "distancia": distancia[orden].round(2),
+        "lado": lado[orden],
+        "consistente": consistente[orden],
+    })
+    actual = pd.Series(pd.array(link_actual).take(candidatos["fila"].to_numpy()))
+    candidatos["es_actual"] = (candidatos["link_id"] == actual).fillna(False).to_numpy(dtype=bool)
+    candidatos.insert(1, "rango", candidatos.groupby("fila").cumcount() + 1)
+    return candidatos[candidatos["rango"] <= k].reset_index(drop=True)
+
+
+def sugerencias(candidatos, link_actual, percfrref):
+    """
+    LINK_ID y PERCFRREF sugeridos para cada POI (una fila por POI, en posiciones).
+    """
+    n = len(link_actual)
+    percfrref = np.asarray(percfrref, dtype=float)
+    link_sugerido = pd.array(link_actual).copy()
+    percfrref_sugerido = 1000 - percfrref
+    motivo = np.full(n, "invertir_lado", dtype=object)
+    distancia = np.full(n, np.nan)
+
+    mejores = candidatos[candidatos["consistente"] & ~candidatos["es_actual"]].drop_duplicates("fila")
+    filas = mejores["fila"].to_numpy()
+    link_sugerido[filas] = mejores["link_id"].array
+    percfrref_sugerido[filas] = percfrref[filas]
+    motivo[filas] = "otro_link"
+    distancia[filas] = mejores["distancia"].to_numpy()
+
+    return pd.DataFrame({
+        "LINK_ID_SUGERIDO": link_sugerido,
+        "PERCFRREF_SUGERIDO": percfrref_sugerido,
+        "MOTIVO": motivo,
+        "DISTANCIA_SUGERIDA": distancia,
+    })
+
+
+def reasociar_relink(pois, calles, k=K_CANDIDATOS, ruta_candidatos="relink_candidatos.csv",
+                     ruta_sugerencias="relink_sugerencias.csv"):
+    """
+    Candidatos y sugerencias para los POIs dados (los marcados con relink). pois es un
+    GeoDataFrame con POI_ID, link_id, PERCFRREF y geometría de punto; calles, todos los
+    links. Escribe ambos CSV y devuelve la tabla de sugerencias.
+    """
+    pois = pois.reset_index(drop=True)
+    puntos = pois.geometry.to_crs(epsg=3857)
+    calles = calles[["link_id", calles.geometry.name]].drop_duplicates("link_id").to_crs(epsg=3857).reset_index(drop=True)
+    link_actual = pois["link_id"].array
+    percfrref = pois["PERCFRREF"].to_numpy(dtype=float)
+
+    candidatos = candidatos_links(puntos.values, calles, link_actual, percfrref, k)
+    sugeridas = sugerencias(candidatos, link_actual, percfrref)
+
+    candidatos.insert(0, "POI_ID", pois["POI_ID"].to_numpy()[candidatos["fila"].to_numpy()])
+    escribir_csv(candidatos.drop(columns="fila"), ruta_candidatos)
+
+    sugeridas.insert(0, "POI_ID", pois["POI_ID"].to_numpy())
+    sugeridas.insert(1, "LINK_ID", link_actual)
+    sugeridas.insert(2, "PERCFRREF", percfrref)
+    escribir_csv(sugeridas, ruta_sugerencias)
+    return sugeridas
@@ -0,0 +1,343 @@
+import os
+import sys
+import glob
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import LineString, MultiLineString, Point
+
+from main_validation import lado_declaro, calcular_lado_geometrico, evaluar_discrepancia, evaluar_segmentos
+from lados import lados_declarados, lados_geometricos, evaluar_lados
+from esquema import multidigit_bool
+from partes import solo_lineas
+
+# Arnés de regresión con salidas de referencia ("golden").
+# Corre lado a lado las implementaciones de referencia (el doble ciclo iterrows que estaba
+# en legitimate_exception.py / main_validation.py y las funciones fila por fila de lado)
+# y los motores optimizados (vecinos.py vía evaluar_segmentos, lados.py y el EVAL_MULTIDIGIT
+# vectorizado), compara MULTIDIGIT, EXCEPTION_LEGIT, EVAL_SIDE y EVAL_MULTIDIGIT por id y
+# registra el tiempo de cada lado.
+#
+# Uso:
+#   python regresion.py [sintetico|muestra|ambos] [n]
+# Escribe regresion_diferencias.csv (una fila por id que no coincide) y agrega una fila
+# por motor y conjunto a regresion_historial.csv. Termina con código 1 si hay diferencias.
+
+
+# === IMPLEMENTACIONES DE REFERENCIA ===
+# Copia fiel de los ciclos originales; no optimizar: son la definición del resultado correcto.
+# Los ciclos originales no admitían links de varias partes: aquí un MultiLineString se evalúa
+# parte por parte con el mismo criterio (basta un par de partes válido) y el lado se toma de
+# la parte más cercana al POI.
+
+def calculate_angle(line: LineString):
+    coords = list(line.coords)
+    if len(coords) < 2:
+        return None
+    x1, y1 = coords[0]
+    x2, y2 = coords[-1]
+    return math.degrees(math.atan2(y2 - y1, x2 - x1)) % 180
+
+
+def partes_de(geom):
+    return list(geom.geoms) if isinstance(geom, MultiLineString) else [geom]
+
+
+def referencia_segmentos(gdf_nav):
+    """
+    Ciclo iterrows original sobre una capa en EPSG:3857: MULTIDIGIT inferido y EXCEPTION_LEGIT.
+    """
+    gdf_nav = gdf_nav.copy()
+    gdf_nav["EXCEPTION_LEGIT"] = "NO"
+
+    for idx, segment in gdf_nav.iterrows():
+        geom = segment.geometry
+        link_id = segment.get("link_id")
+        if geom.length < 5:
+            continue
+
+        valid_neighbors = []
+        for parte in partes_de(geom):
+            angle_segment = calculate_angle(parte)
+            if angle_segment is None:
+                continue
+            buffer = parte.buffer(25)
+            nearby = gdf_nav[
+                (gdf_nav.geometry.intersects(buffer)) &
+                (gdf_nav["link_id"] != link_id) &
+                (gdf_nav.index != idx)
+            ]
+
+            for _, neighbor in nearby.iterrows():
+                for parte_vecina in partes_de(neighbor.geometry):
+                    if not parte_vecina.intersects(buffer):
+                        continue
+                    angle_neighbor = calculate_angle(parte_vecina)
+                    if angle_neighbor is None:
+                        continue
+                    angle_diff = abs(angle_segment - angle_neighbor)
+                    if angle_diff > 90:
+                        angle_diff = 180 - angle_diff
+                    overlap = parte.intersection(parte_vecina)
+                    overlap_ratio = overlap.length / parte.length if parte.length > 0 else 0
+                    centroid_distance = parte.centroid.distance(parte_vecina.centroid)
+                    if angle_diff <= 20 and (overlap_ratio >= 0.05 or centroid_distance < 25):
+                        valid_neighbors.append(neighbor)
+
+        inferred = "YES" if len(valid_neighbors) >= 1 else "NO"
+        gdf_nav.at[idx, "MULTIDIGIT"] = inferred
+        if str(segment.get("MULTIDIGIT")).strip().upper() in ["YES", "Y"] and len(valid_neighbors) >= 1 and geom.length > 10:
+            gdf_nav.at[idx, "EXCEPTION_LEGIT"] = "YES"
+    return gdf_nav
+
+
+def referencia_eval_multidigit(multidigit, excepcion):
+    if str(multidigit).strip().upper() in ['Y', 'YES']:
+        return 'ok' if excepcion == 'YES' else 'delete'
+    return 'ok'
+
+
+def parte_cercana(poi_point, line):
+    if isinstance(line, MultiLineString) and isinstance(poi_point, Point) and not line.is_empty:
+        return min(line.geoms, key=poi_point.distance)
+    return line
+
+
+def referencia_pois(gdf_pois):
+    """
+    EVAL_SIDE y EVAL_MULTIDIGIT fila por fila, con las funciones originales.
+    """
+    declarado = (gdf_pois['PERCFRREF'] / 1000.0).apply(lado_declaro)
+    geometrico = pd.Series(
+        [calcular_lado_geometrico(p, parte_cercana(p, l)) for p, l in zip(gdf_pois.geometry, gdf_pois['geometry_right'])],
+        index=gdf_pois.index,
+    )
+    eval_side = pd.Series(
+        [evaluar_discrepancia(d, g) for d, g in zip(declarado, geometrico)], index=gdf_pois.index
+    )
+    eval_multidigit = gdf_pois.apply(
+        lambda row: referencia_eval_multidigit(row['MULTIDIGIT'], row['EXCEPTION_LEGIT']), axis=1
+    )
+    return pd.DataFrame({"EVAL_SIDE": eval_side, "EVAL_MULTIDIGIT": eval_multidigit})
+
+
+# === MOTORES OPTIMIZADOS ===
+
+def optimizado_segmentos(gdf_nav):
+    # Sin grafo persistido: siempre se calcula de cero. GRAFO_VECINOS se quita solo durante
+    # la llamada y se restaura después para el resto del proceso
+    grafo = os.environ.pop("GRAFO_VECINOS", None)
+    try:
+        return evaluar_segmentos(gdf_nav, [])
+    finally:
+        if grafo is not None:
+            os.environ["GRAFO_VECINOS"] = grafo
+
+
+def optimizado_pois(gdf_pois):
+    declarado = lados_declarados(gdf_pois['PERCFRREF'].to_numpy(dtype=float))
+    geometrico = lados_geometricos(gdf_pois.geometry.values, gdf_pois['geometry_right'].values)
+    multidigit = multidigit_bool(gdf_pois['MULTIDIGIT']).to_numpy()
+    eval_multidigit = np.where(multidigit & (gdf_pois['EXCEPTION_LEGIT'] != 'YES').to_numpy(), 'delete', 'ok')
+    return pd.DataFrame({
+        "EVAL_SIDE": evaluar_lados(declarado, geometrico),
+        "EVAL_MULTIDIGIT": eval_multidigit,
+    }, index=gdf_pois.index)
+
+
+# === CONJUNTOS DE DATOS ===
+
+def segmentos_sinteticos(n, semilla=0):
+    """
+    Capa en EPSG:3857 con pares de calzadas paralelas (separación 5-40 m, con y sin
+    solape), segmentos sueltos, cortos, repetidos, con link_id repetido y links de dos
+    partes (MultiLineString con hueco y quiebre).
+    """
+    rng = np.random.default_rng(semilla)
+    lineas, link_ids = [], []
+    siguiente = 1
+    while len(lineas) < n:
+        x0, y0 = rng.uniform(0, 5000, 2)
+        angulo = rng.uniform(0, np.pi)
+        largo = rng.choice([3.0, 8.0, 12.0, rng.uniform(20, 300)])
+        dx, dy = np.cos(angulo) * largo, np.sin(angulo) * largo
+        if rng.random() < 0.2:
+            # Link de varias partes: el segundo tramo arranca tras un hueco y con un quiebre
+            medio = (x0 + dx / 2, y0 + dy / 2)
+            hueco = rng.uniform(0, 10)
+            quiebre = angulo + rng.normal(0, np.radians(30))
+            inicio2 = (medio[0] + np.cos(angulo) * hueco, medio[1] + np.sin(angulo) * hueco)
+            fin2 = (inicio2[0] + np.cos(quiebre) * largo / 2, inicio2[1] + np.sin(quiebre) * largo / 2)
+            lineas.append(MultiLineString([[(x0, y0), medio], [inicio2, fin2]]))
+        else:
+            lineas.append(LineString([(x0, y0), (x0 + dx, y0 + dy)]))
+        link_ids.append(siguiente)
+        if rng.random() < 0.6:
+            # Calzada gemela: desplazada en perpendicular, quizá girada y corrida a lo largo
+            separacion = rng.uniform(5, 40)
+            giro = rng.normal(0, np.radians(12))
+            corrimiento = rng.uniform(-0.5, 0.5) * largo
+            px, py = -np.sin(angulo) * separacion, np.cos(angulo) * separacion
+            ax, ay = np.cos(angulo) * corrimiento, np.sin(angulo) * corrimiento
+            dx2, dy2 = np.cos(angulo + giro) * largo, np.sin(angulo + giro) * largo
+            inicio = (x0 + px + ax, y0 + py + ay)
+            # A veces invertida: el ángulo se toma módulo 180, así que debe seguir contando
+            if rng.random() < 0.5:
+                lineas.append(LineString([inicio, (inicio[0] + dx2, inicio[1] + dy2)]))
+            else:
+                lineas.append(LineString([(inicio[0] + dx2, inicio[1] + dy2), inicio]))
+            link_ids.append(siguiente if rng.random() < 0.05 else siguiente + 1)
+        siguiente += 2
+    multidigit = rng.choice(["Y", "YES", "N", "NO", " y ", None], size=len(lineas))
+    gdf = gpd.GeoDataFrame({"link_id": link_ids, "MULTIDIGIT": multidigit}, geometry=lineas, crs="EPSG:3857")
+    return gdf.iloc[:n].reset_index(drop=True)
+
+
+def pois_sinteticos(gdf_nav, n, semilla=0):
+    """
+    POIs a ambos lados, sobre la recta y con PERCFRREF nulo o en los umbrales.
+    """
+    rng = np.random.default_rng(semilla + 1)
+    filas = rng.integers(0, len(gdf_nav), n)
+    lineas = gdf_nav.geometry.to_crs(epsg=4326).values[filas]
+    centroides = gpd.GeoSeries(lineas, crs="EPSG:4326").centroid.values
+    desplazamiento = rng.choice([-1e-4, 0.0, 1e-4], size=(n, 2))
+    puntos = [Point(c.x + d[0], c.y + d[1]) for c, d in zip(centroides, desplazamiento)]
+    percfrref = rng.choice([np.nan, 0, 299, 300, 500, 700, 701, 1000], size=n)
+    return gpd.GeoDataFrame({
+        "POI_ID": np.arange(1, n + 1),
+        "PERCFRREF": percfrref,
+        "MULTIDIGIT": gdf_nav["MULTIDIGIT"].to_numpy()[filas],
+        "EXCEPTION_LEGIT": rng.choice(["YES", "NO", None], size=n),
+        "geometry_right": gpd.GeoSeries(lineas, crs="EPSG:4326").values,
+    }, geometry=puntos, crs="EPSG:4326")
+
+
+def segmentos_muestra(n, semilla=0):
+    """
+    Los n segmentos de STREETS_NAV más cercanos a un segmento elegido al azar
+    (una zona compacta, para que haya vecinos reales).
+    """
+    archivos = sorted(glob.glob("STREETS_NAV/*.geojson"))
+    if not archivos:
+        raise FileNotFoundError("No se encontró ningún archivo en STREETS_NAV/")
+    gdf = gpd.read_file(archivos[0])
+    gdf = solo_lineas(gdf).to_crs(epsg=3857).reset_index(drop=True)
+    centroides = gdf.geometry.centroid
+    semilla_pos = np.random.default_rng(semilla).integers(0, len(gdf))
+    distancia = centroides.distance(centroides.iloc[semilla_pos]).to_numpy()
+    return gdf.iloc[np.argsort(distancia, kind="stable")[:n]].reset_index(drop=True)
+
+
+# === COMPARACIÓN ===
+
+def diferencias(referencia, optimizado, columnas, ids, conjunto):
+    filas = []
+    for columna in columnas:
+        ref = referencia[columna].astype(str).to_numpy()
+        opt = optimizado[columna].astype(str).to_numpy()
+        distintos = np.flatnonzero(ref != opt)
+        filas.append(pd.DataFrame({
+            "conjunto": conjunto,
+            "columna": columna,
+            "id": np.asarray(ids)[distintos],
+            "referencia": ref[distintos],
+            "optimizado": opt[distintos],
+        }))
+    return pd.concat(filas, ignore_index=True)
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def comparar(conjunto, gdf_nav, gdf_pois):
+    """
+    Corre referencia y optimizado sobre un conjunto. Devuelve (diferencias, filas de historial).
+    """
+    ref_nav, t_ref_nav = cronometrar(referencia_segmentos, gdf_nav)
+    opt_nav, t_opt_nav = cronometrar(optimizado_segmentos, gdf_nav)
+    ref_pois, t_ref_pois = cronometrar(referencia_pois, gdf_pois)
+    opt_pois, t_opt_pois = cronometrar(optimizado_pois, gdf_pois)
+
+    difs = pd.concat([
+        diferencias(ref_nav, opt_nav, ["MULTIDIGIT", "EXCEPTION_LEGIT"], gdf_nav["link_id"], conjunto),
+        diferencias(ref_pois, opt_pois, ["EVAL_SIDE", "EVAL_MULTIDIGIT"], gdf_pois["POI_ID"], conjunto),
+    ], ignore_index=True)
+
+    fecha = datetime.now().isoformat(timespec="seconds")
+    historial = []
+    for motor, n, t_ref, t_opt, columnas in [
+        ("segmentos", len(gdf_nav), t_ref_nav, t_opt_nav, ["MULTIDIGIT", "EXCEPTION_LEGIT"]),
+        ("pois", len(gdf_pois), t_ref_pois, t_opt_pois, ["EVAL_SIDE", "EVAL_MULTIDIGIT"]),
+    ]:
+        historial.append({
+            "fecha": fecha,
+            "conjunto": conjunto,
+            "motor": motor,
+            "filas": n,
+            "segundos_referencia": round(t_ref, 4),
+            "segundos_optimizado": round(t_opt, 4),
+            "aceleracion": round(t_ref / t_opt, 2) if t_opt > 0 else float("inf"),
+            "diferencias": int(difs["columna"].isin(columnas).sum() if len(difs) else 0),
+        })
+    return difs, historial
+
+
+def conjunto_muestra(n, semilla=0):
+    from indice_links import IndiceLinks, cargar_pois
+
+    gdf_nav = segmentos_muestra(n, semilla)
+    # POIs reales cuyos links están en la muestra, con la línea del link y resultados simulados
+    df_pois = cargar_pois(sorted(glob.glob("POIs/*.csv")))
+    indice = IndiceLinks(gdf_nav.to_crs(epsg=4326).assign(link_id=pd.to_numeric(gdf_nav["link_id"], errors="coerce").astype("Int64")))
+    posiciones = indice.resolver(df_pois["LINK_ID"])
+    df_pois = df_pois[posiciones >= 0].reset_index(drop=True)
+    posiciones = posiciones[posiciones >= 0]
+    lineas = indice.tomar(posiciones, "geometry")
+    centroides = gpd.GeoSeries(lineas, crs="EPSG:4326").to_crs(epsg=3857).centroid.to_crs(epsg=4326)
+    gdf_pois = gpd.GeoDataFrame(df_pois.assign(
+        MULTIDIGIT=indice.tomar(posiciones, "MULTIDIGIT"),
+        EXCEPTION_LEGIT=np.random.default_rng(semilla).choice(["YES", "NO"], size=len(df_pois)),
+        geometry_right=gpd.GeoSeries(lineas, crs="EPSG:4326").values,
+    ), geometry=centroides.values, crs="EPSG:4326")
+    return gdf_nav, gdf_pois
+
+
+if __name__ == "__main__":
+    modo = sys.argv[1] if len(sys.argv) > 1 else "sintetico"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    conjuntos = []
+    if modo in ("sintetico", "ambos"):
+        nav = segmentos_sinteticos(n)
+        conjuntos.append(("sintetico", nav, pois_sinteticos(nav, n)))
+    if modo in ("muestra", "ambos"):
+        conjuntos.append(("muestra", *conjunto_muestra(n)))
+    if not conjuntos:
+        raise SystemExit("Modo desconocido; usa sintetico, muestra o ambos")
+
+    todas, historial = [], []
+    for nombre, gdf_nav, gdf_pois in conjuntos:
+        difs, filas = comparar(nombre, gdf_nav, gdf_pois)
+        todas.append(difs)
+        historial.extend(filas)
+
+    difs = pd.concat(todas, ignore_index=True)
+    difs.to_csv("regresion_diferencias.csv", index=False)
+    historial = pd.DataFrame(historial)
+    ruta_historial = "regresion_historial.csv"
+    historial.to_csv(ruta_historial, mode="a", index=False, header=not os.path.exists(ruta_historial))
+
+    print(historial.to_string(index=False))
+    if len(difs):
+        print(f"\n❌ {len(difs)} diferencias; detalle en regresion_diferencias.csv")
+        print(difs.groupby(["conjunto", "columna"]).size().to_string())
+        sys.exit(1)
+    print("\n✅ Sin diferencias entre referencia y motores optimizados.")
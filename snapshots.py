@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pandas as pd
+
+from esquema import a_entero
+
+# Programador de snapshots: en vez de guardar las primeras N imágenes en orden de
+# iteración, se puntúa cada elemento marcado y se eligen los K más relevantes dentro
+# del presupuesto de solicitudes de tiles.
+#
+# Características (columnas opcionales del DataFrame de elementos marcados):
+#   longitud        -> longitud del segmento en metros
+#   densidad_pois   -> POIs asociados al mismo link
+# Cada característica presente se pasa a percentil (rank(pct=True), de 0 a 1, así un valor
+# extremo no aplasta al resto) y se suma con su peso.
+
+PESOS = {
+    "longitud": 1.0,
+    "densidad_pois": 1.0,
+}
+PRESUPUESTO_DEFECTO = 20
+
+
+def presupuesto_snapshots():
+    """
+    Número máximo de tiles a solicitar, leído de PRESUPUESTO_SNAPSHOTS (por defecto 20).
+    """
+    return max(0, int(os.getenv("PRESUPUESTO_SNAPSHOTS", str(PRESUPUESTO_DEFECTO))))
+
+
+def puntuar(marcados, pesos=PESOS):
+    """
+    Devuelve una Serie con el puntaje de cada elemento. Las columnas ausentes o
+    constantes no aportan nada, así que el mismo puntaje sirve para segmentos y POIs.
+    """
+    puntaje = pd.Series(0.0, index=marcados.index)
+    for columna, peso in pesos.items():
+        if columna not in marcados.columns:
+            continue
+        valores = pd.to_numeric(marcados[columna], errors="coerce")
+        if valores.nunique(dropna=True) <= 1:
+            continue
+        puntaje += peso * valores.rank(pct=True).fillna(0.0)
+    return puntaje
+
+
+def seleccionar(marcados, presupuesto=None, pesos=PESOS):
+    """
+    Los elementos con mayor puntaje, hasta agotar el presupuesto (una solicitud por
+    elemento). Los empates se resuelven por el orden original para que sea determinista.
+    """
+    if presupuesto is None:
+        presupuesto = presupuesto_snapshots()
+    marcados = marcados.assign(puntaje=puntuar(marcados, pesos))
+    orden = np.lexsort((np.arange(len(marcados)), -marcados["puntaje"].to_numpy()))
+    return marcados.iloc[orden[:presupuesto]]
+
+
+def contar_pois_por_link(rutas_csv, columna="LINK_ID"):
+    """
+    Número de POIs por link leyendo solo la columna LINK_ID de los CSV de POIs. El índice
+    es Int64 (esquema.a_entero): un LINK_ID nulo vuelve float la columna y como texto
+    quedaría "123.0"; los nulos no se cuentan.
+    """
+    if not rutas_csv:
+        return pd.Series(dtype="int64", index=pd.Index([], dtype="Int64"))
+    links = pd.concat([pd.read_csv(f, usecols=[columna])[columna] for f in rutas_csv], ignore_index=True)
+    return a_entero(links).value_counts()
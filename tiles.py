@@ -0,0 +1,144 @@
+import os
+import math
+
+from medicion import contar
+from fuentes_tiles import FuenteHERE, fuente_tiles
+
+# Funciones de tiles compartidas (Web Mercator, esquema z/x/y), lectura de tiles de la
+# fuente configurada (fuentes_tiles: HERE, carpeta local o MBTiles) y caché en disco
+# (CACHE_TILES/z/x/y.<formato>) para la fuente remota.
+# requests y numpy se importan al usarse, no al importar el módulo.
+
+TAMANO_TILE = 512
+
+
+def lat_lon_to_tile(lat, lon, zoom):
+    """
+    Convierte una latitud y longitud a coordenadas de tile (x, y) para un nivel de zoom dado.
+    """
+    lat = min(max(lat, -85.0511), 85.0511)
+    lat_rad = math.radians(lat)
+    n = 2.0 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+    return x, y
+
+
+def tile_coords_to_lat_lon(x, y, zoom):
+    """
+    Convierte coordenadas de tile (x, y) y nivel de zoom a latitud y longitud.
+    """
+    n = 2.0 ** zoom
+    lon_deg = x / n * 360.0 - 180.0
+    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
+    lat_deg = math.degrees(lat_rad)
+    return lat_deg, lon_deg
+
+
+def get_tile_bounds(x, y, zoom):
+    """
+    Devuelve los límites geográficos (lat1, lon1, lat2, lon2) de un tile.
+    """
+    lat1, lon1 = tile_coords_to_lat_lon(x, y, zoom)
+    lat2, lon2 = tile_coords_to_lat_lon(x + 1, y + 1, zoom)
+    return lat1, lon1, lat2, lon2
+
+
+def latlon_to_pixel(lat, lon, bounds, tile_size=TAMANO_TILE):
+    """
+    Convierte una latitud y longitud a coordenadas de píxel (x, y) dentro de un tile de
+    tile_size píxeles (un entero o (ancho, alto), p. ej. image.size), usando los límites
+    geográficos del tile.
+    """
+    ancho, alto = tile_size if isinstance(tile_size, tuple) else (tile_size, tile_size)
+    lat1, lon1, lat2, lon2 = bounds
+    x_rel = (lon - lon1) / (lon2 - lon1)
+    y_rel = (lat1 - lat) / (lat1 - lat2)
+    return int(x_rel * ancho), int(y_rel * alto)
+
+
+def url_tile_here(x, y, zoom, tile_format, api_key, tile_size=TAMANO_TILE):
+    return FuenteHERE(api_key, tamano=tile_size).url(x, y, zoom, tile_format)
+
+
+def descargar_tile(x, y, zoom, tile_format, api_key, sesion=None, timeout=30):
+    """
+    Descarga los bytes de un tile satelital de HERE. Devuelve None si la respuesta no es 200.
+    """
+    return FuenteHERE(api_key, timeout=timeout).tile(x, y, zoom, tile_format, sesion)
+
+
+def directorio_cache():
+    """
+    Carpeta del caché de tiles en disco, leída de CACHE_TILES (por defecto 'cache_tiles').
+    """
+    return os.getenv("CACHE_TILES", "cache_tiles")
+
+
+def ruta_cache(x, y, zoom, tile_format, directorio=None):
+    return os.path.join(directorio or directorio_cache(), str(zoom), str(x), f"{y}.{tile_format}")
+
+
+def obtener_tile(x, y, zoom, tile_format, api_key, sesion=None, directorio=None):
+    """
+    Devuelve los bytes del tile de la fuente configurada (FUENTE_TILES). Las fuentes locales
+    (carpeta o MBTiles) se leen directo; con HERE se usa el caché en disco y, si no está,
+    se descarga y se guarda. Sin api_key solo se consulta el caché.
+    """
+    fuente = fuente_tiles(api_key)
+    if fuente.local:
+        contenido = fuente.tile(x, y, zoom, tile_format)
+        contar("tiles_locales" if contenido is not None else "tiles_fallidos")
+        return contenido
+
+    ruta = ruta_cache(x, y, zoom, tile_format, directorio)
+    if os.path.exists(ruta):
+        contar("tiles_cache_disco")
+        with open(ruta, "rb") as f:
+            return f.read()
+    if not api_key:
+        return None
+
+    contenido = fuente.tile(x, y, zoom, tile_format, sesion)
+    contar("tiles_descargados" if contenido is not None else "tiles_fallidos")
+    if contenido is not None:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+    return contenido
+
+
+def tiles_vectorizados(lat, lon, zoom):
+    """
+    Versión vectorizada de lat_lon_to_tile para arreglos de latitudes y longitudes.
+    """
+    import numpy as np
+
+    lat = np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511)
+    lon = np.asarray(lon, dtype=float)
+    lat_rad = np.radians(lat)
+    n = 2.0 ** zoom
+    x = ((lon + 180.0) / 360.0 * n).astype(np.int64)
+    y = ((1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2.0 * n).astype(np.int64)
+    return x, y
+
+
+def posicion_relativa_en_tile(lat, lon, x, y, zoom):
+    """
+    Versión vectorizada de latlon_to_pixel sin escalar: posición (0-1, 0-1) de cada punto
+    dentro de su tile (x, y), con la misma interpolación lineal entre los límites del tile.
+    """
+    import numpy as np
+
+    n = 2.0 ** zoom
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lon1 = x / n * 360.0 - 180.0
+    lon2 = (x + 1) / n * 360.0 - 180.0
+    lat1 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    lat2 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
+    x_rel = (np.asarray(lon, dtype=float) - lon1) / (lon2 - lon1)
+    y_rel = (lat1 - np.asarray(lat, dtype=float)) / (lat1 - lat2)
+    return x_rel, y_rel
@@ -1,14 +1,16 @@
 import os
 import math
 import glob
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import LineString, Point
-from PIL import Image
-from io import BytesIO
-import requests
-import matplotlib.pyplot as plt
+from shapely.geometry import LineString
 from dotenv import load_dotenv
+from esquema import tipar_resultados, multidigit_bool
+from indice_links import IndiceLinks, cargar_pois, cargar_calles, reporte_sin_link
+from exportar import escribir_csv
+from duplicados_pois import distancia_duplicados, colapsar_duplicados
+from lados import lados_geometricos
 
 # === CARGAR VARIABLES DE ENTORNO ===
 load_dotenv()
@@ -63,65 +65,82 @@ def fetch_satellite_tile(lat, lon, zoom, tile_format):
     Descarga una imagen satelital de HERE para una latitud, longitud y zoom dados.
     Devuelve la imagen y los límites geográficos del tile.
     """
+    # Capa compartida en memoria: pedidos simultáneos del mismo tile se descargan una sola
+    # vez y la imagen decodificada se reutiliza (no modificarla en sitio)
+    from capa_tiles import capa_compartida
+
     x, y = lat_lon_to_tile(lat, lon, zoom)
-    url = f'https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{tile_format}?apiKey={api_key}&style=satellite.day&size=512'
-    response = requests.get(url)
-    if response.status_code != 200:
+    image = capa_compartida().imagen(x, y, zoom, tile_format, api_key)
+    if image is None:
         return None, None
-    image = Image.open(BytesIO(response.content))
     return image, get_tile_bounds(x, y, zoom)
 
-def latlon_to_pixel(lat, lon, bounds):
+def latlon_to_pixel(lat, lon, bounds, tamano=(512, 512)):
     """
-    Convierte una latitud y longitud a coordenadas de píxel (x, y) dentro de una imagen de 512x512 píxeles,
-    usando los límites geográficos del tile.
+    Convierte una latitud y longitud a coordenadas de píxel (x, y) dentro de una imagen de
+    tamano = (ancho, alto) píxeles (pasar image.size), usando los límites geográficos del tile.
     """
     lat1, lon1, lat2, lon2 = bounds
     x_rel = (lon - lon1) / (lon2 - lon1)
     y_rel = (lat1 - lat) / (lat1 - lat2)
-    return int(x_rel * 512), int(y_rel * 512)
+    return int(x_rel * tamano[0]), int(y_rel * tamano[1])
 
 # === CARGA DE DATOS ===
+# Todos los archivos: un POI puede apuntar a un link que vive en otro archivo de calles
 csv_files = sorted(glob.glob("POIs/*.csv"))
-df_pois = pd.concat([pd.read_csv(f) for f in csv_files], ignore_index=True)
+df_pois = cargar_pois(csv_files)
 
 geojson_calles = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))
-gdf_calles = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_calles], ignore_index=True))
+gdf_calles = cargar_calles(geojson_calles)
 
 geojson_nav = sorted(glob.glob("STREETS_NAV/*.geojson"))
-gdf_nav = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_nav], ignore_index=True))
+gdf_nav = cargar_calles(geojson_nav)
 
+# === ÍNDICE GLOBAL DE LINKS, MULTIDIGIT Y LONGITUD ===
+indice_calles = IndiceLinks(gdf_calles)
 if 'link_id' in gdf_nav.columns and 'MULTIDIGIT' in gdf_nav.columns:
-    gdf_calles = gdf_calles.merge(gdf_nav[['link_id', 'MULTIDIGIT']], on='link_id', how='left')
-
+    # MULTIDIGIT normalizado una sola vez a booleano
+    multidigit_calles = IndiceLinks(gdf_nav).valores_para(indice_calles.calles['link_id'], 'MULTIDIGIT')
+    indice_calles.calles['MULTIDIGIT'] = multidigit_bool(pd.Series(multidigit_calles)).to_numpy()
 # Segmentos proyectados para longitud
-gdf_calles_proj = gdf_calles.to_crs(epsg=3857)
-gdf_calles_proj["segment_length"] = gdf_calles_proj.geometry.length
-
-# Merge POIs con geometría y longitud
-df_merge = df_pois.merge(
-    gdf_calles_proj[['link_id', 'geometry', 'segment_length', 'MULTIDIGIT']],
-    left_on='LINK_ID',
-    right_on='link_id',
-    how='left'
-)
-
-# GeoDataFrame de POIs
-gdf_pois = gpd.GeoDataFrame(df_merge, geometry='geometry', crs=gdf_calles_proj.crs)
+indice_calles.calles['segment_length'] = indice_calles.calles.geometry.to_crs(epsg=3857).length.to_numpy()
+
+# === UNIÓN POIs ↔ LINKS (una sola pasada) ===
+pos_links = indice_calles.resolver(df_pois['LINK_ID'])
+resumen_sin_link = reporte_sin_link(df_pois, pos_links)
+for fila in resumen_sin_link[resumen_sin_link['sin_link'] > 0].itertuples():
+    print(f"⚠️ {fila.ARCHIVO_POI}: {fila.sin_link} de {fila.pois} POIs sin link ({fila.porcentaje}%)")
+# Igual que main_validation: los POIs sin link se reportan y no siguen a las evaluaciones
+encontrados = pos_links >= 0
+escribir_csv(df_pois.loc[~encontrados, ['POI_ID', 'POI_NAME', 'LINK_ID', 'ARCHIVO_POI']], "pois_sin_link.csv")
+df_pois = df_pois[encontrados].reset_index(drop=True)
+pos_links = pos_links[encontrados]
+lineas = indice_calles.tomar(pos_links, 'geometry')
+columnas_link = {
+    'link_id': indice_calles.tomar(pos_links, 'link_id'),
+    'segment_length': indice_calles.tomar(pos_links, 'segment_length'),
+}
+if 'MULTIDIGIT' in indice_calles.calles.columns:
+    columnas_link['MULTIDIGIT'] = indice_calles.tomar(pos_links, 'MULTIDIGIT')
+
+# GeoDataFrame de POIs en el centroide de su link; la línea del link se toma de las mismas
+# posiciones, sin un segundo merge
+gdf_pois = gpd.GeoDataFrame(df_pois.assign(**columnas_link), geometry=lineas, crs=gdf_calles.crs)
 gdf_pois = gdf_pois.to_crs(epsg=3857)
+gdf_pois['geometry_right'] = gdf_pois.geometry.copy()
 gdf_pois['geometry'] = gdf_pois['geometry'].centroid
 
-# Evaluación MULTIDIGIT más estricta
+# POIs duplicados (mismo nombre normalizado a menos de DUPLICADOS_POIS metros): se deja uno solo
+distancia = distancia_duplicados()
+if distancia:
+    gdf_pois, n_duplicados = colapsar_duplicados(gdf_pois, distancia)
+    print(f"POIs duplicados descartados: {n_duplicados} (detalle en pois_duplicados.csv)")
 
-def evaluate_multidigit(row):
-    """
-    Marca como 'delete' los POIs en segmentos largos (>=50m) y MULTIDIGIT=Y/YES.
-    """
-    if row['segment_length'] >= 50 and str(row['MULTIDIGIT']).strip().upper() in ['Y', 'YES']:
-        return 'delete'
-    return 'ok'
+# Evaluación MULTIDIGIT más estricta
 
-gdf_pois['EVAL_MULTIDIGIT'] = gdf_pois.apply(evaluate_multidigit, axis=1)
+# Marca como 'delete' los POIs en segmentos largos (>=50m) y MULTIDIGIT=Y/YES.
+multidigit = gdf_pois['MULTIDIGIT'].fillna(False).astype(bool)
+gdf_pois['EVAL_MULTIDIGIT'] = np.where((gdf_pois['segment_length'] >= 50) & multidigit, 'delete', 'ok')
 
 # Declaración de lado
 gdf_pois['PERCFRREF_NORM'] = gdf_pois['PERCFRREF'] / 1000.0
@@ -137,28 +156,8 @@ def lado_declaro(pct):
 
 gdf_pois['DECLARED_SIDE'] = gdf_pois['PERCFRREF_NORM'].apply(lado_declaro)
 
-# Geometría proyectada de nuevo
-gdf_calles = gdf_calles.to_crs(epsg=3857)
-gdf_pois = gdf_pois.merge(gdf_calles[['link_id', 'geometry']], on='link_id', how='left', suffixes=('', '_right'))
-
-# Cálculo de lado geométrico
-def calcular_lado_geometrico(poi_point, line):
-    """
-    Determina el lado geométrico del POI respecto a la calle usando el producto cruzado.
-    """
-    if not isinstance(line, LineString) or not isinstance(poi_point, Point):
-        return 'unknown'
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return 'unknown'
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    dx, dy = x2 - x1, y2 - y1
-    dxp, dyp = poi_point.x - x1, poi_point.y - y1
-    cross = dx * dyp - dy * dxp
-    return 'L' if cross > 0 else 'R' if cross < 0 else 'center'
-
-gdf_pois['GEOMETRIC_SIDE'] = gdf_pois.apply(lambda row: calcular_lado_geometrico(row.geometry, row.geometry_right), axis=1)
+# Lado geométrico vectorizado (lados.py); en un MultiLineString se usa la parte más cercana al POI
+gdf_pois['GEOMETRIC_SIDE'] = lados_geometricos(gdf_pois.geometry.values, gdf_pois['geometry_right'].values)
 
 def evaluar_discrepancia(declared, geo):
     """
@@ -172,6 +171,7 @@ def evaluar_discrepancia(declared, geo):
         return 'ok'
 
 gdf_pois['EVAL_SIDE'] = gdf_pois.apply(lambda row: evaluar_discrepancia(row['DECLARED_SIDE'], row['GEOMETRIC_SIDE']), axis=1)
+gdf_pois = tipar_resultados(gdf_pois)
 
 # Guardar
 gdf_pois[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']].to_csv("resultado_pois.csv", index=False)
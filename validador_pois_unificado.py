@@ -1,14 +1,17 @@
 import os
 import math
 import glob
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import LineString, Point
-from PIL import Image
-from io import BytesIO
-import requests
-import matplotlib.pyplot as plt
 from dotenv import load_dotenv
+from vecinos import contar_vecinos, LONGITUD_MINIMA
+from grafo_vecinos import vecinos_persistidos
+from partes import solo_lineas
+from lados import lados_geometricos
+from esquema import tipar_resultados, multidigit_bool
+from indice_links import IndiceLinks, cargar_pois, cargar_calles, reporte_sin_link
+from exportar import formato_salida, escribir_capa, escribir_delta, escribir_csv
 
 # === CARGAR VARIABLES DE ENTORNO ===
 load_dotenv()
@@ -17,14 +20,6 @@ if not api_key:
     raise ValueError("HERE_API_KEY no encontrado en .env")
 
 # === FUNCIONES GEOGRÁFICAS ===
-def calculate_angle(line: LineString):
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return None
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    return math.degrees(math.atan2(y2 - y1, x2 - x1)) % 180
-
 def lat_lon_to_tile(lat, lon, zoom):
     lat = min(max(lat, -85.0511), 85.0511)
     lat_rad = math.radians(lat)
@@ -46,52 +41,66 @@ def get_tile_bounds(x, y, zoom):
     return lat1, lon1, lat2, lon2
 
 def fetch_satellite_tile(lat, lon, zoom, tile_format):
+    # Capa compartida en memoria: pedidos simultáneos del mismo tile se descargan una sola
+    # vez y la imagen decodificada se reutiliza (no modificarla en sitio)
+    from capa_tiles import capa_compartida
+
     x, y = lat_lon_to_tile(lat, lon, zoom)
-    url = f'https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{tile_format}?apiKey={api_key}&style=satellite.day&size=512'
-    response = requests.get(url)
-    if response.status_code != 200:
+    image = capa_compartida().imagen(x, y, zoom, tile_format, api_key)
+    if image is None:
         return None, None
-    image = Image.open(BytesIO(response.content))
     return image, get_tile_bounds(x, y, zoom)
 
-def latlon_to_pixel(lat, lon, bounds):
+def latlon_to_pixel(lat, lon, bounds, tamano=(512, 512)):
+    # tamano = image.size: los tiles de una carpeta local o un MBTiles suelen ser de 256 px
     lat1, lon1, lat2, lon2 = bounds
     x_rel = (lon - lon1) / (lon2 - lon1)
     y_rel = (lat1 - lat) / (lat1 - lat2)
-    return int(x_rel * 512), int(y_rel * 512)
+    return int(x_rel * tamano[0]), int(y_rel * tamano[1])
 
 # El resto del procesamiento unificado lo incluiré en el archivo .py
 
 # === CARGA DE DATOS ===
-csv_files = sorted(glob.glob("POIs/*.csv"))[:1]
-df_pois = pd.concat([pd.read_csv(f) for f in csv_files], ignore_index=True)
+# Todos los archivos: un POI puede apuntar a un link que vive en otro archivo de calles
+csv_files = sorted(glob.glob("POIs/*.csv"))
+df_pois = cargar_pois(csv_files)
 
-geojson_calles = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))[:1]
-gdf_calles = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_calles], ignore_index=True))
+geojson_calles = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))
+gdf_calles = cargar_calles(geojson_calles)
 
-geojson_nav = sorted(glob.glob("STREETS_NAV/*.geojson"))[:1]
-gdf_nav = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_nav], ignore_index=True))
+geojson_nav = sorted(glob.glob("STREETS_NAV/*.geojson"))
+gdf_nav = cargar_calles(geojson_nav)
 
-# === MULTIDIGIT MERGE ===
+# === ÍNDICE GLOBAL DE LINKS Y MULTIDIGIT ===
+indice_calles = IndiceLinks(gdf_calles)
 if 'link_id' in gdf_nav.columns and 'MULTIDIGIT' in gdf_nav.columns:
-    gdf_calles = gdf_calles.merge(gdf_nav[['link_id', 'MULTIDIGIT']], on='link_id', how='left')
-
-# === MERGE POIs ===
-df_merge = df_pois.merge(
-    gdf_calles[['link_id', 'geometry', 'MULTIDIGIT']],
-    left_on='LINK_ID',
-    right_on='link_id',
-    how='left'
-)
+    # MULTIDIGIT normalizado una sola vez a booleano
+    multidigit_calles = IndiceLinks(gdf_nav).valores_para(indice_calles.calles['link_id'], 'MULTIDIGIT')
+    indice_calles.calles['MULTIDIGIT'] = multidigit_bool(pd.Series(multidigit_calles)).to_numpy()
+
+# === UNIÓN POIs ↔ LINKS (una sola pasada) ===
+pos_links = indice_calles.resolver(df_pois['LINK_ID'])
+resumen_sin_link = reporte_sin_link(df_pois, pos_links)
+for fila in resumen_sin_link[resumen_sin_link['sin_link'] > 0].itertuples():
+    print(f"⚠️ {fila.ARCHIVO_POI}: {fila.sin_link} de {fila.pois} POIs sin link ({fila.porcentaje}%)")
+# Igual que main_validation: los POIs sin link se reportan y no siguen a las evaluaciones
+encontrados = pos_links >= 0
+escribir_csv(df_pois.loc[~encontrados, ['POI_ID', 'POI_NAME', 'LINK_ID', 'ARCHIVO_POI']], "pois_sin_link.csv")
+df_pois = df_pois[encontrados].reset_index(drop=True)
+pos_links = pos_links[encontrados]
+lineas = indice_calles.tomar(pos_links, 'geometry')
+columnas_link = {'link_id': indice_calles.tomar(pos_links, 'link_id')}
+if 'MULTIDIGIT' in indice_calles.calles.columns:
+    columnas_link['MULTIDIGIT'] = indice_calles.tomar(pos_links, 'MULTIDIGIT')
 
 # === CENTROIDES ===
-gdf_pois = gpd.GeoDataFrame(df_merge, geometry='geometry', crs=gdf_calles.crs)
+gdf_pois = gpd.GeoDataFrame(df_pois.assign(**columnas_link), geometry=lineas, crs=gdf_calles.crs)
 gdf_pois = gdf_pois.to_crs(epsg=3857)
 gdf_pois['geometry'] = gdf_pois['geometry'].centroid
 gdf_pois = gdf_pois.to_crs(epsg=4326)
 
 # === EVALUACIÓN: NO POI IN REALITY ===
-gdf_pois['EVAL_MULTIDIGIT'] = gdf_pois['MULTIDIGIT'].apply(lambda x: 'delete' if str(x).strip().upper() in ['Y', 'YES'] else 'ok')
+gdf_pois['EVAL_MULTIDIGIT'] = np.where(gdf_pois['MULTIDIGIT'].fillna(False).astype(bool), 'delete', 'ok')
 
 # === EVALUACIÓN: INCORRECT SIDE ===
 gdf_pois['PERCFRREF_NORM'] = gdf_pois['PERCFRREF'] / 1000.0
@@ -107,27 +116,11 @@ def lado_declaro(pct):
         return 'center'
 
 gdf_pois['DECLARED_SIDE'] = gdf_pois['PERCFRREF_NORM'].apply(lado_declaro)
-gdf_pois = gdf_pois.merge(gdf_calles[['link_id', 'geometry']], on='link_id', how='left', suffixes=('', '_right'))
+# La línea del link se toma de las mismas posiciones, sin un segundo merge
+gdf_pois['geometry_right'] = gpd.GeoSeries(lineas, index=gdf_pois.index, crs=gdf_calles.crs)
 
-def calcular_lado_geometrico(poi_point, line):
-    if not isinstance(line, LineString) or not isinstance(poi_point, Point):
-        return 'unknown'
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return 'unknown'
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    dx, dy = x2 - x1, y2 - y1
-    dxp, dyp = poi_point.x - x1, poi_point.y - y1
-    cross = dx * dyp - dy * dxp
-    if cross > 0:
-        return 'L'
-    elif cross < 0:
-        return 'R'
-    else:
-        return 'center'
-
-gdf_pois['GEOMETRIC_SIDE'] = gdf_pois.apply(lambda row: calcular_lado_geometrico(row.geometry, row.geometry_right), axis=1)
+# Lado geométrico vectorizado (lados.py); en un MultiLineString se usa la parte más cercana al POI
+gdf_pois['GEOMETRIC_SIDE'] = lados_geometricos(gdf_pois.geometry.values, gdf_pois['geometry_right'].values)
 
 def evaluar_discrepancia(declared, geo):
     if declared in ['L', 'R'] and geo in ['L', 'R'] and declared != geo:
@@ -136,55 +129,37 @@ def evaluar_discrepancia(declared, geo):
         return 'ok'
 
 gdf_pois['EVAL_SIDE'] = gdf_pois.apply(lambda row: evaluar_discrepancia(row['DECLARED_SIDE'], row['GEOMETRIC_SIDE']), axis=1)
+gdf_pois = tipar_resultados(gdf_pois)
 
 # === GUARDAR RESULTADOS ===
-gdf_pois[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']].to_csv("resultado_pois.csv", index=False)
+escribir_csv(gdf_pois[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']], "resultado_pois.csv")
 
 # === EXCEPCIONES LEGÍTIMAS Y CORRECCIÓN MULTIDIGIT ===
-gdf_nav = gdf_nav[gdf_nav.geometry.type == "LineString"]
+gdf_nav = solo_lineas(gdf_nav)
 gdf_nav = gdf_nav.to_crs(epsg=3857)
 gdf_nav["EXCEPTION_LEGIT"] = "NO"
 gdf_nav["original_MULTIDIGIT"] = gdf_nav["MULTIDIGIT"].values
 
-for idx, segment in gdf_nav.iterrows():
-    geom = segment.geometry
-    link_id = segment.get("link_id")
-    if geom.length < 5:
-        continue
-    angle_segment = calculate_angle(geom)
-    if angle_segment is None:
-        continue
-    buffer = geom.buffer(25)
-    nearby = gdf_nav[
-        (gdf_nav.geometry.intersects(buffer)) &
-        (gdf_nav["link_id"] != link_id) &
-        (gdf_nav.index != idx)
-    ]
-
-    valid_neighbors = []
-    for _, neighbor in nearby.iterrows():
-        angle_neighbor = calculate_angle(neighbor.geometry)
-        if angle_neighbor is None:
-            continue
-        angle_diff = abs(angle_segment - angle_neighbor)
-        if angle_diff > 90:
-            angle_diff = 180 - angle_diff
-        overlap = geom.intersection(neighbor.geometry)
-        overlap_ratio = overlap.length / geom.length if geom.length > 0 else 0
-        centroid_distance = geom.centroid.distance(neighbor.geometry.centroid)
-        if angle_diff <= 20 and (overlap_ratio >= 0.05 or centroid_distance < 25):
-            valid_neighbors.append(neighbor)
-
-    inferred = "YES" if len(valid_neighbors) >= 1 else "NO"
-    gdf_nav.at[idx, "MULTIDIGIT"] = inferred
-    if str(segment.get("MULTIDIGIT")).strip().upper() in ["YES", "Y"] and len(valid_neighbors) >= 1 and geom.length > 10:
-        gdf_nav.at[idx, "EXCEPTION_LEGIT"] = "YES"
+# Vecinos de todos los segmentos (del grafo persistido si GRAFO_VECINOS está definido)
+pares = vecinos_persistidos(gdf_nav, geojson_nav)
+num_vecinos = contar_vecinos(pares, len(gdf_nav))
+longitudes = gdf_nav.geometry.length.to_numpy()
+consultados = longitudes >= LONGITUD_MINIMA
+
+gdf_nav.loc[consultados, "MULTIDIGIT"] = np.where(num_vecinos[consultados] >= 1, "YES", "NO")
+original = multidigit_bool(gdf_nav["original_MULTIDIGIT"]).to_numpy()
+es_excepcion = original & (num_vecinos >= 1) & (longitudes > 10)
+gdf_nav.loc[es_excepcion, "EXCEPTION_LEGIT"] = "YES"
 
 # === GUARDAR ARCHIVO FINAL CON EXCEPCIONES ===
-gdf_nav.to_file("STREETS_NAV/FINAL_SEGMENTOS.geojson", driver="GeoJSON")
+formato = formato_salida()
+if formato == "delta":
+    ruta_segmentos = escribir_delta(gdf_nav, "STREETS_NAV/FINAL_SEGMENTOS", ["MULTIDIGIT", "EXCEPTION_LEGIT"])
+else:
+    ruta_segmentos = escribir_capa(gdf_nav, "STREETS_NAV/FINAL_SEGMENTOS", formato)
 print("Validación completa. Archivos generados:")
 print("- resultado_pois.csv")
-print("- STREETS_NAV/FINAL_SEGMENTOS.geojson")
+print(f"- {ruta_segmentos}")
 
 
 # === FILTRAR POIs que fallaron TODAS las validaciones ===
@@ -194,7 +169,7 @@ gdf_invalid_all = gdf_pois[
 ]
 
 # Guardar solo los completamente inválidos
-gdf_invalid_all[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']].to_csv("pois_invalidos_completos.csv", index=False)
+escribir_csv(gdf_invalid_all[['POI_ID', 'POI_NAME', 'EVAL_MULTIDIGIT', 'EVAL_SIDE']], "pois_invalidos_completos.csv")
 
 print(f"POIs que fallaron todas las validaciones: {len(gdf_invalid_all)}")
 print("Archivo generado: pois_invalidos_completos.csv")
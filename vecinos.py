@@ -0,0 +1,288 @@
+import os
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from medicion import etapa, contar
+from orden_espacial import curva_espacial, orden_geometrias
+from partes import explotar
+
+# Módulo compartido para la detección de vecinos (calzadas paralelas) entre
+# segmentos de STREETS_NAV. Sustituye al doble ciclo iterrows que estaba copiado
+# en legitimate_exception.py, check_multiply_digitised.py, main_validation.py y validador_pois_unificado.py.
+
+# === PARÁMETROS DEL CRITERIO ===
+DISTANCIA_BUFFER = 25      # metros (EPSG:3857) alrededor del segmento consultado
+LONGITUD_MINIMA = 5        # segmentos más cortos no se consultan
+ANGULO_MAXIMO = 20         # grados de diferencia permitidos entre vecinos
+OVERLAP_MINIMO = 0.05      # proporción mínima de traslape
+DISTANCIA_CENTROIDES = 25  # metros entre centroides
+
+
+def calcular_angulos(geoms):
+    """
+    Versión vectorizada de calculate_angle: ángulo (0-180) entre el primer y el último
+    vértice de cada LineString. Devuelve NaN para geometrías con menos de dos puntos.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    n_puntos = shapely.get_num_points(geoms)
+    validas = n_puntos >= 2
+    angulos = np.full(len(geoms), np.nan)
+    if validas.any():
+        inicio = shapely.get_point(geoms[validas], 0)
+        fin = shapely.get_point(geoms[validas], -1)
+        dx = shapely.get_x(fin) - shapely.get_x(inicio)
+        dy = shapely.get_y(fin) - shapely.get_y(inicio)
+        angulos[validas] = np.degrees(np.arctan2(dy, dx)) % 180
+    return angulos
+
+
+def _consultar(geoms, arbol, codigos, consultas, distancia):
+    """
+    Pares dirigidos (i, j) para las posiciones de consulta dadas, sin ordenar.
+    codigos son los link_id factorizados; -1 (link_id nulo) nunca se considera igual.
+    """
+    buffers = shapely.buffer(geoms[consultas], distancia)
+    idx_consulta, j = arbol.query(buffers, predicate="intersects")
+    i = consultas[idx_consulta]
+    mismo_link = (codigos[i] == codigos[j]) & (codigos[i] >= 0)
+    mantener = (i != j) & ~mismo_link
+    return i[mantener], j[mantener]
+
+
+def pares_candidatos(geoms, link_ids, distancia=DISTANCIA_BUFFER, longitud_minima=LONGITUD_MINIMA, procesos=1,
+                     consultas=None, curva=None):
+    """
+    Devuelve los pares dirigidos (i, j), en posiciones, donde i es un segmento consultado
+    (longitud >= longitud_minima) y j intersecta el buffer de i con un link_id distinto.
+    Los pares salen ordenados por (i, j), igual que el recorrido original.
+    Con procesos > 1 la búsqueda se reparte entre procesos con memoria compartida.
+    consultas (máscara booleana opcional) restringe qué segmentos se consultan; los
+    vecinos se siguen buscando en toda la capa.
+    Con curva ('hilbert' o 'morton') las consultas se lanzan en orden espacial (y en
+    paralelo cada proceso recibe un tramo contiguo de la curva); el resultado es el mismo.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    codigos, _ = pd.factorize(pd.Series(link_ids))
+    codigos = codigos.astype(np.int64)
+
+    if procesos > 1 and len(geoms) > 0:
+        i, j = _pares_en_paralelo(geoms, codigos, distancia, longitud_minima, procesos, consultas, curva)
+    else:
+        mascara = shapely.length(geoms) >= longitud_minima
+        if consultas is not None:
+            mascara &= np.asarray(consultas, dtype=bool)
+        consultas = np.flatnonzero(mascara)
+        if len(consultas) == 0:
+            vacio = np.empty(0, dtype=np.int64)
+            return vacio, vacio.copy()
+        if curva is not None:
+            consultas = consultas[orden_geometrias(geoms[consultas], curva)]
+        i, j = _consultar(geoms, shapely.STRtree(geoms), codigos, consultas, distancia)
+
+    orden = np.lexsort((j, i))
+    return i[orden].astype(np.int64), j[orden].astype(np.int64)
+
+
+# === MODO PARALELO CON MEMORIA COMPARTIDA ===
+# El proceso principal copia una sola vez las coordenadas planas, los offsets, los link_id
+# factorizados, la máscara de consultas y el orden de recorrido a bloques de
+# multiprocessing.shared_memory. Cada trabajador reconstruye las LineStrings directamente
+# desde esos buffers (sin pickle de GeoDataFrames), arma su propio STRtree y devuelve
+# arreglos int32 de pares para su rebanada de segmentos consultados.
+
+_TRABAJADOR = {}
+
+
+def procesos_vecinos():
+    """
+    Número de procesos para la búsqueda de vecinos, leído de PROCESOS_VECINOS (por defecto 1).
+    """
+    return max(1, int(os.getenv("PROCESOS_VECINOS", "1")))
+
+
+def _a_memoria_compartida(arreglo):
+    bloque = shared_memory.SharedMemory(create=True, size=max(arreglo.nbytes, 1))
+    vista = np.ndarray(arreglo.shape, dtype=arreglo.dtype, buffer=bloque.buf)
+    vista[...] = arreglo
+    return bloque, (bloque.name, arreglo.shape, arreglo.dtype.str)
+
+
+def _iniciar_trabajador(descriptores, tipo_geom, distancia, longitud_minima):
+    bloques, vistas = [], []
+    for nombre, forma, dtype in descriptores:
+        bloque = shared_memory.SharedMemory(name=nombre)
+        bloques.append(bloque)
+        vistas.append(np.ndarray(forma, dtype=dtype, buffer=bloque.buf))
+    coords, offsets, codigos, mascara, orden = vistas
+    geoms = shapely.from_ragged_array(tipo_geom, coords, (offsets,))
+    _TRABAJADOR.update(
+        bloques=bloques,
+        geoms=geoms,
+        arbol=shapely.STRtree(geoms),
+        codigos=codigos,
+        mascara=mascara.astype(bool),
+        orden=orden,
+        distancia=distancia,
+        longitud_minima=longitud_minima,
+    )
+
+
+def _pares_de_rebanada(rango):
+    inicio, fin = rango
+    geoms = _TRABAJADOR["geoms"]
+    posiciones = _TRABAJADOR["orden"][inicio:fin]
+    mascara = (shapely.length(geoms[posiciones]) >= _TRABAJADOR["longitud_minima"]) & _TRABAJADOR["mascara"][posiciones]
+    consultas = posiciones[mascara]
+    if len(consultas) == 0:
+        vacio = np.empty(0, dtype=np.int32)
+        return vacio, vacio.copy()
+    i, j = _consultar(geoms, _TRABAJADOR["arbol"], _TRABAJADOR["codigos"], consultas, _TRABAJADOR["distancia"])
+    return i.astype(np.int32), j.astype(np.int32)
+
+
+def _pares_en_paralelo(geoms, codigos, distancia, longitud_minima, procesos, consultas=None, curva=None):
+    tipo_geom, coords, (offsets,) = shapely.to_ragged_array(geoms)
+    if tipo_geom != shapely.GeometryType.LINESTRING:
+        raise ValueError("El modo paralelo solo acepta capas de LineString")
+    if consultas is None:
+        mascara = np.ones(len(geoms), dtype=np.uint8)
+    else:
+        mascara = np.asarray(consultas, dtype=np.uint8)
+    # Cada rebanada es un tramo de la curva espacial (o de filas seguidas, sin curva)
+    orden = orden_geometrias(geoms, curva) if curva is not None else np.arange(len(geoms), dtype=np.int64)
+
+    bloques, descriptores = [], []
+    try:
+        for arreglo in (np.ascontiguousarray(coords), offsets.astype(np.int64), codigos, mascara, orden.astype(np.int64)):
+            bloque, desc = _a_memoria_compartida(arreglo)
+            bloques.append(bloque)
+            descriptores.append(desc)
+
+        n = len(geoms)
+        limites = np.linspace(0, n, min(n, procesos * 4) + 1).astype(int)
+        rangos = [(a, b) for a, b in zip(limites[:-1], limites[1:]) if b > a]
+
+        contexto = get_context()
+        with contexto.Pool(
+            procesos,
+            initializer=_iniciar_trabajador,
+            initargs=(descriptores, tipo_geom, distancia, longitud_minima),
+        ) as pool:
+            resultados = pool.map(_pares_de_rebanada, rangos)
+    finally:
+        for bloque in bloques:
+            bloque.close()
+            bloque.unlink()
+
+    i = np.concatenate([r[0] for r in resultados]).astype(np.int64)
+    j = np.concatenate([r[1] for r in resultados]).astype(np.int64)
+    return i, j
+
+
+def metricas_pares(geoms, i, j):
+    """
+    Calcula angle_diff, overlap_ratio y centroid_distance para los pares dirigidos (i, j).
+    La intersección y la distancia entre centroides son simétricas, así que se evalúan
+    una sola vez por par no ordenado y ambos sentidos derivan su overlap_ratio de la
+    longitud guardada.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    longitudes = shapely.length(geoms)
+    angulos = calcular_angulos(geoms)
+    centroides = shapely.centroid(geoms)
+
+    angle_diff = np.abs(angulos[i] - angulos[j])
+    angle_diff = np.where(angle_diff > 90, 180 - angle_diff, angle_diff)
+
+    # Clave única por par no ordenado (a < b)
+    n = len(geoms)
+    a = np.minimum(i, j)
+    b = np.maximum(i, j)
+    claves, inversa = np.unique(a * n + b, return_inverse=True)
+    ua, ub = claves // n, claves % n
+    contar("evaluaciones_predicado", len(claves))
+
+    longitud_overlap = shapely.length(shapely.intersection(geoms[ua], geoms[ub]))
+    distancia = shapely.distance(centroides[ua], centroides[ub])
+
+    longitud_i = longitudes[i]
+    overlap_ratio = np.divide(
+        longitud_overlap[inversa], longitud_i,
+        out=np.zeros(len(i)), where=longitud_i > 0
+    )
+    return angle_diff, overlap_ratio, distancia[inversa]
+
+
+def marcar_validos(pares):
+    """
+    Agrega la columna 'valido' con el criterio de calzada paralela sobre las métricas del par.
+    """
+    pares["valido"] = (pares["angle_diff"] <= ANGULO_MAXIMO) & (
+        (pares["overlap_ratio"] >= OVERLAP_MINIMO) |
+        (pares["centroid_distance"] < DISTANCIA_CENTROIDES)
+    )
+    return pares
+
+
+def agregar_por_link(pares, link_de_parte):
+    """
+    Pasa pares dirigidos entre partes a pares entre links (posiciones de fila). Por cada par
+    de links queda el par de partes más favorable: uno válido si lo hay y, entre ellos, el de
+    menor angle_diff; así marcar_validos da el mismo veredicto sobre la fila agregada.
+    """
+    i = link_de_parte[pares["i"].to_numpy()]
+    j = link_de_parte[pares["j"].to_numpy()]
+    distintos = i != j
+    pares = pares[distintos].assign(i=i[distintos], j=j[distintos])
+    orden = np.lexsort((pares["angle_diff"].to_numpy(), ~pares["valido"].to_numpy(),
+                        pares["j"].to_numpy(), pares["i"].to_numpy()))
+    pares = pares.iloc[orden]
+    return pares[~pares.duplicated(["i", "j"])].reset_index(drop=True)
+
+
+def detectar_vecinos(gdf, procesos=None, consultas=None):
+    """
+    Evalúa el criterio de calzada paralela sobre un GeoDataFrame proyectado (EPSG:3857).
+    Devuelve un DataFrame de pares dirigidos con las posiciones i, j, sus métricas y
+    la columna 'valido'. Los pares cuyo vecino no tiene ángulo se descartan.
+    Los MultiLineString se explotan en partes: la búsqueda y las métricas corren sobre las
+    partes y los pares se agregan por link con agregar_por_link. Un link se consulta si su
+    longitud total llega a LONGITUD_MINIMA.
+    Si no se indica procesos, se usa PROCESOS_VECINOS del entorno; el orden de las
+    consultas sigue ORDEN_ESPACIAL.
+    """
+    if procesos is None:
+        procesos = procesos_vecinos()
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    partes, link_de_parte = explotar(geoms)
+    consultar = shapely.length(geoms) >= LONGITUD_MINIMA
+    if consultas is not None:
+        consultar &= np.asarray(consultas, dtype=bool)
+    with etapa("pares_candidatos"):
+        i, j = pares_candidatos(partes, gdf["link_id"].to_numpy()[link_de_parte], longitud_minima=0,
+                                procesos=procesos, consultas=consultar[link_de_parte], curva=curva_espacial())
+    contar("pares_candidatos", len(i))
+    with etapa("metricas_pares"):
+        angle_diff, overlap_ratio, centroid_distance = metricas_pares(partes, i, j)
+
+    pares = pd.DataFrame({
+        "i": i,
+        "j": j,
+        "angle_diff": angle_diff,
+        "overlap_ratio": overlap_ratio,
+        "centroid_distance": centroid_distance,
+    })
+    pares = pares[pares["angle_diff"].notna()].reset_index(drop=True)
+    pares = agregar_por_link(marcar_validos(pares), link_de_parte)
+    contar("pares_validos", int(pares["valido"].sum()))
+    return pares
+
+
+def contar_vecinos(pares, n):
+    """
+    Número de vecinos válidos por segmento (en posiciones 0..n-1).
+    """
+    return np.bincount(pares.loc[pares["valido"], "i"].to_numpy(), minlength=n)
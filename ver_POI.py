@@ -1,11 +1,10 @@
-import requests
 import math
+import pandas as pd
 import geopandas as gpd
-from PIL import Image
-from io import BytesIO
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 import os
+from capa_tiles import capa_compartida
 
 # === CARGAR VARIABLES DE ENTORNO ===
 load_dotenv()
@@ -38,14 +37,12 @@ def get_tile_bounds(x, y, zoom):
 
 def get_satellite_tile_with_overlay(lat, lon, zoom, tile_format, api_key):
     x, y = lat_lon_to_tile(lat, lon, zoom)
-    url = f'https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{tile_format}?apiKey={api_key}&style=satellite.day&size=512'
-
-    response = requests.get(url)
-    if response.status_code != 200:
-        print("Failed to fetch tile:", response.status_code)
+    # Tile de la fuente configurada (FUENTE_TILES: HERE, carpeta local o MBTiles)
+    image = capa_compartida().imagen(x, y, zoom, tile_format, api_key)
+    if image is None:
+        print("Failed to fetch tile")
         return None
 
-    image = Image.open(BytesIO(response.content))
     lat1, lon1, lat2, lon2 = get_tile_bounds(x, y, zoom)
 
     fig, ax = plt.subplots(figsize=(6, 6))
@@ -54,8 +51,9 @@ def get_satellite_tile_with_overlay(lat, lon, zoom, tile_format, api_key):
     def latlon_to_pixel(lat, lon):
         x_rel = (lon - lon1) / (lon2 - lon1)
         y_rel = (lat1 - lat) / (lat1 - lat2)
-        px = int(x_rel * 512)
-        py = int(y_rel * 512)
+        # Tamaño real del tile (HERE: 512 px; carpeta local o MBTiles: normalmente 256)
+        px = int(x_rel * image.width)
+        py = int(y_rel * image.height)
         return px, py
 
     px, py = latlon_to_pixel(lat, lon)
@@ -73,6 +71,15 @@ def get_satellite_tile_with_overlay(lat, lon, zoom, tile_format, api_key):
 gdf = gpd.read_file("output_POIs.geojson")
 points = gdf[gdf.geometry.type == "Point"]
 
+# Si ya corrió el triage automático (python edificios.py), solo se revisan los POIs ambiguos
+if os.path.exists("triage_edificios.csv"):
+    triage = pd.read_csv("triage_edificios.csv")
+    ambiguos = triage.loc[triage["veredicto"].isin(["revisar", "sin_tile"]), "indice"]
+    print(f"POIs ambiguos según el triage: {len(ambiguos)} de {len(points)}")
+    points = points.iloc[ambiguos.to_numpy()]
+    if points.empty:
+        raise SystemExit("No hay POIs ambiguos que revisar.")
+
 # Solo el primero por ahora
 first = points.iloc[0]
 latitude = first.geometry.y
@@ -1,33 +1,37 @@
 import pandas as pd
 import geopandas as gpd
 import glob
-from shapely.geometry import LineString, Point
 import os
-import requests
-from PIL import Image
-from io import BytesIO
-import math
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
+from pipeline_revision import ejecutar_revision, renderizar_snapshot
+from tiles import lat_lon_to_tile, get_tile_bounds
+from capa_tiles import capa_compartida
+from snapshots import seleccionar
+from indice_links import IndiceLinks, cargar_pois, cargar_calles, reporte_sin_link
+from duplicados_pois import distancia_duplicados, colapsar_duplicados
+from reasociacion import reasociar_relink
+from lados import lados_geometricos
+from puntos_control import puntos_control_desde_entorno
 
-# Cargar POIs
-csv_files = sorted(glob.glob("POIs/*.csv"))[:1]
-df_pois = pd.concat([pd.read_csv(f) for f in csv_files], ignore_index=True)
+load_dotenv()
+
+# Cargar POIs y calles de todos los archivos (un POI puede apuntar a un link de otro archivo)
+csv_files = sorted(glob.glob("POIs/*.csv"))
+df_pois = cargar_pois(csv_files)
 
-# Cargar calles
-geojson_files = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))[:1]
-gdf_calles = gpd.GeoDataFrame(pd.concat([gpd.read_file(f) for f in geojson_files], ignore_index=True))
+geojson_files = sorted(glob.glob("STREETS_NAMING_ADDRESSING/*.geojson"))
+gdf_calles = cargar_calles(geojson_files)
 
-# Merge POIs con geometría de calles
-df_merge = df_pois.merge(
-    gdf_calles[['link_id', 'geometry']],
-    left_on='LINK_ID',
-    right_on='link_id',
-    how='left'
-)
+# Unión POIs con geometría de calles por índice hash de link_id
+indice_calles = IndiceLinks(gdf_calles)
+pos_links = indice_calles.resolver(df_pois['LINK_ID'])
+resumen_sin_link = reporte_sin_link(df_pois, pos_links)
+for fila in resumen_sin_link[resumen_sin_link['sin_link'] > 0].itertuples():
+    print(f"{fila.ARCHIVO_POI}: {fila.sin_link} de {fila.pois} POIs sin link ({fila.porcentaje}%)")
+lineas = indice_calles.tomar(pos_links, 'geometry')
 
 # Convertimos a GeoDataFrame
-gdf_pois = gpd.GeoDataFrame(df_merge, geometry='geometry', crs=gdf_calles.crs)
+gdf_pois = gpd.GeoDataFrame(df_pois.assign(link_id=indice_calles.tomar(pos_links, 'link_id')), geometry=lineas, crs=gdf_calles.crs)
 gdf_pois = gdf_pois.to_crs(epsg=3857)
 gdf_pois['geometry'] = gdf_pois['geometry'].centroid
 gdf_pois = gdf_pois.to_crs(epsg=4326)
@@ -48,37 +52,17 @@ def lado_declaro(pct):
 gdf_pois['DECLARED_SIDE'] = gdf_pois['PERCFRREF_NORM'].apply(lado_declaro)
 
 # Recuperamos geometría original de calle para cada POI
-gdf_pois = gdf_pois.merge(gdf_calles[['link_id', 'geometry']], on='link_id', how='left', suffixes=('', '_right'))
-
-# Funcíón para determinar lado geométrico
-def calcular_lado_geometrico(poi_point, line):
-    if not isinstance(line, LineString) or not isinstance(poi_point, Point):
-        return 'unknown'
-
-    coords = list(line.coords)
-    if len(coords) < 2:
-        return 'unknown'
-
-    # Vector de calle (inicio → fin)
-    x1, y1 = coords[0]
-    x2, y2 = coords[-1]
-    dx, dy = x2 - x1, y2 - y1
-
-    # Vector de calle → POI
-    dxp, dyp = poi_point.x - x1, poi_point.y - y1
-
-    # Producto cruzado
-    cross = dx * dyp - dy * dxp
+gdf_pois['geometry_right'] = gpd.GeoSeries(lineas, index=gdf_pois.index, crs=gdf_calles.crs)
 
-    if cross > 0:
-        return 'L'
-    elif cross < 0:
-        return 'R'
-    else:
-        return 'center'
+# POIs duplicados (mismo nombre normalizado a menos de DUPLICADOS_POIS metros): se evalúa
+# y se fotografía uno solo
+distancia = distancia_duplicados()
+if distancia:
+    gdf_pois, n_duplicados = colapsar_duplicados(gdf_pois, distancia)
+    print(f"POIs duplicados descartados: {n_duplicados} (detalle en pois_duplicados.csv)")
 
-# Aplicar a cada fila
-gdf_pois['GEOMETRIC_SIDE'] = gdf_pois.apply(lambda row: calcular_lado_geometrico(row.geometry, row.geometry_right), axis=1)
+# Lado geométrico vectorizado (lados.py); en un MultiLineString se usa la parte más cercana al POI
+gdf_pois['GEOMETRIC_SIDE'] = lados_geometricos(gdf_pois.geometry.values, gdf_pois['geometry_right'].values)
 
 # Clasificar como relink si el lado declarado no coincide con el geométrico
 def evaluar_discrepancia(declared, geo):
@@ -93,95 +77,65 @@ gdf_pois['LOCATION_STATUS'] = gdf_pois.apply(lambda row: evaluar_discrepancia(ro
 gdf_pois[['POI_ID', 'DECLARED_SIDE', 'GEOMETRIC_SIDE', 'LOCATION_STATUS']].to_csv("POIs_side_evaluation.csv", index=False)
 print("Evaluación de lado completada y guardada en 'POIs_side_evaluation.csv'")
 
+# Links candidatos (top-k por lado y distancia) y LINK_ID / PERCFRREF sugeridos para todos
+# los POIs con relink en una sola pasada sobre el índice espacial de calles
+relink = gdf_pois[gdf_pois['LOCATION_STATUS'] == 'relink']
+if not relink.empty:
+    sugeridas = reasociar_relink(relink, gdf_calles)
+    print(f"Sugerencias: {(sugeridas['MOTIVO'] == 'otro_link').sum()} a otro link, "
+          f"{(sugeridas['MOTIVO'] == 'invertir_lado').sum()} invirtiendo el lado "
+          "(relink_candidatos.csv, relink_sugerencias.csv)")
+
 relink_poi = gdf_pois[gdf_pois['LOCATION_STATUS'] == 'relink'].iloc[0]
 lat = relink_poi.geometry.y
 lon = relink_poi.geometry.x
 
-# Construir la URL de imagen satelital
-load_dotenv()
+# Tile satelital z19 del POI desde la fuente configurada (FUENTE_TILES), con el POI marcado
 api_key = os.getenv("HERE_API_KEY")
-url = f"https://image.maps.ls.hereapi.com/mia/1.6/mapview?apiKey={api_key}&c={lat},{lon}&z=19&w=600&h=600&t=satellite.day"
-
-# Descargar y mostrar imagen
-response = requests.get(url)
-if response.status_code == 200:
-    image = Image.open(BytesIO(response.content))
-    image.show() 
-    image.save("primer_poi_relink.jpg")
+x, y = lat_lon_to_tile(lat, lon, 19)
+imagen = capa_compartida().imagen(x, y, 19, "png", api_key)
+if imagen is not None:
+    imagen.show()
+    renderizar_snapshot(imagen, get_tile_bounds(x, y, 19), {
+        "lat": lat,
+        "lon": lon,
+        "titulo": f"POI {relink_poi['POI_ID']} | relink",
+        "ruta": "primer_poi_relink.jpg",
+    })
     print(f"Imagen satelital del POI {relink_poi['POI_ID']} guardada como 'primer_poi_relink.jpg'")
 
-def lat_lon_to_tile(lat, lon, zoom):
-    """
-    Convierte una latitud y longitud a coordenadas de tile (x, y) para un nivel de zoom dado.
-    Esto permite identificar en qué tile se encuentra un punto.
-    """
-    lat_rad = math.radians(lat)
-    lon_rad = math.radians(lon)
-    n = 2.0 ** zoom
-    x = int((lon + 180.0) / 360.0 * n)
-    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
-    return x, y
-
-def tile_coords_to_bounds(x, y, zoom):
-    """
-    Calcula los límites geográficos (latitud y longitud) de un tile dado por sus coordenadas (x, y) y nivel de zoom.
-    Devuelve (lat1, lon1, lat2, lon2) donde (lat1, lon1) es la esquina superior izquierda y (lat2, lon2) la inferior derecha.
-    """
-    n = 2.0 ** zoom
-    lon1 = x / n * 360.0 - 180.0
-    lon2 = (x + 1) / n * 360.0 - 180.0
-    lat1 = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
-    lat2 = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
-    return lat1, lon1, lat2, lon2
-
-def lat_lon_to_pixel(lat, lon, bounds, tile_size=512):
-    """
-    Convierte una latitud y longitud a coordenadas de píxel (x, y) dentro de un tile de tamaño tile_size,
-    usando los límites geográficos del tile.
-    """
-    lat1, lon1, lat2, lon2 = bounds
-    x = int(((lon - lon1) / (lon2 - lon1)) * tile_size)
-    y = int(((lat1 - lat) / (lat1 - lat2)) * tile_size)
-    return x, y
-
-# === Obtener primer POI con relink ===
-relink_pois = gdf_pois[gdf_pois['LOCATION_STATUS'] == 'relink']
+# === SNAPSHOTS PRIORIZADOS DE POIs CON RELINK ===
 """
-Esta sección busca el primer POI cuya ubicación declarada (lado de la calle) no coincide con el lado geométrico calculado,
-es decir, aquellos marcados como 'relink'. Luego descarga el tile satelital correspondiente usando la API de HERE,
-calcula la posición del POI dentro de la imagen y genera una visualización donde el POI se marca con un punto rojo.
-Esto permite revisar visualmente los casos donde hay discrepancia entre el lado declarado y el lado real según la geometría.
+En lugar de revisar solo el primer POI con relink, se puntúan todos según la longitud del link
+y la cantidad de POIs sobre el mismo link, y se descargan
+únicamente los mejor puntuados dentro del presupuesto de tiles (PRESUPUESTO_SNAPSHOTS).
+Cada imagen marca el POI con un punto rojo para revisar visualmente la discrepancia de lado.
 """
+relink_pois = gdf_pois[gdf_pois['LOCATION_STATUS'] == 'relink']
 if not relink_pois.empty:
-    first = relink_pois.iloc[0]
-    lat = first.geometry.y
-    lon = first.geometry.x
-
-    zoom = 18
-    tile_size = 512
-    tile_format = 'png'
-
-    # HERE API (Tiles)
-    x, y = lat_lon_to_tile(lat, lon, zoom)
-    tile_url = f"https://maps.hereapi.com/v3/base/mc/{zoom}/{x}/{y}/{tile_format}?apiKey={api_key}&style=satellite.day&size={tile_size}"
-
-    response = requests.get(tile_url)
-    if response.status_code == 200:
-        img = Image.open(BytesIO(response.content))
-        bounds = tile_coords_to_bounds(x, y, zoom)
-        px, py = lat_lon_to_pixel(lat, lon, bounds, tile_size)
-
-        # Mostrar con matplotlib y punto rojo
-        plt.imshow(img)
-        plt.plot(px, py, 'ro', markersize=8)
-        plt.title(f"POI_ID: {first['POI_ID']} - relink")
-        plt.axis('off')
-        plt.tight_layout()
-        plt.savefig("primer_poi_relink_marcado.png")
-        plt.show()
-
-        print("Imagen satelital descargada y punto marcado correctamente.")
-    else:
-        print("Error al descargar tile:", response.status_code)
+    os.makedirs("imagenes_relink", exist_ok=True)
+
+    calles_proj = gpd.GeoSeries(relink_pois['geometry_right'], crs=gdf_calles.crs).to_crs(epsg=3857)
+    pois_por_link = gdf_pois['link_id'].value_counts()
+
+    marcados = pd.DataFrame({
+        "longitud": calles_proj.length.to_numpy(),
+        "densidad_pois": relink_pois['link_id'].map(pois_por_link).to_numpy(),
+        "lat": relink_pois.geometry.y.to_numpy(),
+        "lon": relink_pois.geometry.x.to_numpy(),
+        "titulo": [f"POI_ID: {poi_id} - relink" for poi_id in relink_pois['POI_ID']],
+        "ruta": [f"imagenes_relink/poi_{poi_id}.png" for poi_id in relink_pois['POI_ID']],
+    })
+    elegidos = seleccionar(marcados)
+    print(f"Snapshots priorizados: {len(elegidos)} de {len(marcados)} POIs con relink")
+
+    puntos_control = puntos_control_desde_entorno("side", csv_files + geojson_files, {
+        "PRESUPUESTO_SNAPSHOTS": os.getenv("PRESUPUESTO_SNAPSHOTS"),
+        "DUPLICADOS_POIS": os.getenv("DUPLICADOS_POIS"),
+        "ORDEN_ESPACIAL": os.getenv("ORDEN_ESPACIAL"),
+    })
+    imagenes = ejecutar_revision(elegidos.to_dict("records"), api_key, puntos_control=puntos_control,
+                                 zoom=18, tile_format='png')
+    print(f"Imágenes satelitales con el punto marcado guardadas en imagenes_relink/: {len(imagenes)}")
 else:
-    print("No hay POIs con LOCATION_STATUS = 'relink'")
\ No newline at end of file
+    print("No hay POIs con LOCATION_STATUS = 'relink'")